@@ -0,0 +1,154 @@
+"""
+A local stand-in for 'OpenAIApiClient', for benchmarking the report without network access or cost.
+
+Every response is derived from a hash of the prompt and follows the requested JSON schema,
+so the same prompt always gets the same answer.
+Each request sleeps for 'latency_s' first, like a remote model would.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import TypeVar
+
+from expert_llm.models import ChatBlock, LlmChatClient
+from pydantic import BaseModel
+
+
+T = TypeVar("T", bound=BaseModel)
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 64
+DEFAULT_ARRAY_LEN = 5
+WORDS = (
+    "graph parser cache request handler index config worker client schema "
+    "token stream report module service storage query layout builder loader"
+).split()
+# numbered candidates in a prompt, like '12. FUNCTION module.py::fn'
+NUMBERED_ITEM_RE = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+
+class _Rng:
+    """
+    A deterministic stream of numbers, seeded by the text of a request.
+    """
+
+    def __init__(self, seed: str) -> None:
+        self.state = hashlib.sha256(seed.encode("utf-8")).digest()
+        return
+
+    def next_int(self, n: int) -> int:
+        self.state = hashlib.sha256(self.state).digest()
+        return int.from_bytes(self.state[:8], "little") % max(1, n)
+
+    def choose(self, items: list):
+        return items[self.next_int(len(items))]
+
+    def sample(self, items: list, k: int) -> list:
+        remaining = list(items)
+        chosen = []
+        while remaining and len(chosen) < k:
+            chosen.append(remaining.pop(self.next_int(len(remaining))))
+            pass
+        return chosen
+
+    pass
+
+
+class FakeLlmClient(LlmChatClient):
+    def __init__(
+        self,
+        *,
+        latency_s: float = 0.0,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+    ) -> None:
+        self.latency_s = latency_s
+        self.max_concurrent_requests = max_concurrent_requests
+        self._lock = threading.Lock()
+        self.num_requests = 0
+        self.prompt_chars = 0
+        return
+
+    def get_max_concurrent_requests(self) -> int:
+        return self.max_concurrent_requests
+
+    def chat_completion(
+        self,
+        chat_blocks: list[ChatBlock],
+        **kwargs,
+    ) -> ChatBlock:
+        rng = self._start_request(chat_blocks)
+        return ChatBlock(role="assistant", content=self._make_text(rng, n_words=40))
+
+    def structured_completion(
+        self,
+        chat_blocks: list[ChatBlock],
+        output_model: type[T],
+        **kwargs,
+    ) -> T:
+        return output_model.model_validate(
+            self.structured_completion_raw(
+                chat_blocks=chat_blocks,
+                output_schema=output_model.model_json_schema(),
+            )
+        )
+
+    def structured_completion_raw(
+        self,
+        *,
+        chat_blocks: list[ChatBlock],
+        output_schema: dict,
+        output_schema_name: str | None = None,
+        **kwargs,
+    ) -> dict:
+        rng = self._start_request(chat_blocks, output_schema)
+        # the largest number in a numbered list, for answers that pick items by index
+        max_index = max(
+            [
+                int(i)
+                for block in chat_blocks
+                for i in NUMBERED_ITEM_RE.findall(block.content)
+            ]
+            or [1]
+        )
+        return self._make_value(rng, output_schema, max_index=max_index)
+
+    def _start_request(self, chat_blocks: list[ChatBlock], *extra) -> _Rng:
+        prompt = "\n".join(block.content for block in chat_blocks)
+        with self._lock:
+            self.num_requests += 1
+            self.prompt_chars += len(prompt)
+            pass
+        if self.latency_s > 0:
+            time.sleep(self.latency_s)
+            pass
+        return _Rng(prompt + json.dumps(extra, sort_keys=True))
+
+    def _make_text(self, rng: _Rng, *, n_words: int) -> str:
+        return " ".join(rng.choose(WORDS) for _ in range(n_words)).capitalize()
+
+    def _make_value(self, rng: _Rng, schema: dict, *, max_index: int):
+        if "enum" in schema:
+            return rng.choose(schema["enum"])
+        kind = schema.get("type")
+        if kind == "object":
+            return {
+                name: self._make_value(rng, prop, max_index=max_index)
+                for name, prop in schema.get("properties", {}).items()
+            }
+        if kind == "array":
+            items = schema.get("items", {})
+            if "enum" in items:
+                return rng.sample(items["enum"], DEFAULT_ARRAY_LEN)
+            return [
+                self._make_value(rng, items, max_index=max_index)
+                for _ in range(DEFAULT_ARRAY_LEN)
+            ]
+        if kind in ("number", "integer"):
+            return 1 + rng.next_int(max_index)
+        if kind == "boolean":
+            return bool(rng.next_int(2))
+        return self._make_text(rng, n_words=12)
+
+    pass
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the 'crushmycode' CLI.
+
+Runs every command under 'python -X importtime', against a cache path that does not exist,
+so each run stops right after the command has imported what it needs.
+The total import time of each command is compared against its budget, and the script
+exits non-zero if any command is over budget.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat 5 --top 10
+"""
+
+import argparse
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+from typing import NamedTuple
+
+
+REPO_ROOT = Path(__file__).absolute().parent.parent
+ENTRY_POINT = REPO_ROOT / "bin" / "crushmycode"
+MISSING_PATH = "/nonexistent/kgcache_benchmark"
+
+
+class Scenario(NamedTuple):
+    name: str
+    args: list[str]
+    # total import time, in milliseconds
+    budget_ms: float
+    pass
+
+
+SCENARIOS = [
+    Scenario(name="--help", args=["--help"], budget_ms=400),
+    Scenario(name="show-graph", args=["show-graph", MISSING_PATH], budget_ms=800),
+    Scenario(name="search", args=["search", MISSING_PATH, "query"], budget_ms=800),
+    Scenario(name="serve", args=["serve", MISSING_PATH], budget_ms=800),
+    Scenario(name="diff", args=["diff", MISSING_PATH, MISSING_PATH], budget_ms=800),
+    Scenario(name="export", args=["export", MISSING_PATH, MISSING_PATH], budget_ms=800),
+    Scenario(name="report", args=["report", MISSING_PATH], budget_ms=1200),
+    # the build needs all of minikg's pipeline
+    Scenario(
+        name="build",
+        args=["build", "--manifest", f"{MISSING_PATH}.json"],
+        budget_ms=4000,
+    ),
+]
+
+
+class ImportTimes(NamedTuple):
+    total_ms: float
+    # (cumulative milliseconds, module) of the top-level imports
+    top_level: list[tuple[float, str]]
+    pass
+
+
+def parse_import_times(stderr: str) -> ImportTimes:
+    """
+    Sums the cumulative times of the top-level imports in '-X importtime' output.
+    """
+    top_level: list[tuple[float, str]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            # nested, or the header
+            continue
+        top_level.append((int(cumulative) / 1000, name.strip()))
+        pass
+    return ImportTimes(
+        total_ms=sum(ms for ms, _ in top_level),
+        top_level=sorted(top_level, reverse=True),
+    )
+
+
+def measure(scenario: Scenario) -> ImportTimes:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            [str(REPO_ROOT), *filter(None, [os.environ.get("PYTHONPATH")])]
+        ),
+    }
+    # not used, but some clients want a key at import
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    with tempfile.TemporaryDirectory() as cwd:
+        res = subprocess.run(
+            [sys.executable, "-X", "importtime", str(ENTRY_POINT), *scenario.args],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        pass
+    return parse_import_times(res.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per command; the fastest counts",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="also list the slowest top-level imports of each command",
+    )
+    parser.add_argument("scenarios", nargs="*", help="only run these commands")
+    args = parser.parse_args()
+
+    n_over_budget = 0
+    print(f"{'command':<12} {'imports (ms)':>12} {'budget (ms)':>12}")
+    for scenario in SCENARIOS:
+        if args.scenarios and scenario.name not in args.scenarios:
+            continue
+        times = min(
+            (measure(scenario) for _ in range(max(1, args.repeat))),
+            key=lambda t: t.total_ms,
+        )
+        is_over = times.total_ms > scenario.budget_ms
+        n_over_budget += is_over
+        print(
+            f"{scenario.name:<12} {times.total_ms:>12.0f} {scenario.budget_ms:>12.0f}"
+            + ("  OVER BUDGET" if is_over else "")
+        )
+        for ms, module in times.top_level[: args.top]:
+            print(f"{'':<12} {ms:>12.0f}   {module}")
+            pass
+        pass
+    sys.exit(1 if n_over_budget else 0)
+    return
+
+
+if __name__ == "__main__":
+    main()
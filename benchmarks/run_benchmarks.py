@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Benchmarks loading, 'show-graph' and 'report' on synthetic knowledge graphs.
+
+Fixtures are generated by 'synthetic_kg.py' into '--fixtures-dir' the first time they are needed,
+and reused afterwards.  The report runs against 'fake_llm.FakeLlmClient', which answers locally
+after '--latency-ms'.
+Every run of a case is a fresh process, which reports its wall time and the peak of the memory
+it allocated (per 'tracemalloc', which numpy reports its arrays to as well).
+Results are written as JSON, with the commit they were measured at; pass an earlier results file
+as '--baseline' to compare against it.
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --output results.json
+    python benchmarks/run_benchmarks.py --cases report --latency-ms 200 --baseline results.json
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+# puts the working tree on 'sys.path', as the child processes get it on 'PYTHONPATH'
+from synthetic_kg import (
+    FIXTURE_SIZES,
+    HIERARCHY_SHAPES,
+    REPO_ROOT,
+    FixtureSpec,
+    get_fixture_name,
+    write_fixture,
+)
+
+
+BENCHMARKS_DIR = Path(__file__).absolute().parent
+RESULTS_FORMAT_VERSION = 1
+DEFAULT_REPORT_CONCURRENCY = 4
+# a result is flagged when it is slower than the baseline by both this ratio and this many seconds
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_S = 0.05
+
+
+def _get_peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _load_snapshot(cache_dir: str):
+    from crushmycode.hierarchy import CommunityHierarchyIndex
+    from crushmycode.snapshot import KgSnapshot
+
+    snapshot = KgSnapshot.load_or_build(cache_dir=cache_dir)
+    hierarchy = CommunityHierarchyIndex.load_or_build(
+        cache_dir=cache_dir,
+        communities=snapshot.communities,
+        root_ids=snapshot.community_hierarchy[0],
+    )
+    return snapshot, hierarchy
+
+
+def setup_load_package(cache_dir: str, args: argparse.Namespace) -> Callable[[], dict]:
+    from crushmycode.snapshot import load_package
+
+    def run() -> dict:
+        pkg = load_package(cache_dir)
+        return {"n_nodes": pkg.G.number_of_nodes()}
+
+    return run
+
+
+def setup_build_snapshot(cache_dir: str, args: argparse.Namespace) -> Callable[[], dict]:
+    from crushmycode.snapshot import SNAPSHOT_FILE_NAME, KgSnapshot
+
+    (Path(cache_dir) / SNAPSHOT_FILE_NAME).unlink(missing_ok=True)
+
+    def run() -> dict:
+        snapshot = KgSnapshot.load_or_build(cache_dir=cache_dir)
+        return {"n_nodes": len(snapshot.node_ids)}
+
+    return run
+
+
+def setup_load_snapshot(cache_dir: str, args: argparse.Namespace) -> Callable[[], dict]:
+    from crushmycode.snapshot import KgSnapshot
+
+    KgSnapshot.load_or_build(cache_dir=cache_dir)
+
+    def run() -> dict:
+        snapshot = KgSnapshot.load_or_build(cache_dir=cache_dir)
+        return {"n_nodes": len(snapshot.node_ids)}
+
+    return run
+
+
+def _setup_show_graph(
+    cache_dir: str,
+    *,
+    include_nodes: bool,
+    lazy: bool,
+) -> Callable[[], dict]:
+    from crushmycode.graph_viz import draw_communities_graph
+    from crushmycode.lazy_viz import draw_lazy_communities_graph
+
+    snapshot, hierarchy = _load_snapshot(cache_dir)
+
+    def run() -> dict:
+        with tempfile.TemporaryDirectory() as out_dir:
+            outfile_name = str(Path(out_dir) / "graph.html")
+            if lazy:
+                draw_lazy_communities_graph(
+                    groups=snapshot.cluster_groups,
+                    communities=snapshot.communities,
+                    com_summaries=snapshot.summaries_by_id,
+                    node_details_by_id=snapshot.node_details_by_id,
+                    outfile_name=outfile_name,
+                    hierarchy=hierarchy,
+                )
+                pass
+            else:
+                # no layout cache, so that every run computes the layout
+                draw_communities_graph(
+                    groups=snapshot.cluster_groups,
+                    communities=snapshot.communities,
+                    com_summaries=snapshot.summaries_by_id,
+                    node_details_by_id=snapshot.node_details_by_id,
+                    outfile_name=outfile_name,
+                    include_nodes=include_nodes,
+                    hierarchy=hierarchy,
+                )
+                pass
+            output_bytes = sum(
+                path.stat().st_size for path in Path(out_dir).rglob("*") if path.is_file()
+            )
+            pass
+        return {"output_bytes": output_bytes}
+
+    return run
+
+
+def setup_show_graph(cache_dir: str, args: argparse.Namespace) -> Callable[[], dict]:
+    return _setup_show_graph(cache_dir, include_nodes=False, lazy=False)
+
+
+def setup_show_graph_nodes(
+    cache_dir: str, args: argparse.Namespace
+) -> Callable[[], dict]:
+    return _setup_show_graph(cache_dir, include_nodes=True, lazy=False)
+
+
+def setup_show_graph_lazy(cache_dir: str, args: argparse.Namespace) -> Callable[[], dict]:
+    return _setup_show_graph(cache_dir, include_nodes=False, lazy=True)
+
+
+def setup_report(cache_dir: str, args: argparse.Namespace) -> Callable[[], dict]:
+    from crushmycode.codereport import CodeReportBuilder
+    from fake_llm import FakeLlmClient
+
+    snapshot, hierarchy = _load_snapshot(cache_dir)
+    with open(Path(cache_dir) / "code-path.txt", "r") as f:
+        code_path = f.read().strip()
+        pass
+
+    def run() -> dict:
+        llm_client = FakeLlmClient(latency_s=args.latency_ms / 1000)
+        report = CodeReportBuilder(
+            code_base_path=code_path,
+            snapshot=snapshot,
+            concurrency=args.concurrency,
+            hierarchy=hierarchy,
+            ranking=args.ranking,
+            llm_client=llm_client,
+        ).build_report()
+        return {
+            "llm_requests": llm_client.num_requests,
+            "llm_prompt_chars": llm_client.prompt_chars,
+            "output_bytes": len(report.encode("utf-8")),
+        }
+
+    return run
+
+
+CASES: dict[str, Callable[[str, argparse.Namespace], Callable[[], dict]]] = {
+    "load-package": setup_load_package,
+    "build-snapshot": setup_build_snapshot,
+    "load-snapshot": setup_load_snapshot,
+    "show-graph": setup_show_graph,
+    "show-graph-nodes": setup_show_graph_nodes,
+    "show-graph-lazy": setup_show_graph_lazy,
+    "report": setup_report,
+}
+
+
+def run_case(case: str, cache_dir: str, args: argparse.Namespace) -> dict:
+    """
+    Runs in a process of its own.
+    The case is set up and run twice: once timed, and once under 'tracemalloc'
+    (which slows it down) for the peak of the memory it allocates.
+    'peak_rss_mb' is the peak of the whole process, imports and setup included.
+    """
+    run = CASES[case](cache_dir, args)
+    started = time.perf_counter()
+    details = run()
+    wall_s = time.perf_counter() - started
+
+    run = CASES[case](cache_dir, args)
+    tracemalloc.start()
+    run()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "wall_s": wall_s,
+        "alloc_peak_mb": alloc_peak / (1024 * 1024),
+        "peak_rss_mb": _get_peak_rss_mb(),
+        **details,
+    }
+
+
+def measure(case: str, cache_dir: Path, args: argparse.Namespace) -> dict:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            [
+                str(REPO_ROOT),
+                str(BENCHMARKS_DIR),
+                *filter(None, [os.environ.get("PYTHONPATH")]),
+            ]
+        ),
+    }
+    # not used, but some clients want a key at import
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    res = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--run-case",
+            case,
+            str(cache_dir),
+            f"--latency-ms={args.latency_ms}",
+            f"--concurrency={args.concurrency}",
+            f"--ranking={args.ranking}",
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if res.returncode != 0:
+        raise Exception(f"'{case}' failed on '{cache_dir}':\n{res.stderr}")
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def get_commit() -> str:
+    res = subprocess.run(
+        ["git", "describe", "--always", "--dirty"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return res.stdout.strip()
+
+
+def load_baseline(path: str) -> dict[tuple[str, str], dict]:
+    with open(path, "r") as f:
+        baseline = json.load(f)
+        pass
+    return {(result["fixture"], result["case"]): result for result in baseline["results"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--fixtures-dir",
+        default="benchmark-fixtures",
+        help="where fixtures are generated and reused from",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(FIXTURE_SIZES))
+    parser.add_argument(
+        "--shapes",
+        nargs="+",
+        choices=HIERARCHY_SHAPES,
+        default=list(HIERARCHY_SHAPES),
+    )
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per case; the fastest counts",
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0,
+        help="latency of every fake LLM request",
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_REPORT_CONCURRENCY)
+    parser.add_argument(
+        "--ranking",
+        choices=["llm", "graph", "hybrid"],
+        default="llm",
+        help="ranking mode of the report",
+    )
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--run-case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(*args.run_case, args)))
+        return
+
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    results: list[dict] = []
+    n_regressions = 0
+    print(
+        f"{'fixture':<34} {'case':<17} {'wall (s)':>9} {'alloc (MB)':>11} {'rss (MB)':>9}"
+        + ("  vs baseline" if baseline else "")
+    )
+    for n_nodes in args.sizes:
+        for shape in args.shapes:
+            spec = FixtureSpec(n_nodes, shape)
+            fixture = get_fixture_name(spec)
+            cache_dir = Path(args.fixtures_dir) / fixture
+            if not cache_dir.exists():
+                write_fixture(args.fixtures_dir, spec)
+                pass
+            for case in args.cases:
+                runs = [measure(case, cache_dir, args) for _ in range(max(1, args.repeat))]
+                best = min(runs, key=lambda run: run["wall_s"])
+                result = {
+                    "fixture": fixture,
+                    "n_nodes": n_nodes,
+                    "shape": shape,
+                    "case": case,
+                    **best,
+                    "wall_s_all": [run["wall_s"] for run in runs],
+                    "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+                }
+                results.append(result)
+                line = f"{fixture:<34} {case:<17} {result['wall_s']:>9.3f} {result['alloc_peak_mb']:>11.1f} {result['peak_rss_mb']:>9.0f}"
+                previous = baseline.get((fixture, case))
+                if previous and previous["wall_s"] > 0:
+                    ratio = result["wall_s"] / previous["wall_s"]
+                    is_regression = (
+                        ratio > REGRESSION_RATIO
+                        and result["wall_s"] - previous["wall_s"] > REGRESSION_MIN_S
+                    )
+                    n_regressions += is_regression
+                    line += f"  {ratio:>5.2f}x" + ("  REGRESSION" if is_regression else "")
+                    pass
+                print(line, flush=True)
+                pass
+            pass
+        pass
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "format_version": RESULTS_FORMAT_VERSION,
+                "commit": get_commit(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings": {
+                    "repeat": args.repeat,
+                    "latency_ms": args.latency_ms,
+                    "concurrency": args.concurrency,
+                    "ranking": args.ranking,
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+        pass
+    print(f"wrote {args.output}")
+    sys.exit(1 if n_regressions else 0)
+    return
+
+
+if __name__ == "__main__":
+    main()
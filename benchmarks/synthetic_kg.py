@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Generates synthetic knowledge graph cache directories, shaped like the ones 'crushmycode build' writes,
+for benchmarking without building a real repository.
+
+Every fixture gets a package (a 'BuildStepOutput_Package' under 'Step_Package'), the source files
+its nodes point to, and a 'code-path.txt', so that 'show-graph', 'report' and the rest work on it.
+Code constructs are grouped ten to a file, and files into leaf communities, which are nested by shape:
+ - 'deep': every community has 2 children, for many levels
+ - 'wide': every community has up to 50 children, for few levels
+
+    python benchmarks/synthetic_kg.py /tmp/fixtures --nodes 1000 10000 --shapes deep wide
+"""
+
+import argparse
+import os
+from pathlib import Path
+import random
+import sys
+from typing import Literal, NamedTuple
+
+import networkx as nx
+from minikg.build_output import BuildStepOutput_Package
+from minikg.models import Community, Group
+
+REPO_ROOT = Path(__file__).absolute().parent.parent
+# the working tree, rather than any installed release, for running straight from a checkout
+sys.path.insert(0, str(REPO_ROOT))
+
+from crushmycode.kgcache import get_package_path
+
+
+HierarchyShape = Literal["deep", "wide"]
+
+FIXTURE_SIZES = (1_000, 10_000, 100_000)
+HIERARCHY_SHAPES: tuple[HierarchyShape, ...] = ("deep", "wide")
+FAN_OUT_BY_SHAPE: dict[HierarchyShape, int] = {
+    "deep": 2,
+    "wide": 50,
+}
+NODES_PER_FILE = 10
+FILES_PER_DIR = 20
+NODES_PER_LEAF_COMMUNITY = 20
+EDGES_PER_NODE = 2
+# the rest of the edges connect random nodes anywhere in the graph
+LOCAL_EDGE_FRACTION = 0.8
+ENTITY_TYPES = ("FUNCTION", "CLASS", "METHOD", "CONSTANT")
+WORDS = (
+    "parse load store index render fetch merge split validate encode decode "
+    "schedule retry cache stream batch graph node edge token report config "
+    "client server request response session query layout summary"
+).split()
+
+
+class FixtureSpec(NamedTuple):
+    n_nodes: int
+    shape: HierarchyShape
+    pass
+
+
+def get_fixture_name(spec: FixtureSpec) -> str:
+    return f"kgcache_synthetic_{spec.shape}_{spec.n_nodes}"
+
+
+def _make_words(rnd: random.Random, n: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(n))
+
+
+def _make_summary(rnd: random.Random, label: str) -> dict[str, str]:
+    return {
+        "name": f"{_make_words(rnd, 2).title()} {label}",
+        "purpose": f"Handles {_make_words(rnd, 12)}.",
+    }
+
+
+def make_package(
+    spec: FixtureSpec,
+    *,
+    code_dir: Path,
+    seed: int = 0,
+) -> BuildStepOutput_Package:
+    """
+    Also writes the source files of the package's nodes under 'code_dir'.
+    """
+    rnd = random.Random(seed)
+    G = nx.MultiGraph()
+    node_ids: list[str] = []
+    n_files = -(-spec.n_nodes // NODES_PER_FILE)
+    for file_i in range(n_files):
+        source_path = f"pkg/dir{file_i // FILES_PER_DIR}/mod{file_i}.py"
+        n_file_nodes = min(NODES_PER_FILE, spec.n_nodes - len(node_ids))
+        lines: list[str] = []
+        for j in range(n_file_nodes):
+            name = f"{rnd.choice(WORDS)}_{rnd.choice(WORDS)}_{j}"
+            start_line = len(lines)
+            lines.extend(
+                [
+                    f"def {name}(value):",
+                    f'    """{_make_words(rnd, 8)}"""',
+                    f"    return value + {j}",
+                    "",
+                ]
+            )
+            node_id = f"{source_path}::{name}"
+            G.add_node(
+                node_id,
+                entity_type=rnd.choice(ENTITY_TYPES),
+                description=f"{_make_words(rnd, 10).capitalize()}.",
+                defining_fragment={
+                    "fragment_id": f"{source_path}:{start_line}-{len(lines)}",
+                    "source_path": source_path,
+                    "start_line_incl": start_line,
+                    "end_line_excl": len(lines),
+                },
+            )
+            node_ids.append(node_id)
+            pass
+        path = code_dir / source_path
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_text("\n".join(lines))
+        pass
+
+    for i, node_id in enumerate(node_ids):
+        for _ in range(EDGES_PER_NODE):
+            if rnd.random() < LOCAL_EDGE_FRACTION:
+                leaf_start = i - i % NODES_PER_LEAF_COMMUNITY
+                j = rnd.randrange(
+                    leaf_start, min(leaf_start + NODES_PER_LEAF_COMMUNITY, len(node_ids))
+                )
+                pass
+            else:
+                j = rnd.randrange(len(node_ids))
+                pass
+            if j != i:
+                G.add_edge(node_id, node_ids[j], description=_make_words(rnd, 4))
+                pass
+            pass
+        pass
+
+    communities: dict[str, Community] = {}
+    level_ids: list[str] = []
+    for leaf_i, start in enumerate(range(0, len(node_ids), NODES_PER_LEAF_COMMUNITY)):
+        community_id = f"c-0-{leaf_i}"
+        communities[community_id] = Community(
+            id=community_id,
+            child_node_ids=node_ids[start : start + NODES_PER_LEAF_COMMUNITY],
+        )
+        level_ids.append(community_id)
+        pass
+    # leaves first, roots last
+    levels = [level_ids]
+    fan_out = FAN_OUT_BY_SHAPE[spec.shape]
+    # every fixture has at least one level above the leaves
+    while len(level_ids) > 1 and (len(levels) == 1 or len(level_ids) > fan_out):
+        depth = len(levels)
+        parent_ids: list[str] = []
+        for parent_i, start in enumerate(range(0, len(level_ids), fan_out)):
+            community_id = f"c-{depth}-{parent_i}"
+            communities[community_id] = Community(
+                id=community_id,
+                child_community_ids=level_ids[start : start + fan_out],
+            )
+            parent_ids.append(community_id)
+            pass
+        level_ids = parent_ids
+        levels.append(level_ids)
+        pass
+    summaries_by_id = {
+        community_id: _make_summary(rnd, community_id) for community_id in communities
+    }
+
+    # like minikg, the first round of groups shares the ids of the root communities
+    cluster_groups: dict[str, Group] = {
+        community_id: Group(
+            group_id=community_id,
+            child_community_ids=communities[community_id].child_community_ids,
+            child_group_ids=[],
+            summary=summaries_by_id[community_id],
+        )
+        for community_id in level_ids
+    }
+    group_ids = list(level_ids)
+    group_round = 1
+    while len(group_ids) > 1:
+        parent_ids = []
+        for parent_i, start in enumerate(range(0, len(group_ids), fan_out)):
+            group_id = f"g-{group_round}-{parent_i}"
+            cluster_groups[group_id] = Group(
+                group_id=group_id,
+                child_community_ids=[],
+                child_group_ids=group_ids[start : start + fan_out],
+                summary=_make_summary(rnd, group_id),
+            )
+            parent_ids.append(group_id)
+            pass
+        group_ids = parent_ids
+        group_round += 1
+        pass
+
+    return BuildStepOutput_Package(
+        G=G,
+        communities=communities,
+        community_db_names=[],
+        community_hierarchy=list(reversed(levels)),
+        summaries_by_id=summaries_by_id,
+        cluster_groups=cluster_groups,
+    )
+
+
+def write_fixture(root: Path | str, spec: FixtureSpec, *, seed: int = 0) -> Path:
+    """
+    Returns the cache directory, '<root>/<fixture name>'.
+    Its source files go to '<root>/<fixture name>_code'.
+    """
+    cache_dir = Path(root) / get_fixture_name(spec)
+    code_dir = Path(root) / f"{get_fixture_name(spec)}_code"
+    pkg = make_package(spec, code_dir=code_dir, seed=seed)
+    package_path = get_package_path(cache_dir)
+    os.makedirs(package_path.parent, exist_ok=True)
+    package_path.write_bytes(pkg.to_bytes())
+    with open(cache_dir / "code-path.txt", "w") as f:
+        f.write(str(code_dir.absolute()))
+        pass
+    return cache_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("root", help="directory to write the fixtures to")
+    parser.add_argument("--nodes", type=int, nargs="+", default=list(FIXTURE_SIZES))
+    parser.add_argument(
+        "--shapes",
+        nargs="+",
+        choices=HIERARCHY_SHAPES,
+        default=list(HIERARCHY_SHAPES),
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for n_nodes in args.nodes:
+        for shape in args.shapes:
+            print(write_fixture(args.root, FixtureSpec(n_nodes, shape), seed=args.seed))
+            pass
+        pass
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Builds the knowledge graphs of several repositories at once, listed in a JSON manifest:
+
+    [
+      {"repo": "https://github.com/org/service-a", "input_files": ["*.py"], "ignore_files": ["tests/*"]},
+      {"repo": "../service-b", "input_files": ["*.go"], "gitignore": true}
+    ]
+
+Every repository is built by a thread of its own, but all of their build steps run on one
+process pool (and share one request budget), which takes steps from each repository in turn.
+Every repository still gets its own cache directory.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+from minikg.models import MiniKgConfig
+from pydantic import BaseModel, Field
+
+from crushmycode.build import build_kg, get_git_revision
+from crushmycode.clones import CloneManager, get_repo_name
+from crushmycode.scheduler import RequestScheduler, install_scheduler
+from crushmycode.step_pool import StepPool
+
+
+class BatchManifestEntry(BaseModel):
+    repo: str
+    input_files: list[str] = Field(default_factory=lambda: ["*"])
+    ignore_files: list[str] = Field(default_factory=list)
+    gitignore: bool = False
+    pass
+
+
+class RepoBuildResult(NamedTuple):
+    repo: str
+    config: MiniKgConfig | None
+    error: str | None
+    pass
+
+
+def load_batch_manifest(path: str | Path) -> list[BatchManifestEntry]:
+    with open(path, "r") as f:
+        raw = json.load(f)
+        pass
+    if not isinstance(raw, list):
+        raise Exception(f"batch manifest '{path}' must be a list of repositories")
+    entries = [BatchManifestEntry.model_validate(item) for item in raw]
+    # the cache directory is named after the repository
+    names: dict[str, str] = {}
+    for entry in entries:
+        name = (
+            os.path.split(Path(entry.repo).absolute())[-1]
+            if Path(entry.repo).exists()
+            else get_repo_name(entry.repo)
+        )
+        if name in names:
+            raise Exception(
+                f"'{names[name]}' and '{entry.repo}' would share the cache directory for '{name}'"
+            )
+        names[name] = entry.repo
+        pass
+    return entries
+
+
+def build_repo(
+    *,
+    repo: str,
+    input_file_exps: list[str],
+    ignore_file_exps: list[str],
+    use_gitignore: bool = False,
+    incremental: bool = False,
+    since: str | None = None,
+    workers: int | None = None,
+    scheduler: RequestScheduler | None = None,
+    step_pool: StepPool | None = None,
+) -> MiniKgConfig:
+    """
+    Builds the knowledge graph of a local directory, or of a clone of the repository at URL 'repo'.
+    """
+    local_path = repo
+    commit_sha = ""
+    if not Path(local_path).exists():
+        clone = CloneManager().checkout(
+            repo,
+            input_file_exps=input_file_exps,
+        )
+        local_path = str(clone.path)
+        commit_sha = clone.commit_sha
+        pass
+    config = build_kg(
+        input_dir=local_path,
+        ignore_file_exps=ignore_file_exps,
+        input_file_exps=input_file_exps,
+        use_gitignore=use_gitignore,
+        incremental=incremental,
+        since=since,
+        workers=workers,
+        scheduler=scheduler,
+        step_pool=step_pool,
+    )
+    with open(config.persist_dir / "code-path.txt", "w") as f:
+        f.write(str(config.input_dir))
+        pass
+    commit_sha = commit_sha or get_git_revision(config.input_dir)
+    if commit_sha:
+        with open(config.persist_dir / "code-commit.txt", "w") as f:
+            f.write(commit_sha)
+            pass
+        pass
+    return config
+
+
+def build_batch(
+    entries: list[BatchManifestEntry],
+    *,
+    workers: int,
+    scheduler: RequestScheduler,
+    incremental: bool = False,
+) -> list[RepoBuildResult]:
+    """
+    A repository whose build fails does not stop the others.
+    """
+    install_scheduler(scheduler)
+    results: list[RepoBuildResult] = []
+    with StepPool(scheduler=scheduler, workers=workers) as step_pool:
+        with ThreadPoolExecutor(max_workers=max(1, len(entries))) as threads:
+            futures = [
+                threads.submit(
+                    build_repo,
+                    repo=entry.repo,
+                    input_file_exps=entry.input_files,
+                    ignore_file_exps=entry.ignore_files,
+                    use_gitignore=entry.gitignore,
+                    incremental=incremental,
+                    step_pool=step_pool,
+                )
+                for entry in entries
+            ]
+            for entry, future in zip(entries, futures):
+                try:
+                    config = future.result()
+                    results.append(
+                        RepoBuildResult(repo=entry.repo, config=config, error=None)
+                    )
+                    logging.info("built '%s' into '%s'", entry.repo, config.persist_dir)
+                except Exception as e:
+                    logging.exception("failed to build '%s'", entry.repo)
+                    results.append(
+                        RepoBuildResult(repo=entry.repo, config=None, error=str(e))
+                    )
+                    pass
+                pass
+            pass
+        pass
+    return results
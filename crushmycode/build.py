@@ -0,0 +1,483 @@
+"""
+Builds the knowledge graph with minikg, optionally incrementally.
+
+minikg caches the output of every build step in the cache directory, but has no notion
+of which input files changed since those outputs were written.
+We keep a manifest of the content hash of every input file next to them,
+and before an incremental build, drop the cached steps that depend on files that changed:
+ - entity and edge extraction for the changed files themselves
+ - edge extraction for other files, where those edges reach into a changed file
+ - everything computed over the whole graph (communities, summaries, groups, the package)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import subprocess
+from typing import NamedTuple
+
+from minikg.api import Api as MiniKgApi
+from minikg.build_steps.step_identify_entities import Step_IdentifyEntities
+from minikg.models import MiniKgConfig
+from minikg.presets.code import KgApiCode
+from minikg.step_coordinators import STEP_COORDINATOR_ORDER
+from minikg.step_coordinators.base import StepCoordinator
+from minikg.step_coordinators.identify_entities import StepCoordinator_IdentifyEntities
+
+from crushmycode import profiling
+from crushmycode.file_selector import FileSelector
+from crushmycode.graph_layout import LAYOUT_CACHE_DIR_NAME
+from crushmycode.hierarchy import INDEX_FILE_NAME
+from crushmycode.kgcache import get_package_path
+from crushmycode.scheduler import RequestScheduler, install_scheduler
+from crushmycode.search import SEARCH_INDEX_DIR_NAME
+from crushmycode.snapshot import SNAPSHOT_FILE_NAME, KgSnapshot
+from crushmycode.step_pool import StepPool, SupervisedStepExecutor
+
+
+MANIFEST_FILE_NAME = "input-manifest.json"
+MANIFEST_VERSION = 2
+HASH_CHUNK_BYTES = 1 << 20
+HASH_CONCURRENCY = 8
+
+# steps cached once per input file, by the file's path with '/' replaced
+PER_FILE_STEP_NAMES = ("Step_IdentifyEntities", "Step_IdentifyEdges")
+# steps computed over the whole graph
+# (community IDs are not stable between detections, so no summary can be kept)
+GRAPH_STEP_NAMES = (
+    "Step_ApplyEdgesToEntities",
+    "Step_DefineCommunities",
+    "Step_SummarizeCommunity",
+    "Step_ClusterGroups",
+    "Step_Package",
+)
+# crushmycode's own artifacts derived from the package
+DERIVED_ARTIFACT_NAMES = (
+    SNAPSHOT_FILE_NAME,
+    INDEX_FILE_NAME,
+    LAYOUT_CACHE_DIR_NAME,
+    SEARCH_INDEX_DIR_NAME,
+)
+# separates the source path from the name in an entity's qualified name
+ENTITY_NAME_DELIMITER = "::"
+
+
+class InputManifest(NamedTuple):
+    input_file_exps: list[str]
+    ignore_file_exps: list[str]
+    use_gitignore: bool
+    # git revision of the input directory, if it is a git checkout
+    revision: str
+    # source path (relative to the input directory) -> sha256 of its contents
+    file_hashes: dict[str, str]
+    pass
+
+
+class ManifestDiff(NamedTuple):
+    added: list[str]
+    modified: list[str]
+    removed: list[str]
+
+    @property
+    def changed_paths(self) -> list[str]:
+        return [*self.added, *self.modified, *self.removed]
+
+    pass
+
+
+def _hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            h.update(chunk)
+            pass
+        pass
+    return h.hexdigest()
+
+
+def hash_input_files(input_dir: Path, source_paths: list[str]) -> dict[str, str]:
+    with ThreadPoolExecutor(max_workers=HASH_CONCURRENCY) as ex:
+        hashes = list(
+            ex.map(lambda path: _hash_file(input_dir / path), source_paths)
+        )
+        pass
+    return dict(zip(source_paths, hashes))
+
+
+def get_git_revision(input_dir: Path) -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=input_dir,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def get_git_changed_paths(input_dir: Path, since: str) -> set[str]:
+    """
+    Paths (relative to 'input_dir') that differ between revision 'since' and the working tree,
+    including untracked files.
+    """
+    changed = subprocess.check_output(
+        ["git", "diff", "--name-only", "--relative", since],
+        cwd=input_dir,
+        text=True,
+    ).splitlines()
+    untracked = subprocess.check_output(
+        ["git", "ls-files", "--others", "--exclude-standard"],
+        cwd=input_dir,
+        text=True,
+    ).splitlines()
+    return set(path for path in [*changed, *untracked] if path)
+
+
+def load_manifest(cache_dir: Path) -> InputManifest | None:
+    path = cache_dir / MANIFEST_FILE_NAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+            pass
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return InputManifest(
+            input_file_exps=data["input_file_exps"],
+            ignore_file_exps=data["ignore_file_exps"],
+            use_gitignore=data["use_gitignore"],
+            revision=data["revision"],
+            file_hashes=data["file_hashes"],
+        )
+    except (OSError, ValueError, KeyError) as e:
+        logging.error("failed to load input manifest %s: %s", path, e)
+        return None
+
+
+def save_manifest(cache_dir: Path, manifest: InputManifest) -> None:
+    path = cache_dir / MANIFEST_FILE_NAME
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, **manifest._asdict()}, f)
+        pass
+    os.replace(tmp_path, path)
+    return
+
+
+def diff_manifests(
+    old_hashes: dict[str, str],
+    new_hashes: dict[str, str],
+) -> ManifestDiff:
+    return ManifestDiff(
+        added=sorted(path for path in new_hashes if path not in old_hashes),
+        modified=sorted(
+            path
+            for path, file_hash in new_hashes.items()
+            if path in old_hashes and old_hashes[path] != file_hash
+        ),
+        removed=sorted(path for path in old_hashes if path not in new_hashes),
+    )
+
+
+def _get_step_id(source_path: str) -> str:
+    # as minikg's per-file steps name themselves
+    return source_path.replace("/", ":")
+
+
+def _get_edge_source_paths(edges_path: Path) -> set[str]:
+    with open(edges_path, "rb") as f:
+        data = json.loads(f.read())
+        pass
+    return set(
+        entity.split(ENTITY_NAME_DELIMITER, 1)[0]
+        for edge in data["edges"]
+        for entity in [edge["source_entity"], edge["target_entity"]]
+    )
+
+
+def invalidate_changed_steps(
+    cache_dir: Path,
+    *,
+    changed_paths: list[str],
+    unchanged_paths: list[str],
+) -> None:
+    """
+    Drops cached build steps that depend on any of 'changed_paths'.
+    """
+    changed = set(changed_paths)
+    n_dropped = 0
+    for path in changed_paths:
+        for step_name in PER_FILE_STEP_NAMES:
+            step_path = cache_dir / step_name / _get_step_id(path)
+            if step_path.exists():
+                step_path.unlink()
+                n_dropped += 1
+                pass
+            pass
+        pass
+
+    # edges found in an unchanged file may point at entities of a changed one
+    n_dependents = 0
+    for path in unchanged_paths:
+        edges_path = cache_dir / "Step_IdentifyEdges" / _get_step_id(path)
+        if not edges_path.exists():
+            continue
+        try:
+            referenced = _get_edge_source_paths(edges_path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error("failed to read cached edges %s: %s", edges_path, e)
+            referenced = changed
+            pass
+        if referenced & changed:
+            edges_path.unlink()
+            n_dependents += 1
+            pass
+        pass
+
+    for name in [*GRAPH_STEP_NAMES, *DERIVED_ARTIFACT_NAMES]:
+        path = cache_dir / name
+        if path.is_dir():
+            shutil.rmtree(path)
+            pass
+        elif path.exists():
+            path.unlink()
+            pass
+        pass
+    logging.info(
+        "dropped %d cached extraction steps for %d changed files, and edges of %d files that depend on them",
+        n_dropped,
+        len(changed_paths),
+        n_dependents,
+    )
+    return
+
+
+class StepCoordinator_IdentifySelectedEntities(StepCoordinator_IdentifyEntities):
+    """
+    Identifies entities in files selected up front, instead of by minikg's own file search.
+    """
+
+    def __init__(
+        self,
+        *,
+        config: MiniKgConfig,
+        source_paths: list[Path],
+    ):
+        super().__init__(config=config)
+        self.source_paths = source_paths
+        return
+
+    def get_steps_to_execute(
+        self,
+        **kwargs,
+    ) -> list[Step_IdentifyEntities]:
+        return [
+            Step_IdentifyEntities(
+                self.config,
+                file_path=path,
+            )
+            for path in self.source_paths
+        ]
+
+    pass
+
+
+def get_step_coordinators(
+    config: MiniKgConfig,
+    *,
+    source_paths: list[Path],
+) -> list[StepCoordinator]:
+    return [
+        (
+            StepCoordinator_IdentifySelectedEntities(
+                config=config,
+                source_paths=source_paths,
+            )
+            if coordinator is StepCoordinator_IdentifyEntities
+            else coordinator(config=config)
+        )
+        for coordinator in STEP_COORDINATOR_ORDER
+    ]
+
+
+def get_minikg_api(
+    *,
+    input_dir: str,
+    input_file_exps: list[str],
+    ignore_file_exps: list[str],
+) -> MiniKgApi:
+    # the same configuration 'KgApiCode.build_kg' uses
+    project_name = os.path.split(Path(input_dir).absolute())[-1]
+    return KgApiCode()._get_minikg_api(
+        project_name=project_name,
+        ignore_file_exps=ignore_file_exps,
+        input_dir=input_dir,
+        input_file_exps=input_file_exps,
+    )
+
+
+def _get_new_manifest(
+    config: MiniKgConfig,
+    *,
+    source_paths: list[str],
+    use_gitignore: bool,
+    old_manifest: InputManifest | None,
+    since: str | None,
+) -> InputManifest:
+    maybe_changed: set[str] | None = None
+    if since and old_manifest:
+        try:
+            maybe_changed = get_git_changed_paths(config.input_dir, since)
+        except (OSError, subprocess.CalledProcessError) as e:
+            # e.g. a shallow clone, which does not have the revision
+            logging.warning(
+                "could not diff against revision '%s' (%s), checking every file", since, e
+            )
+            pass
+        pass
+    if maybe_changed is not None and old_manifest:
+        # only re-hash what git says may have changed
+        file_hashes = {
+            path: old_manifest.file_hashes[path]
+            for path in source_paths
+            if path in old_manifest.file_hashes and path not in maybe_changed
+        }
+        file_hashes.update(
+            hash_input_files(
+                config.input_dir,
+                [path for path in source_paths if path not in file_hashes],
+            )
+        )
+        pass
+    else:
+        file_hashes = hash_input_files(config.input_dir, source_paths)
+        pass
+    return InputManifest(
+        input_file_exps=list(config.input_file_exps),
+        ignore_file_exps=list(config.ignore_expressions),
+        use_gitignore=use_gitignore,
+        revision=get_git_revision(config.input_dir),
+        file_hashes=file_hashes,
+    )
+
+
+def _run_coordinators(
+    config: MiniKgConfig,
+    *,
+    step_pool: StepPool,
+    source_paths: list[Path],
+) -> None:
+    executor = SupervisedStepExecutor(
+        config,
+        step_pool=step_pool,
+        key=str(config.persist_dir),
+    )
+    executor.run_all_coordinators(
+        get_step_coordinators(config, source_paths=source_paths)
+    )
+    return
+
+
+def build_kg(
+    *,
+    input_dir: str,
+    input_file_exps: list[str],
+    ignore_file_exps: list[str],
+    use_gitignore: bool = False,
+    incremental: bool = False,
+    since: str | None = None,
+    workers: int | None = None,
+    scheduler: RequestScheduler | None = None,
+    step_pool: StepPool | None = None,
+) -> MiniKgConfig:
+    """
+    With 'incremental', only files whose contents changed since the last build are re-extracted.
+    'since' is a git revision of the input directory, and limits the files that are re-hashed
+    to those git reports as changed since that revision.
+    'workers' overrides the number of worker processes minikg is configured with.
+    Steps run on 'step_pool' if given (shared with other builds), and otherwise on a pool of their own.
+    """
+    minikgapi = get_minikg_api(
+        input_dir=input_dir,
+        input_file_exps=input_file_exps,
+        ignore_file_exps=ignore_file_exps,
+    )
+    config = minikgapi.config
+    if workers is not None:
+        config = config._replace(max_concurrency=workers)
+        pass
+    cache_dir = Path(config.persist_dir)
+
+    with profiling.stage("select-files"):
+        selection = FileSelector(
+            input_file_exps=input_file_exps,
+            ignore_file_exps=ignore_file_exps,
+            use_gitignore=use_gitignore,
+        ).select(config.input_dir)
+        pass
+
+    old_manifest = load_manifest(cache_dir) if (incremental or since) else None
+    if (incremental or since) and old_manifest is None:
+        logging.warning(
+            "no input manifest in '%s' from a previous build, running a full build",
+            cache_dir,
+        )
+        pass
+
+    with profiling.stage("hash-input-files"):
+        manifest = _get_new_manifest(
+            config,
+            source_paths=[str(path) for path in selection.paths],
+            use_gitignore=use_gitignore,
+            old_manifest=old_manifest,
+            since=since,
+        )
+        pass
+    if old_manifest:
+        # a change of expressions just shows up as added or removed files
+        diff = diff_manifests(old_manifest.file_hashes, manifest.file_hashes)
+        logging.info(
+            "%d files added, %d modified and %d removed since the last build",
+            len(diff.added),
+            len(diff.modified),
+            len(diff.removed),
+        )
+        if not diff.changed_paths and get_package_path(cache_dir).exists():
+            logging.info("knowledge graph in '%s' is up to date", cache_dir)
+            return config
+        changed = set(diff.changed_paths)
+        invalidate_changed_steps(
+            cache_dir,
+            changed_paths=diff.changed_paths,
+            unchanged_paths=[
+                path for path in manifest.file_hashes if path not in changed
+            ],
+        )
+        pass
+
+    if step_pool is None:
+        if scheduler is None:
+            scheduler = RequestScheduler(
+                requests_per_minute=None, tokens_per_minute=None
+            )
+            pass
+        # coordinators run in this process, and may make requests of their own
+        install_scheduler(scheduler)
+        with StepPool(scheduler=scheduler, workers=config.max_concurrency) as pool:
+            _run_coordinators(config, step_pool=pool, source_paths=selection.paths)
+            pass
+        pass
+    else:
+        _run_coordinators(config, step_pool=step_pool, source_paths=selection.paths)
+        pass
+    save_manifest(cache_dir, manifest)
+    with profiling.stage("build-snapshot"):
+        KgSnapshot.load_or_build(cache_dir=cache_dir)
+        pass
+    return config
@@ -2,11 +2,21 @@ from abc import abstractmethod
 import argparse
 import enum
 from textwrap import dedent
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import BaseModel, Field
 
 
+DEFAULT_WORKERS = 8
+# what minikg's own LLM client is configured for
+DEFAULT_REQUESTS_PER_MINUTE = 5000
+PROFILE_HELP = """
+            Record the wall time of every stage{llm_calls} and the peak memory use,
+            print a summary at the end, and write a Chrome trace to the 'profiles' directory of the cache directory{trace_dir_note}.
+            """
+PROFILE_LLM_CALLS = ", every LLM call (latency, tokens, retries)"
+
+
 class CMCArgs(BaseModel):
     @staticmethod
     @abstractmethod
@@ -21,15 +31,32 @@ class CMCArgsBuild(CMCArgs):
     def get_command_name() -> str:
         return "build"
 
-    repo_url: str = Field(
+    repo_url: str | None = Field(
         cli_kwargs={
             "type": str,
+            "nargs": "?",
             "help": dedent(
                 """
             Local folder path or github URL.
             """
             ),
         },
+        default=None,
+    )
+    manifest: str | None = Field(
+        cli_kwargs={
+            "name": "--manifest",
+            "type": str,
+            "help": dedent(
+                """
+            Path to a JSON list of repositories to build together, instead of a single one.
+            Every entry has a 'repo' (path or URL), and optionally 'input_files', 'ignore_files' and 'gitignore',
+            which have the same meaning as the options of the same names.
+            All repositories share the '--workers' and the '--rpm' and '--tpm' limits.
+            """
+            ),
+        },
+        default=None,
     )
     input_files: list[str] = Field(
         cli_kwargs={
@@ -56,6 +83,92 @@ class CMCArgsBuild(CMCArgs):
         },
         default_factory=list,
     )
+    gitignore: bool = Field(
+        cli_kwargs={
+            "name": "--gitignore",
+            "action": "store_true",
+            "help": dedent(
+                """
+            Also skip source files ignored by git (through '.gitignore' files and the like).
+            Requires the code to be a git checkout.
+            """
+            ),
+        },
+        default=False,
+    )
+    incremental: bool = Field(
+        cli_kwargs={
+            "name": "--incremental",
+            "action": "store_true",
+            "help": dedent(
+                """
+            Only re-process source files whose contents changed since the previous build,
+            and the parts of the graph that depend on them.
+            """
+            ),
+        },
+        default=False,
+    )
+    since: str | None = Field(
+        cli_kwargs={
+            "name": "--since",
+            "type": str,
+            "help": dedent(
+                """
+            Git revision of the code (e.g. the commit of the previous build).
+            Implies '--incremental', and only checks files that git reports as changed since that revision.
+            """
+            ),
+        },
+        default=None,
+    )
+    workers: int = Field(
+        cli_kwargs={
+            "name": "--workers",
+            "type": int,
+            "help": dedent(
+                """
+            Number of worker processes running build steps.
+            A worker that dies is replaced, and its unfinished steps are run again.
+            """
+            ),
+        },
+        default=DEFAULT_WORKERS,
+    )
+    rpm: int | None = Field(
+        cli_kwargs={
+            "name": "--rpm",
+            "type": int,
+            "help": """
+            Maximum number of LLM API requests per minute.
+            """,
+        },
+        default=DEFAULT_REQUESTS_PER_MINUTE,
+    )
+    tpm: int | None = Field(
+        cli_kwargs={
+            "name": "--tpm",
+            "type": int,
+            "help": """
+            Maximum number of LLM API tokens (prompt and completion) per minute.
+            Unlimited by default.
+            """,
+        },
+        default=None,
+    )
+    profile: bool = Field(
+        cli_kwargs={
+            "name": "--profile",
+            "action": "store_true",
+            "help": dedent(
+                PROFILE_HELP.format(
+                    llm_calls=PROFILE_LLM_CALLS,
+                    trace_dir_note=" (the working directory with '--manifest')",
+                )
+            ),
+        },
+        default=False,
+    )
     pass
 
 
@@ -84,6 +197,109 @@ class CMCArgsShowGraph(CMCArgs):
         },
         default=False,
     )
+
+    layout: Literal["auto", "physics", "radial"] = Field(
+        cli_kwargs={
+            "name": "--layout",
+            "choices": ["auto", "physics", "radial"],
+            "help": dedent(
+                """
+            How to position the graph's nodes.
+            'physics' lets the browser run a force simulation, which is slow on large graphs.
+            'radial' computes a layout of concentric rings ahead of time, and disables browser physics.
+            'auto' uses 'radial' for graphs with at least 1000 nodes, and 'physics' otherwise.
+            """
+            ),
+        },
+        default="auto",
+    )
+
+    lazy: bool = Field(
+        cli_kwargs={
+            "name": "--lazy",
+            "action": "store_true",
+            "help": dedent(
+                """
+            Write only the top-level groups and communities into the page,
+            and the contents of every community into a separate shard (in a '_shards' directory next to the page),
+            which is loaded when the community is double-clicked.
+            Code nodes are always available this way, so '--show-nodes' and '--layout' do not apply.
+            """
+            ),
+        },
+        default=False,
+    )
+
+    max_nodes: int | None = Field(
+        cli_kwargs={
+            "name": "--max-nodes",
+            "type": int,
+            "help": """
+            Draw at most this many communities, code nodes and '+N more' nodes, the most important first.
+            Group nodes are drawn on top of these; the one '+N more' node under every group
+            for its top-level communities left out only exceeds it when there are more groups than it allows.
+            """,
+        },
+        default=None,
+    )
+
+    top_k_per_community: int | None = Field(
+        cli_kwargs={
+            "name": "--top-k-per-community",
+            "type": int,
+            "help": """
+            Draw at most this many sub-communities and code nodes under every community, the most important first.
+            """,
+        },
+        default=None,
+    )
+
+    min_depth: int = Field(
+        cli_kwargs={
+            "name": "--min-depth",
+            "type": int,
+            "help": """
+            Only draw communities at least this deep in the hierarchy; top-level communities are at depth 0.
+            """,
+        },
+        default=0,
+    )
+
+    max_depth: int | None = Field(
+        cli_kwargs={
+            "name": "--max-depth",
+            "type": int,
+            "help": """
+            Only draw communities at most this deep in the hierarchy.
+            """,
+        },
+        default=None,
+    )
+
+    importance: Literal["pagerank", "degree"] = Field(
+        cli_kwargs={
+            "name": "--importance",
+            "choices": ["pagerank", "degree"],
+            "help": dedent(
+                """
+            How code nodes are ranked for '--max-nodes' and '--top-k-per-community';
+            a community is as important as the code nodes it contains.
+            Children left out of a community are drawn as one '+N more' node.
+            """
+            ),
+        },
+        default="pagerank",
+    )
+    profile: bool = Field(
+        cli_kwargs={
+            "name": "--profile",
+            "action": "store_true",
+            "help": dedent(
+                PROFILE_HELP.format(llm_calls="", trace_dir_note="")
+            ),
+        },
+        default=False,
+    )
     pass
 
 
@@ -101,6 +317,390 @@ class CMCArgsGenerateReport(CMCArgs):
         },
     )
 
+    concurrency: int = Field(
+        cli_kwargs={
+            "name": "--concurrency",
+            "type": int,
+            "help": """
+            Maximum number of LLM requests to have in flight at once.
+            """,
+        },
+        default=4,
+    )
+
+    sections: str = Field(
+        cli_kwargs={
+            "name": "--sections",
+            "type": str,
+            "help": dedent(
+                """
+            Comma-separated sections to include in the report, out of 'executive', 'components' and 'skills'.
+            The skillset is derived from the components, so 'skills' generates them too, without including them.
+            """
+            ),
+        },
+        default="executive,components,skills",
+    )
+
+    regenerate: bool = Field(
+        cli_kwargs={
+            "name": "--regenerate",
+            "action": "store_true",
+            "help": dedent(
+                """
+            Generate every section again.
+            By default, a section saved by a previous run is reused if the summaries, code constructs
+            and source files it was generated from have not changed since.
+            """
+            ),
+        },
+        default=False,
+    )
+
+    no_llm_cache: bool = Field(
+        cli_kwargs={
+            "name": "--no-llm-cache",
+            "action": "store_true",
+            "help": """
+            Ignore LLM responses cached by previous runs, and do not cache new ones.
+            """,
+        },
+        default=False,
+    )
+
+    llm_cache_max_mb: int = Field(
+        cli_kwargs={
+            "name": "--llm-cache-max-mb",
+            "type": int,
+            "help": """
+            Size limit for the LLM response cache, kept in the cache directory.
+            The least recently used responses are evicted beyond this size.
+            """,
+        },
+        default=256,
+    )
+
+    ranking: Literal["llm", "graph", "hybrid"] = Field(
+        cli_kwargs={
+            "name": "--ranking",
+            "choices": ["llm", "graph", "hybrid"],
+            "help": dedent(
+                """
+            How to choose the most important components and code constructs.
+            'llm' asks the LLM to rank every candidate.
+            'graph' ranks by graph centrality (PageRank, degree, betweenness) without any LLM calls.
+            'hybrid' shortlists candidates by graph centrality, then asks the LLM to rank the shortlist.
+            """
+            ),
+        },
+        default="llm",
+    )
+
+    ranking_top_k: int = Field(
+        cli_kwargs={
+            "name": "--ranking-top-k",
+            "type": int,
+            "help": """
+            Size of the shortlist passed to the LLM with '--ranking hybrid'.
+            """,
+        },
+        default=30,
+    )
+
+    token_budget: int = Field(
+        cli_kwargs={
+            "name": "--token-budget",
+            "type": int,
+            "help": dedent(
+                """
+            Approximate token budget for the list of candidates in a single ranking prompt.
+            Larger candidate lists are ranked in budget-sized chunks, then the chunk winners are re-ranked.
+            """
+            ),
+        },
+        default=32_000,
+    )
+
+    max_context_bytes: int = Field(
+        cli_kwargs={
+            "name": "--max-context-bytes",
+            "type": int,
+            "help": """
+            Maximum amount of source code, in bytes, to include when identifying developer skillsets.
+            """,
+        },
+        default=200_000,
+    )
+
+    rpm: int | None = Field(
+        cli_kwargs={
+            "name": "--rpm",
+            "type": int,
+            "help": """
+            Maximum number of LLM API requests per minute.
+            """,
+        },
+        default=DEFAULT_REQUESTS_PER_MINUTE,
+    )
+
+    tpm: int | None = Field(
+        cli_kwargs={
+            "name": "--tpm",
+            "type": int,
+            "help": """
+            Maximum number of LLM API tokens (prompt and completion) per minute.
+            Unlimited by default.
+            """,
+        },
+        default=None,
+    )
+    profile: bool = Field(
+        cli_kwargs={
+            "name": "--profile",
+            "action": "store_true",
+            "help": dedent(
+                PROFILE_HELP.format(llm_calls=PROFILE_LLM_CALLS, trace_dir_note="")
+            ),
+        },
+        default=False,
+    )
+    pass
+
+
+class CMCArgsSearch(CMCArgs):
+    @staticmethod
+    def get_command_name() -> str:
+        return "search"
+
+    cache_path: str = Field(
+        cli_kwargs={
+            "type": str,
+            "help": """
+            Path to the directory created during the 'build' step.
+            """,
+        },
+    )
+
+    query: list[str] = Field(
+        cli_kwargs={
+            "nargs": "+",
+            "help": """
+            Words to search for.
+            """,
+        },
+    )
+
+    limit: int = Field(
+        cli_kwargs={
+            "name": "--limit",
+            "type": int,
+            "help": """
+            Maximum number of results.
+            """,
+        },
+        default=10,
+    )
+
+    kinds: list[Literal["node", "community", "group"]] = Field(
+        cli_kwargs={
+            "name": "--kinds",
+            "nargs": "*",
+            "choices": ["node", "community", "group"],
+            "help": """
+            Only return code nodes, communities or groups.
+            """,
+        },
+        default_factory=list,
+    )
+
+    json_output: bool = Field(
+        cli_kwargs={
+            "name": "--json-output",
+            "action": "store_true",
+            "help": """
+            Print results as JSON lines.
+            """,
+        },
+        default=False,
+    )
+    pass
+
+
+class CMCArgsDiff(CMCArgs):
+    @staticmethod
+    def get_command_name() -> str:
+        return "diff"
+
+    old_cache_path: str = Field(
+        cli_kwargs={
+            "type": str,
+            "help": """
+            Path to the directory of the earlier build.
+            """,
+        },
+    )
+
+    new_cache_path: str = Field(
+        cli_kwargs={
+            "type": str,
+            "help": """
+            Path to the directory of the later build.
+            """,
+        },
+    )
+
+    json_output: bool = Field(
+        cli_kwargs={
+            "name": "--json-output",
+            "action": "store_true",
+            "help": """
+            Print every change as JSON instead of a markdown summary.
+            """,
+        },
+        default=False,
+    )
+
+    output: str | None = Field(
+        cli_kwargs={
+            "name": "--output",
+            "type": str,
+            "help": """
+            File to write the diff to, instead of printing it.
+            """,
+        },
+        default=None,
+    )
+
+    graph: str | None = Field(
+        cli_kwargs={
+            "name": "--graph",
+            "type": str,
+            "help": """
+            Also draw the later build to this HTML file, highlighting what changed.
+            """,
+        },
+        default=None,
+    )
+
+    show_nodes: bool = Field(
+        cli_kwargs={
+            "name": "--show-nodes",
+            "action": "store_true",
+            "help": """
+            Include the code nodes in '--graph'.
+            """,
+        },
+        default=False,
+    )
+    pass
+
+
+class CMCArgsExport(CMCArgs):
+    @staticmethod
+    def get_command_name() -> str:
+        return "export"
+
+    cache_path: str = Field(
+        cli_kwargs={
+            "type": str,
+            "help": """
+            Path to the directory created during the 'build' step.
+            """,
+        },
+    )
+
+    output_dir: str = Field(
+        cli_kwargs={
+            "type": str,
+            "help": """
+            Directory to write the tables to, one file per table.
+            """,
+        },
+    )
+
+    format: Literal["ndjson", "parquet", "arrow"] = Field(
+        cli_kwargs={
+            "name": "--format",
+            "choices": ["ndjson", "parquet", "arrow"],
+            "help": """
+            Newline-delimited JSON, Parquet, or memory-mappable Arrow IPC files.
+            Parquet and Arrow need pyarrow.
+            """,
+        },
+        default="ndjson",
+    )
+
+    tables: list[Literal["nodes", "edges", "communities", "groups", "summaries"]] = Field(
+        cli_kwargs={
+            "name": "--tables",
+            "nargs": "*",
+            "choices": ["nodes", "edges", "communities", "groups", "summaries"],
+            "help": """
+            Only export these tables.
+            """,
+        },
+        default_factory=list,
+    )
+
+    chunk_rows: int = Field(
+        cli_kwargs={
+            "name": "--chunk-rows",
+            "type": int,
+            "help": """
+            Rows written at a time; memory use grows with it.
+            """,
+        },
+        default=65_536,
+    )
+    pass
+
+
+class CMCArgsServe(CMCArgs):
+    @staticmethod
+    def get_command_name() -> str:
+        return "serve"
+
+    cache_paths: list[str] = Field(
+        cli_kwargs={
+            "nargs": "+",
+            "help": """
+            Paths to directories created during the 'build' step.
+            """,
+        },
+    )
+
+    host: str = Field(
+        cli_kwargs={
+            "name": "--host",
+            "type": str,
+            "help": """
+            Address to listen on.
+            """,
+        },
+        default="127.0.0.1",
+    )
+
+    port: int = Field(
+        cli_kwargs={
+            "name": "--port",
+            "type": int,
+            "help": """
+            Port to listen on.
+            """,
+        },
+        default=8765,
+    )
+
+    report_dir: str = Field(
+        cli_kwargs={
+            "name": "--report-dir",
+            "type": str,
+            "help": """
+            Directory the 'report' step wrote its reports to.
+            """,
+        },
+        default=".",
+    )
     pass
 
 
@@ -110,6 +710,10 @@ sub_commands = {
         CMCArgsBuild,
         CMCArgsGenerateReport,
         CMCArgsShowGraph,
+        CMCArgsSearch,
+        CMCArgsDiff,
+        CMCArgsExport,
+        CMCArgsServe,
     ]
 }
 
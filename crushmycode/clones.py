@@ -0,0 +1,136 @@
+"""
+Local clones of remote repositories to build knowledge graphs from.
+
+Clones are:
+ - shallow (only the latest commit) and partial (file contents are only fetched when checked out)
+ - sparse, when the input expressions allow it, so only files that may be selected are checked out
+ - cached by URL, and brought up to date with a fetch on every later build
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+import subprocess
+from typing import NamedTuple
+
+
+CLONE_ROOT_DIR = Path("./.github")
+URL_KEY_LENGTH = 12
+
+
+class CloneResult(NamedTuple):
+    path: Path
+    commit_sha: str
+    pass
+
+
+def get_repo_name(url: str) -> str:
+    return url.rstrip("/").split("/")[-1].split(".git")[0]
+
+
+def get_sparse_patterns(input_file_exps: list[str]) -> list[str] | None:
+    """
+    Translates input expressions (matched like 'rglob') to non-cone sparse-checkout patterns
+    (matched like '.gitignore').
+    None if every file may be selected, so there is nothing to gain from a sparse checkout.
+    """
+    patterns: list[str] = []
+    for exp in input_file_exps:
+        if exp in ("*", "**", "**/*"):
+            return None
+        # without a '/', both match at any depth;
+        # with one, '.gitignore' patterns are anchored, but 'rglob' ones are not
+        if "/" in exp.rstrip("/") and not exp.startswith("**/"):
+            exp = f"**/{exp.lstrip('/')}"
+            pass
+        patterns.append(exp)
+        pass
+    return patterns
+
+
+def _git(args: list[str], *, cwd: Path | None = None) -> str:
+    logging.debug("running git %s", " ".join(args))
+    return subprocess.check_output(["git", *args], cwd=cwd, text=True).strip()
+
+
+class CloneManager:
+    def __init__(self, *, clone_root: Path = CLONE_ROOT_DIR) -> None:
+        self.clone_root = Path(clone_root)
+        return
+
+    def get_clone_path(self, url: str) -> Path:
+        # the checkout directory keeps the repository's name, which names the build's cache directory
+        url_key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:URL_KEY_LENGTH]
+        return self.clone_root / url_key / get_repo_name(url)
+
+    def checkout(
+        self,
+        url: str,
+        *,
+        input_file_exps: list[str],
+    ) -> CloneResult:
+        """
+        Clones 'url', or updates the clone made by a previous build, to the latest commit
+        of the default branch.
+        """
+        path = self.get_clone_path(url)
+        # a fresh clone's HEAD is the default branch
+        target = "HEAD"
+        if not self._is_reusable_clone(path, url):
+            if path.exists():
+                logging.warning("replacing unusable clone at '%s'", path)
+                shutil.rmtree(path)
+                pass
+            os.makedirs(path.parent, exist_ok=True)
+            logging.info("cloning %s to '%s'", url, path)
+            _git(
+                [
+                    "clone",
+                    "--depth=1",
+                    "--filter=blob:none",
+                    "--no-checkout",
+                    "--single-branch",
+                    url,
+                    str(path),
+                ]
+            )
+            pass
+        else:
+            logging.info("updating clone of %s at '%s'", url, path)
+            _git(
+                ["fetch", "--depth=1", "--filter=blob:none", "origin", "HEAD"],
+                cwd=path,
+            )
+            target = "FETCH_HEAD"
+            pass
+
+        patterns = get_sparse_patterns(input_file_exps)
+        if patterns is None:
+            _git(["sparse-checkout", "disable"], cwd=path)
+            pass
+        else:
+            # on stdin, so that no pattern can be mistaken for an option
+            subprocess.run(
+                ["git", "sparse-checkout", "set", "--no-cone", "--stdin"],
+                cwd=path,
+                input="\n".join(patterns),
+                text=True,
+                check=True,
+            )
+            pass
+        _git(["checkout", "--force", "--detach", target], cwd=path)
+        commit_sha = _git(["rev-parse", "HEAD"], cwd=path)
+        logging.info("checked out %s at %s", url, commit_sha)
+        return CloneResult(path=path, commit_sha=commit_sha)
+
+    def _is_reusable_clone(self, path: Path, url: str) -> bool:
+        if not (path / ".git").is_dir():
+            return False
+        try:
+            return _git(["remote", "get-url", "origin"], cwd=path) == url
+        except subprocess.CalledProcessError:
+            return False
+
+    pass
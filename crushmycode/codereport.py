@@ -1,12 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import hashlib
 import logging
 from pathlib import Path
-from typing import NamedTuple
+import threading
+from typing import Callable, Iterable, NamedTuple, TypeVar
 
 from expert_llm.api import LlmApi
+from expert_llm.models import LlmChatClient, LlmResponse
 from expert_llm.remote.openai_shaped_client_implementations import OpenAIApiClient
 
-from minikg.build_output import BuildStepOutput_Package
-from minikg.logic.communities import get_all_descendant_node_ids
+from crushmycode import profiling
+from crushmycode.fragment_reader import FragmentReader
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.llm_cache import LlmResponseCache
+from crushmycode.prompt_budget import chunk_by_token_budget
+from crushmycode.ranking import GraphRanker, RankingMode
+from crushmycode.report_sections import (
+    SECTION_NAMES,
+    SECTION_TITLES,
+    ReportSection,
+    ReportSectionStore,
+    SectionFingerprint,
+    SectionInputs,
+    StoredSection,
+    get_inputs_digest,
+    get_key,
+    record_inputs,
+    recording_inputs,
+)
+from crushmycode.snapshot import KgSnapshot
+
+
+LLM_MODEL = "gpt-4o"
+NUM_CONSTRUCTS_PER_COMPONENT = 3
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 class CriticalComponents(NamedTuple):
@@ -20,32 +50,283 @@ class CodeReportBuilder:
         self,
         *,
         code_base_path: str,
-        pkg: BuildStepOutput_Package,
+        snapshot: KgSnapshot,
         num_critical_components: int = 5,
+        concurrency: int = 4,
+        llm_cache: LlmResponseCache | None = None,
+        ranking: RankingMode = "llm",
+        ranking_top_k: int = 30,
+        token_budget: int = 32_000,
+        max_context_bytes: int = 200_000,
+        hierarchy: CommunityHierarchyIndex | None = None,
+        llm_client: LlmChatClient | None = None,
+        section_store: ReportSectionStore | None = None,
+        reuse_sections: bool = True,
     ) -> None:
+        """
+        'ranking' decides how critical communities and code constructs are chosen:
+         - 'llm': the LLM ranks every candidate
+         - 'graph': candidates are ranked by graph centrality alone, with no LLM calls
+         - 'hybrid': graph centrality shortlists 'ranking_top_k' candidates for the LLM to rank
+
+        'token_budget' caps the (estimated) size of the candidate list in any one ranking prompt.
+        'max_context_bytes' caps the amount of source code sent for skillset extraction.
+        'llm_client' defaults to an OpenAI client for LLM_MODEL.
+        Every section is saved to 'section_store' as soon as it is done, and with 'reuse_sections',
+        sections whose inputs are unchanged since they were saved are not generated again.
+        """
         self.code_base_path = Path(code_base_path)
-        self.pkg = pkg
+        self.snapshot = snapshot
         self.num_critical_components = num_critical_components
-        self.llm_api = LlmApi(OpenAIApiClient("gpt-4o"))
+        self.concurrency = max(1, concurrency)
+        self.llm_api = LlmApi(llm_client or OpenAIApiClient(LLM_MODEL))
+        self.llm_cache = llm_cache
+        self.ranking = ranking
+        self.ranking_top_k = ranking_top_k
+        self.token_budget = token_budget
+        self.max_context_bytes = max_context_bytes
+        self.section_store = section_store
+        self.reuse_sections = reuse_sections
+        self.hierarchy = hierarchy or CommunityHierarchyIndex.build(
+            snapshot.communities,
+            snapshot.community_hierarchy[0] if snapshot.community_hierarchy else None,
+        )
+        self.ranker: GraphRanker | None = None
+        if ranking != "llm":
+            self.ranker = GraphRanker(
+                node_ids=snapshot.node_ids,
+                edges=snapshot.edges,
+            )
+            pass
+        # bounds the number of in-flight LLM requests across all report threads
+        self._llm_slots = threading.BoundedSemaphore(self.concurrency)
         return
 
-    def build_report(self) -> str:
-        executive_summary_content = self._get_executive_summary()
-        critical_components = self._get_critical_components()
-        skillset_requirements = self._get_skillset_requirements(critical_components)
+    def build_report(self, sections: Iterable[ReportSection] = SECTION_NAMES) -> str:
+        """
+        Only the given sections are included, though the skillset is derived from the components.
+        """
+        sections = [name for name in SECTION_NAMES if name in set(sections)]
+        contents: dict[ReportSection, str] = {}
+        # the executive summary is independent of the other sections,
+        # so it overlaps with the critical components -> skillset chain
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            executive_summary_future = None
+            if "executive" in sections:
+                executive_summary_future = ex.submit(
+                    contextvars.copy_context().run,
+                    self._get_section,
+                    "executive",
+                )
+                pass
+            if "components" in sections or "skills" in sections:
+                critical_components = self._get_section("components")
+                contents["components"] = critical_components.content
+                if "skills" in sections:
+                    contents["skills"] = self._get_section(
+                        "skills",
+                        code_node_ids=critical_components.fingerprint.code_node_ids,
+                    ).content
+                    pass
+                pass
+            if executive_summary_future:
+                contents["executive"] = executive_summary_future.result().content
+                pass
+            pass
         report_parts: list[str] = []
-        report_parts.append("# Executive Summary")
-        report_parts.append(executive_summary_content.strip())
-        report_parts.append("\n\n")
-        report_parts.append("# Major Modules and Components")
-        report_parts.append(critical_components.content.strip())
-        report_parts.append("\n\n")
-        report_parts.append("# Suggested Developer Skillset")
-        report_parts.append(skillset_requirements.strip())
+        for name in sections:
+            if report_parts:
+                report_parts.append("\n\n")
+                pass
+            report_parts.append(f"# {SECTION_TITLES[name]}")
+            report_parts.append(contents[name])
+            pass
         return "\n".join(report_parts)
 
+    def _get_section_key(
+        self,
+        name: ReportSection,
+        *,
+        code_node_ids: list[str],
+    ) -> str:
+        """
+        Covers what determines the section besides what it reads while it is generated.
+        """
+        if name == "executive":
+            return get_key(
+                section=name,
+                model=LLM_MODEL,
+                root_community_ids=self.snapshot.community_hierarchy[0],
+            )
+        if name == "components":
+            return get_key(
+                section=name,
+                model=LLM_MODEL,
+                num_critical_components=self.num_critical_components,
+                ranking=self.ranking,
+                ranking_top_k=self.ranking_top_k,
+                token_budget=self.token_budget,
+                candidate_community_ids=self._get_candidate_community_ids(),
+                # graph ranking depends on every edge
+                graph=self._get_graph_digest() if self.ranker else "",
+            )
+        return get_key(
+            section=name,
+            model=LLM_MODEL,
+            max_context_bytes=self.max_context_bytes,
+            code_node_ids=code_node_ids,
+        )
+
+    def _get_graph_digest(self) -> str:
+        h = hashlib.sha256()
+        h.update("\n".join(self.snapshot.node_ids).encode("utf-8"))
+        h.update(self.snapshot.edges.tobytes())
+        return h.hexdigest()
+
+    def _get_inputs_digest(
+        self,
+        *,
+        community_ids: list[str],
+        member_community_ids: list[str],
+        node_ids: list[str],
+        source_paths: list[str],
+    ) -> str | None:
+        return get_inputs_digest(
+            snapshot=self.snapshot,
+            hierarchy=self.hierarchy,
+            code_base_path=self.code_base_path,
+            community_ids=community_ids,
+            member_community_ids=member_community_ids,
+            node_ids=node_ids,
+            source_paths=source_paths,
+        )
+
+    def _get_section(
+        self,
+        name: ReportSection,
+        *,
+        code_node_ids: list[str] | None = None,
+    ) -> StoredSection:
+        """
+        'code_node_ids' are the code constructs of the components, for the skillset.
+        """
+        key = self._get_section_key(name, code_node_ids=code_node_ids or [])
+        if self.section_store and self.reuse_sections:
+            stored = self.section_store.load(name)
+            if stored and stored.fingerprint.key == key:
+                fingerprint = stored.fingerprint
+                digest = self._get_inputs_digest(
+                    community_ids=fingerprint.community_ids,
+                    member_community_ids=fingerprint.member_community_ids,
+                    node_ids=fingerprint.node_ids,
+                    source_paths=fingerprint.source_paths,
+                )
+                if digest == fingerprint.digest:
+                    logging.info("reusing report section '%s', its inputs are unchanged", name)
+                    return stored
+                pass
+            pass
+
+        logging.info("generating report section '%s'", name)
+        inputs = SectionInputs()
+        with recording_inputs(inputs), profiling.stage(f"report-{name}"):
+            section_node_ids: list[str] = []
+            if name == "executive":
+                content = self._get_executive_summary()
+                pass
+            elif name == "components":
+                critical_components = self._get_critical_components()
+                content = critical_components.content
+                section_node_ids = critical_components.code_node_ids
+                pass
+            else:
+                content = self._get_skillset_requirements(
+                    CriticalComponents(content="", code_node_ids=code_node_ids or [])
+                )
+                pass
+            pass
+        community_ids = sorted(inputs.community_ids)
+        member_community_ids = sorted(inputs.member_community_ids)
+        node_ids = sorted(inputs.node_ids)
+        source_paths = sorted(inputs.source_paths)
+        section = StoredSection(
+            content=content.strip(),
+            fingerprint=SectionFingerprint(
+                key=key,
+                community_ids=community_ids,
+                member_community_ids=member_community_ids,
+                node_ids=node_ids,
+                source_paths=source_paths,
+                digest=self._get_inputs_digest(
+                    community_ids=community_ids,
+                    member_community_ids=member_community_ids,
+                    node_ids=node_ids,
+                    source_paths=source_paths,
+                )
+                or "",
+                code_node_ids=section_node_ids,
+            ),
+        )
+        if self.section_store:
+            self.section_store.save(name, section)
+            pass
+        return section
+
+    def _completion(
+        self,
+        *,
+        req_name: str,
+        system: str,
+        user: str,
+        output_schema: dict | None = None,
+    ) -> LlmResponse:
+        cache_key = ""
+        if self.llm_cache:
+            cache_key = LlmResponseCache.get_key(
+                model=LLM_MODEL,
+                output_schema=output_schema,
+                req_name=req_name,
+                system=system,
+                user=user,
+            )
+            cached = self.llm_cache.get(cache_key)
+            if cached:
+                logging.debug("using cached response for %s", req_name)
+                with profiling.llm_call(req_name) as call:
+                    call["cached"] = True
+                    pass
+                return cached
+            pass
+        with self._llm_slots:
+            res = self.llm_api.completion(
+                output_schema=output_schema,
+                req_name=req_name,
+                system=system,
+                user=user,
+            )
+            pass
+        if self.llm_cache:
+            self.llm_cache.put(cache_key, res)
+            pass
+        return res
+
+    def _map(self, fn: Callable[[T], R], items: Iterable[T]) -> list[R]:
+        """
+        Like 'map', but runs up to 'concurrency' calls at once.
+        Results are returned in the order of 'items'.
+        """
+        items = list(items)
+        if self.concurrency == 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        # every call runs in a copy of the caller's context, which records the section's inputs
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+            return list(ex.map(lambda item: context.copy().run(fn, item), items))
+        pass
+
     def _format_community_for_context(self, community_id: str) -> str:
-        summaries = self.pkg.summaries_by_id[community_id]
+        record_inputs(community_ids=[community_id])
+        summaries = self.snapshot.summaries_by_id[community_id]
         name = summaries.get("name")
         purpose = summaries.get("purpose")
         if not name:
@@ -66,7 +347,7 @@ class CodeReportBuilder:
         - use the highest-level community summaries as context
         - delegate the summary mostly to the LLM
         """
-        top_level_community_ids = self.pkg.community_hierarchy[0]
+        top_level_community_ids = self.snapshot.community_hierarchy[0]
         context = "\n".join(
             [
                 self._format_community_for_context(community_id)
@@ -98,7 +379,7 @@ class CodeReportBuilder:
                 },
             },
         }
-        summary_res = self.llm_api.completion(
+        summary_res = self._completion(
             output_schema=schema,
             req_name="executive-summary",
             system=system_prompt,
@@ -113,19 +394,51 @@ class CodeReportBuilder:
             ]
         )
 
-    def _get_most_important_constructs(self, community_id: str) -> CriticalComponents:
-        descendant_node_ids = get_all_descendant_node_ids(
-            self.pkg.communities,
-            community_id,
+    def _format_construct_for_context(self, i: int, node_id: str) -> str:
+        record_inputs(node_ids=[node_id])
+        node_info = self.snapshot.node_details_by_id[node_id]
+        return "\n".join(
+            [
+                f'{i + 1}. {node_info["entity_type"]} {node_id}',
+                f' - {node_info["description"]}',
+                "\n",
+            ]
         )
 
-        node_context_lines: list[str] = []
-        for i, node_id in enumerate(descendant_node_ids):
-            node_info = self.pkg.G.nodes[node_id]
-            node_context_lines.append(f'{i + 1}. {node_info["entity_type"]} {node_id}')
-            node_context_lines.append(f' - {node_info["description"]}')
-            node_context_lines.append("\n")
-            pass
+    def _llm_rank_constructs(self, candidate_node_ids: list[str]) -> list[str]:
+        """
+        If the candidates do not fit in one prompt's token budget, they are ranked tournament-style:
+        budget-sized chunks are ranked in parallel, then the chunk winners are ranked again,
+        until the remaining candidates fit in a single prompt.
+        """
+        chunks = chunk_by_token_budget(
+            [
+                self._format_construct_for_context(i, node_id)
+                for i, node_id in enumerate(candidate_node_ids)
+            ],
+            token_budget=self.token_budget,
+            # guarantees that every round eliminates some candidates
+            min_chunk_size=NUM_CONSTRUCTS_PER_COMPONENT + 1,
+        )
+        if len(chunks) <= 1:
+            return self._llm_rank_constructs_single_prompt(candidate_node_ids)
+
+        logging.info(
+            "ranking %d code constructs in %d chunks",
+            len(candidate_node_ids),
+            len(chunks),
+        )
+        chunk_winners = self._map(
+            self._llm_rank_constructs_single_prompt,
+            [[candidate_node_ids[i] for i in chunk] for chunk in chunks],
+        )
+        return self._llm_rank_constructs(
+            [node_id for winners in chunk_winners for node_id in winners]
+        )
+
+    def _llm_rank_constructs_single_prompt(
+        self, candidate_node_ids: list[str]
+    ) -> list[str]:
         schema = {
             "type": "object",
             "properties": {
@@ -139,7 +452,7 @@ class CodeReportBuilder:
                 }
             },
         }
-        r = self.llm_api.completion(
+        r = self._completion(
             output_schema=schema,
             req_name="identify-important-code-components",
             system="\n".join(
@@ -149,18 +462,51 @@ class CodeReportBuilder:
                     "'Importance' can be defined as playing a major role in the ultimate functionality of the system.",
                 ]
             ),
-            user="\n".join(node_context_lines),
+            user="\n".join(
+                [
+                    self._format_construct_for_context(i, node_id)
+                    for i, node_id in enumerate(candidate_node_ids)
+                ]
+            ),
         )
         assert r.structured_output
-        chosen_node_ids = [
-            descendant_node_ids[i - 1]
+        chosen_node_ids = dict.fromkeys(
+            candidate_node_ids[int(i) - 1]
             for i in r.structured_output["most_important_code_construct_ids"]
-            if 1 <= i <= len(descendant_node_ids)
-        ]
+            if 1 <= i <= len(candidate_node_ids)
+        )
+        return list(chosen_node_ids)[:NUM_CONSTRUCTS_PER_COMPONENT]
+
+    def _get_most_important_constructs(self, community_id: str) -> CriticalComponents:
+        # sorted, so that prompts (and their cache keys) are stable across runs
+        record_inputs(member_community_ids=[community_id])
+        descendant_node_ids = sorted(
+            self.hierarchy.get_descendant_node_ids(community_id)
+        )
+
+        chosen_node_ids: list[str]
+        if self.ranker and self.ranking == "graph":
+            chosen_node_ids = self.ranker.rank_nodes(
+                descendant_node_ids,
+                top_k=NUM_CONSTRUCTS_PER_COMPONENT,
+            )
+            pass
+        elif self.ranker:
+            chosen_node_ids = self._llm_rank_constructs(
+                self.ranker.rank_nodes(
+                    descendant_node_ids,
+                    top_k=self.ranking_top_k,
+                )
+            )
+            pass
+        else:
+            chosen_node_ids = self._llm_rank_constructs(descendant_node_ids)
+            pass
 
         content_lines: list[str] = []
+        record_inputs(node_ids=chosen_node_ids)
         for node_id in chosen_node_ids:
-            node_info = self.pkg.G.nodes[node_id]
+            node_info = self.snapshot.node_details_by_id[node_id]
             content_lines.append(f"*_{node_info['entity_type']}_ {node_id}*")
             content_lines.append("\n")
             content_lines.append(f" - {node_info['description']}")
@@ -171,24 +517,82 @@ class CodeReportBuilder:
             content="\n".join(content_lines),
         )
 
+    def _get_candidate_community_ids(self) -> list[str]:
+        """
+        The highest level of the hierarchy with enough communities to choose from.
+        """
+        for level in self.snapshot.community_hierarchy:
+            if self.num_critical_components <= len(level):
+                return list(level)
+            pass
+        return [
+            community_id
+            for level in self.snapshot.community_hierarchy
+            for community_id in level
+        ]
+
     def _get_critical_components(self) -> CriticalComponents:
         """
         1. identify most important top-level communities
         2. for each important community, identify the 3 most important software constructs
         """
-        top_level_community_ids: list[str] = []
-        for i in range(len(self.pkg.community_hierarchy)):
-            if self.num_critical_components <= len(self.pkg.community_hierarchy[i]):
-                top_level_community_ids = self.pkg.community_hierarchy[i]
-                break
+        top_level_community_ids = self._get_candidate_community_ids()
+
+        most_important_community_ids: list[str]
+        if self.ranker and self.ranking == "graph":
+            most_important_community_ids = self._graph_rank_communities(
+                top_level_community_ids
+            )[: self.num_critical_components]
+            pass
+        elif self.ranker:
+            most_important_community_ids = self._llm_rank_communities(
+                self._graph_rank_communities(top_level_community_ids)[
+                    : self.ranking_top_k
+                ]
+            )
             pass
         else:
-            top_level_community_ids = [
-                community_id
-                for level in self.pkg.community_hierarchy
-                for community_id in level
-            ]
+            most_important_community_ids = self._llm_rank_communities(
+                top_level_community_ids
+            )
             pass
+
+        most_important_constructs_by_community = dict(
+            zip(
+                most_important_community_ids,
+                self._map(
+                    self._get_most_important_constructs,
+                    most_important_community_ids,
+                ),
+            )
+        )
+
+        # combine...
+        content_lines: list[str] = []
+        record_inputs(community_ids=most_important_community_ids)
+        for community_id in most_important_community_ids:
+            community_summaries = self.snapshot.summaries_by_id[community_id]
+            community_name = community_summaries.get("name", "")
+            content_lines.append(f"## {community_name}")
+            content_lines.append("\n")
+            content_lines.append(
+                most_important_constructs_by_community[community_id].content
+            )
+            content_lines.append("\n")
+            pass
+
+        return CriticalComponents(
+            code_node_ids=sorted(
+                set(
+                    node_id
+                    for critical_components in most_important_constructs_by_community.values()
+                    for node_id in critical_components.code_node_ids
+                )
+            ),
+            content="\n".join(content_lines),
+        )
+
+    def _llm_rank_communities(self, candidate_community_ids: list[str]) -> list[str]:
         important_communities_schema = {
             "type": "object",
             "properties": {
@@ -196,7 +600,7 @@ class CodeReportBuilder:
                     "description": f"The {self.num_critical_components + 2} most important sub-system IDs, in descending order of importance",
                     "items": {
                         "description": "Subsystem ID",
-                        "enum": top_level_community_ids,
+                        "enum": candidate_community_ids,
                         "type": "string",
                     },
                     "type": "array",
@@ -206,10 +610,10 @@ class CodeReportBuilder:
         important_communities_context = "\n".join(
             [
                 self._format_community_for_context(community_id)
-                for community_id in top_level_community_ids
+                for community_id in candidate_community_ids
             ]
         )
-        important_communities_res = self.llm_api.completion(
+        important_communities_res = self._completion(
             output_schema=important_communities_schema,
             req_name="identify-important-communities",
             system="\n".join(
@@ -222,41 +626,28 @@ class CodeReportBuilder:
             user=important_communities_context,
         )
         assert important_communities_res.structured_output
-        most_important_community_ids = important_communities_res.structured_output[
+        return important_communities_res.structured_output[
             "most_important_subsystems"
         ][: self.num_critical_components]
-        most_important_constructs_by_community = {
-            community_id: self._get_most_important_constructs(community_id)
-            for community_id in most_important_community_ids
-        }
 
-        # combine...
-        content_lines: list[str] = []
-        for community_id in most_important_community_ids:
-            community_summaries = self.pkg.summaries_by_id[community_id]
-            community_name = community_summaries.get("name", "")
-            content_lines.append(f"## {community_name}")
-            content_lines.append("\n")
-            content_lines.append(
-                most_important_constructs_by_community[community_id].content
+    def _graph_rank_communities(self, community_ids: list[str]) -> list[str]:
+        assert self.ranker
+        record_inputs(member_community_ids=community_ids)
+        scores = {
+            community_id: self.ranker.get_community_score(
+                self.hierarchy.get_descendant_node_ids(community_id)
             )
-            content_lines.append("\n")
-            pass
-
-        return CriticalComponents(
-            code_node_ids=list(
-                set(
-                    node_id
-                    for critical_components in most_important_constructs_by_community.values()
-                    for node_id in critical_components.code_node_ids
-                )
-            ),
-            content="\n".join(content_lines),
+            for community_id in community_ids
+        }
+        return sorted(
+            community_ids,
+            key=lambda community_id: (-scores[community_id], community_id),
         )
 
     def _get_skillset_requirements(self, critical_components: CriticalComponents):
+        record_inputs(node_ids=critical_components.code_node_ids)
         node_data: list[dict] = [
-            dict(self.pkg.G.nodes[node_id])
+            self.snapshot.node_details_by_id[node_id]
             for node_id in critical_components.code_node_ids
         ]
 
@@ -265,15 +656,22 @@ class CodeReportBuilder:
             for dat in node_data
         }
         context_lines: list[str] = []
-        for fragment in fragments.values():
-            context_lines.append(fragment["fragment_id"])
-            with open(self.code_base_path / fragment["source_path"], "r") as f:
-                content = f.read()
-                context_lines.append(
-                    content[fragment["start_line_incl"] : fragment["end_line_excl"]]
-                )
+        with FragmentReader(
+            base_path=self.code_base_path,
+            max_total_bytes=self.max_context_bytes,
+        ) as reader:
+            for fragment in fragments.values():
+                if reader.budget_exhausted:
+                    logging.warning(
+                        "source context budget of %d bytes exhausted, skipping remaining fragments",
+                        self.max_context_bytes,
+                    )
+                    break
+                record_inputs(source_paths=[fragment["source_path"]])
+                context_lines.append(fragment["fragment_id"])
+                context_lines.append(reader.read_fragment(fragment))
+                context_lines.append("")
                 pass
-            context_lines.append("")
             pass
 
         system_prompt = "\n".join(
@@ -316,7 +714,7 @@ class CodeReportBuilder:
                 },
             },
         }
-        res = self.llm_api.completion(
+        res = self._completion(
             output_schema=schema,
             req_name="identify-relevant-skillsets",
             system=system_prompt,
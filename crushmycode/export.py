@@ -0,0 +1,335 @@
+"""
+Exports a knowledge graph as tables, for querying alongside other data:
+ - nodes: 'id', 'entity_type', 'description', and the defining fragment's columns
+ - edges: 'source' and 'target' node IDs
+ - communities: 'id', 'parent_id', 'depth', 'child_community_ids' and 'child_node_ids'
+ - groups: 'id', 'child_group_ids', 'child_community_ids', 'name' and 'purpose'
+ - summaries: 'id', 'name' and 'purpose' of every summarized community or group
+
+Tables are read from the memory-mapped snapshot (see 'SnapshotTables') and written 'chunk_rows' rows
+at a time, so memory is bounded by one chunk plus a few integers per community, rather than by the graph.
+Only (re)building a missing or outdated snapshot loads the package whole.
+Tables are written as:
+ - 'ndjson', one JSON object per line
+ - 'parquet', one row group per chunk
+ - 'arrow', Arrow IPC files with one record batch per chunk, which can be memory-mapped
+   (e.g. 'pyarrow.ipc.open_file(pyarrow.memory_map(path))') and read without copying
+
+Parquet and Arrow need the optional 'pyarrow' package.
+An 'export.json' manifest lists the tables written, with their columns and row counts.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import IO, Any, Iterator, Literal, NamedTuple, get_args
+
+import numpy as np
+
+from crushmycode.snapshot import (
+    FRAGMENT_INT_FIELDS,
+    FRAGMENT_STRING_FIELDS,
+    SnapshotTables,
+)
+
+
+ExportFormat = Literal["ndjson", "parquet", "arrow"]
+ExportTable = Literal["nodes", "edges", "communities", "groups", "summaries"]
+ColumnType = Literal["string", "int", "string_list"]
+
+EXPORT_FORMATS: tuple[ExportFormat, ...] = get_args(ExportFormat)
+EXPORT_TABLES: tuple[ExportTable, ...] = get_args(ExportTable)
+DEFAULT_CHUNK_ROWS = 65_536
+MANIFEST_FILE_NAME = "export.json"
+EXPORT_VERSION = 1
+NODE_ATTRIBUTES = ("entity_type", "description")
+SUMMARY_FIELDS = ("name", "purpose")
+TABLE_COLUMNS: dict[ExportTable, tuple[tuple[str, ColumnType], ...]] = {
+    "nodes": (
+        ("id", "string"),
+        *((name, "string") for name in NODE_ATTRIBUTES),
+        *((name, "string") for name in FRAGMENT_STRING_FIELDS),
+        *((name, "int") for name in FRAGMENT_INT_FIELDS),
+    ),
+    "edges": (
+        ("source", "string"),
+        ("target", "string"),
+    ),
+    "communities": (
+        ("id", "string"),
+        ("parent_id", "string"),
+        ("depth", "int"),
+        ("child_community_ids", "string_list"),
+        ("child_node_ids", "string_list"),
+    ),
+    "groups": (
+        ("id", "string"),
+        ("child_group_ids", "string_list"),
+        ("child_community_ids", "string_list"),
+        *((name, "string") for name in SUMMARY_FIELDS),
+    ),
+    "summaries": (
+        ("id", "string"),
+        *((name, "string") for name in SUMMARY_FIELDS),
+    ),
+}
+
+# a chunk of a table: its columns, all of the same length
+Chunk = dict[str, list]
+
+
+class ExportedTable(NamedTuple):
+    name: ExportTable
+    path: str
+    rows: int
+    pass
+
+
+def _iter_ranges(n: int, chunk_rows: int) -> Iterator[tuple[int, int]]:
+    for start in range(0, n, chunk_rows):
+        yield start, min(start + chunk_rows, n)
+        pass
+    return
+
+
+def _iter_node_chunks(snapshot: SnapshotTables, chunk_rows: int) -> Iterator[Chunk]:
+    for start, stop in _iter_ranges(snapshot.n_nodes, chunk_rows):
+        chunk: Chunk = {"id": snapshot.get_node_ids(start=start, stop=stop)}
+        for name in NODE_ATTRIBUTES:
+            chunk[name] = snapshot.get_node_attribute(name, start=start, stop=stop)
+            pass
+        for name in (*FRAGMENT_STRING_FIELDS, *FRAGMENT_INT_FIELDS):
+            chunk[name] = snapshot.get_fragment_attribute(name, start=start, stop=stop)
+            pass
+        yield chunk
+        pass
+    return
+
+
+def _iter_edge_chunks(snapshot: SnapshotTables, chunk_rows: int) -> Iterator[Chunk]:
+    for start, stop in _iter_ranges(snapshot.n_edges, chunk_rows):
+        sources, targets = snapshot.get_edges(start=start, stop=stop)
+        yield {"source": sources, "target": targets}
+        pass
+    return
+
+
+def _iter_community_chunks(snapshot: SnapshotTables, chunk_rows: int) -> Iterator[Chunk]:
+    """
+    Communities the community hierarchy does not reach have no parent or depth.
+    """
+    parent, depth = snapshot.get_community_tree()
+    for start, stop in _iter_ranges(snapshot.n_communities, chunk_rows):
+        communities = snapshot.get_communities(start=start, stop=stop)
+        parents = parent[start:stop]
+        parent_ids = snapshot.get_community_ids(np.maximum(parents, 0))
+        yield {
+            "id": [community.id for community in communities],
+            "parent_id": [
+                parent_id if p >= 0 else None
+                for parent_id, p in zip(parent_ids, parents.tolist())
+            ],
+            "depth": [d if d >= 0 else None for d in depth[start:stop].tolist()],
+            "child_community_ids": [c.child_community_ids for c in communities],
+            "child_node_ids": [c.child_node_ids for c in communities],
+        }
+        pass
+    return
+
+
+def _iter_group_chunks(snapshot: SnapshotTables, chunk_rows: int) -> Iterator[Chunk]:
+    for start, stop in _iter_ranges(snapshot.n_groups, chunk_rows):
+        groups = snapshot.get_groups(start=start, stop=stop)
+        chunk: Chunk = {
+            "id": [group.group_id for group in groups],
+            "child_group_ids": [group.child_group_ids for group in groups],
+            "child_community_ids": [group.child_community_ids for group in groups],
+        }
+        for name in SUMMARY_FIELDS:
+            chunk[name] = [group.summary.get(name) for group in groups]
+            pass
+        yield chunk
+        pass
+    return
+
+
+def _iter_summary_chunks(snapshot: SnapshotTables, chunk_rows: int) -> Iterator[Chunk]:
+    for start, stop in _iter_ranges(snapshot.n_summaries, chunk_rows):
+        summaries = snapshot.get_summaries(start=start, stop=stop)
+        chunk: Chunk = {"id": [owner_id for owner_id, _ in summaries]}
+        for name in SUMMARY_FIELDS:
+            chunk[name] = [summary.get(name) for _, summary in summaries]
+            pass
+        yield chunk
+        pass
+    return
+
+
+class _NdjsonWriter:
+    def __init__(self, f: IO[bytes], table: ExportTable) -> None:
+        self.f = f
+        self.columns = [name for name, _ in TABLE_COLUMNS[table]]
+        return
+
+    def write(self, chunk: Chunk) -> None:
+        rows = zip(*(chunk[name] for name in self.columns))
+        self.f.write(
+            "".join(
+                json.dumps(dict(zip(self.columns, row))) + "\n" for row in rows
+            ).encode("utf-8")
+        )
+        return
+
+    def close(self) -> None:
+        return
+
+    pass
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise Exception(
+            "exporting to Parquet or Arrow needs pyarrow, install it with 'pip install pyarrow'"
+        ) from e
+    return pyarrow
+
+
+class _ArrowWriter:
+    """
+    Writes every chunk as one record batch of an Arrow IPC file, or one row group of a Parquet file.
+    """
+
+    def __init__(self, f: IO[bytes], table: ExportTable, *, fmt: ExportFormat) -> None:
+        pa = _import_pyarrow()
+        types = {
+            "string": pa.string(),
+            "int": pa.int64(),
+            "string_list": pa.list_(pa.string()),
+        }
+        self.schema = pa.schema(
+            [(name, types[column_type]) for name, column_type in TABLE_COLUMNS[table]]
+        )
+        self.pa = pa
+        self.writer: Any = (
+            pa.parquet.ParquetWriter(f, self.schema)
+            if fmt == "parquet"
+            else pa.ipc.new_file(f, self.schema)
+        )
+        return
+
+    def write(self, chunk: Chunk) -> None:
+        batch = self.pa.RecordBatch.from_pydict(chunk, schema=self.schema)
+        self.writer.write_batch(batch)
+        return
+
+    def close(self) -> None:
+        self.writer.close()
+        return
+
+    pass
+
+
+def _write_table(
+    path: Path,
+    *,
+    table: ExportTable,
+    fmt: ExportFormat,
+    chunks: Iterator[Chunk],
+) -> int:
+    """
+    Writes to a temporary file first, so that an interrupted export leaves no partial table behind.
+    Returns the number of rows written.
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    rows = 0
+    with open(tmp_path, "wb") as f:
+        writer = (
+            _NdjsonWriter(f, table)
+            if fmt == "ndjson"
+            else _ArrowWriter(f, table, fmt=fmt)
+        )
+        for chunk in chunks:
+            writer.write(chunk)
+            rows += len(next(iter(chunk.values())))
+            pass
+        writer.close()
+        pass
+    os.replace(tmp_path, path)
+    return rows
+
+
+def export_knowledge_graph(
+    *,
+    cache_dir: Path | str,
+    output_dir: Path | str,
+    fmt: ExportFormat = "ndjson",
+    tables: list[ExportTable] | None = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> list[ExportedTable]:
+    """
+    Writes '<output_dir>/<table>.<fmt>' for every table in 'tables' (all by default),
+    and the manifest.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise Exception(f"unknown export format '{fmt}', expected one of {list(EXPORT_FORMATS)}")
+    if chunk_rows < 1:
+        raise Exception("'chunk_rows' must be at least 1")
+    if fmt != "ndjson":
+        # fail before any work is done
+        _import_pyarrow()
+        pass
+    tables = tables or list(EXPORT_TABLES)
+    snapshot = SnapshotTables.open(cache_dir=cache_dir)
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    exported: list[ExportedTable] = []
+    for table in EXPORT_TABLES:
+        if table not in tables:
+            continue
+        chunks: Iterator[Chunk]
+        if table == "nodes":
+            chunks = _iter_node_chunks(snapshot, chunk_rows)
+            pass
+        elif table == "edges":
+            chunks = _iter_edge_chunks(snapshot, chunk_rows)
+            pass
+        elif table == "communities":
+            chunks = _iter_community_chunks(snapshot, chunk_rows)
+            pass
+        elif table == "groups":
+            chunks = _iter_group_chunks(snapshot, chunk_rows)
+            pass
+        else:
+            chunks = _iter_summary_chunks(snapshot, chunk_rows)
+            pass
+        path = output_dir / f"{table}.{fmt}"
+        logging.info("exporting %s to '%s'", table, path)
+        rows = _write_table(path, table=table, fmt=fmt, chunks=chunks)
+        exported.append(ExportedTable(name=table, path=path.name, rows=rows))
+        pass
+
+    with open(output_dir / MANIFEST_FILE_NAME, "w") as f:
+        json.dump(
+            {
+                "version": EXPORT_VERSION,
+                "format": fmt,
+                "tables": {
+                    table.name: {
+                        "path": table.path,
+                        "rows": table.rows,
+                        "columns": dict(TABLE_COLUMNS[table.name]),
+                    }
+                    for table in exported
+                },
+            },
+            f,
+            indent=2,
+        )
+        pass
+    return exported
@@ -0,0 +1,257 @@
+"""
+Selects the source files a build considers.
+
+This follows the semantics of minikg's own file selection
+('input_dir.rglob(exp)' for every input expression, then 'fnmatch' against every ignore expression),
+but compiles all expressions into one regular expression each,
+and never descends into a directory whose every file would be ignored.
+"""
+
+from fnmatch import translate
+import logging
+import os
+from pathlib import Path
+import re
+import subprocess
+from typing import NamedTuple
+
+
+# never selected, whatever the expressions
+ALWAYS_PRUNED_DIR_NAMES = {".git"}
+# a directory can be pruned if an ignore expression matches these "files" in it,
+# which no expression could match without matching every possible file name
+_PRUNE_PROBES = ("\x00", "\x00\x00/\x00\x00\x00")
+
+
+class FileSelection(NamedTuple):
+    # relative to the input directory
+    paths: list[Path]
+    n_skipped_files: int
+    n_pruned_dirs: int
+    pass
+
+
+def _translate_component(component: str) -> str:
+    """
+    Regex for one path component of a glob, where nothing matches '/'.
+    """
+    regex: list[str] = []
+    i = 0
+    while i < len(component):
+        c = component[i]
+        i += 1
+        if c == "*":
+            regex.append("[^/]*")
+            continue
+        if c == "?":
+            regex.append("[^/]")
+            continue
+        if c == "[":
+            end = component.find("]", i + 1 if component[i : i + 1] in "!]" else i)
+            if end < 0:
+                regex.append(re.escape(c))
+                continue
+            body = component[i:end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+                pass
+            elif body.startswith("^"):
+                body = "\\" + body
+                pass
+            regex.append(f"[{body}]")
+            i = end + 1
+            continue
+        regex.append(re.escape(c))
+        pass
+    return "".join(regex)
+
+
+def _translate_path_glob(exp: str) -> str:
+    """
+    Regex for a glob matched component-wise, as 'Path.glob' does:
+    '*' and '?' stay within one component, '**' spans any number of components.
+    """
+    parts: list[str] = []
+    components = exp.split("/")
+    for i, component in enumerate(components):
+        is_last = i == len(components) - 1
+        if component == "**":
+            parts.append(".*" if is_last else "(?:.*/)?")
+            continue
+        component_regex = _translate_component(component)
+        parts.append(component_regex if is_last else f"{component_regex}/")
+        pass
+    return "".join(parts)
+
+
+def compile_input_exps(exps: list[str]) -> re.Pattern:
+    """
+    'rglob(exp)' matches files whose trailing path components match 'exp'.
+    """
+    if not exps:
+        return re.compile(r"(?!)")
+    return re.compile(
+        "|".join(f"(?:(?:.*/)?{_translate_path_glob(exp)}\\Z)" for exp in exps),
+        re.DOTALL,
+    )
+
+
+def compile_ignore_exps(exps: list[str]) -> re.Pattern:
+    """
+    'fnmatch' against the whole relative path, where '*' also matches '/'.
+    """
+    if not exps:
+        return re.compile(r"(?!)")
+    return re.compile("|".join(translate(exp) for exp in exps))
+
+
+class FileSelector:
+    def __init__(
+        self,
+        *,
+        input_file_exps: list[str],
+        ignore_file_exps: list[str],
+        use_gitignore: bool = False,
+    ) -> None:
+        self.input_regex = compile_input_exps(input_file_exps)
+        self.ignore_regex = compile_ignore_exps(ignore_file_exps)
+        self.use_gitignore = use_gitignore
+        return
+
+    def is_selected(self, rel_path: str) -> bool:
+        return bool(
+            self.input_regex.match(rel_path) and not self.ignore_regex.match(rel_path)
+        )
+
+    def is_pruned_dir(self, rel_dir: str) -> bool:
+        return all(
+            self.ignore_regex.match(f"{rel_dir}/{probe}") for probe in _PRUNE_PROBES
+        )
+
+    def select(self, input_dir: Path) -> FileSelection:
+        input_dir = Path(input_dir)
+        selection: FileSelection | None = None
+        if self.use_gitignore:
+            selection = self._select_with_git(input_dir)
+            pass
+        if selection is None:
+            selection = self._select_by_walking(input_dir)
+            pass
+        logging.info(
+            "selected %d source files, skipped %d files and %d ignored directories",
+            len(selection.paths),
+            selection.n_skipped_files,
+            selection.n_pruned_dirs,
+        )
+        return selection
+
+    def _select_by_walking(self, input_dir: Path) -> FileSelection:
+        paths: list[Path] = []
+        n_skipped_files = 0
+        n_pruned_dirs = 0
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                entries = list(os.scandir(input_dir / rel_dir))
+            except OSError as e:
+                logging.warning("could not list '%s': %s", input_dir / rel_dir, e)
+                continue
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                # like 'rglob', do not follow symlinked directories
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in ALWAYS_PRUNED_DIR_NAMES or self.is_pruned_dir(
+                        rel_path
+                    ):
+                        n_pruned_dirs += 1
+                        continue
+                    stack.append(rel_path)
+                    continue
+                if not entry.is_file():
+                    continue
+                if self.is_selected(rel_path):
+                    paths.append(Path(rel_path))
+                    pass
+                else:
+                    n_skipped_files += 1
+                    pass
+                pass
+            pass
+        paths.sort()
+        return FileSelection(
+            paths=paths,
+            n_skipped_files=n_skipped_files,
+            n_pruned_dirs=n_pruned_dirs,
+        )
+
+    def _select_with_git(self, input_dir: Path) -> FileSelection | None:
+        """
+        Lists tracked and untracked-but-not-ignored files with git, which honours
+        every '.gitignore' (and '.git/info/exclude'), instead of walking the tree.
+        None if 'input_dir' is not in a git checkout.
+        """
+        try:
+            out = subprocess.check_output(
+                [
+                    "git",
+                    "ls-files",
+                    "--cached",
+                    "--others",
+                    "--exclude-standard",
+                    "-z",
+                ],
+                cwd=input_dir,
+                stderr=subprocess.DEVNULL,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            logging.warning(
+                "'%s' is not a git checkout, so .gitignore files cannot be honoured",
+                input_dir,
+            )
+            return None
+        paths: list[Path] = []
+        n_skipped_files = 0
+        pruned_dirs: dict[str, bool] = {}
+        for raw in out.split(b"\0"):
+            if not raw:
+                continue
+            rel_path = raw.decode("utf-8", errors="surrogateescape")
+            if self._is_in_pruned_dir(rel_path, pruned_dirs):
+                continue
+            if self.is_selected(rel_path) and (input_dir / rel_path).is_file():
+                paths.append(Path(rel_path))
+                pass
+            else:
+                n_skipped_files += 1
+                pass
+            pass
+        # git lists files rather than directories, so pruning only saves matching here
+        paths.sort()
+        return FileSelection(
+            paths=paths,
+            n_skipped_files=n_skipped_files,
+            n_pruned_dirs=sum(pruned_dirs.values()),
+        )
+
+    def _is_in_pruned_dir(self, rel_path: str, pruned_dirs: dict[str, bool]) -> bool:
+        """
+        'pruned_dirs' remembers the decision for every directory seen so far.
+        """
+        parts = rel_path.split("/")[:-1]
+        # outermost first, so that nothing below a pruned directory is ever checked
+        for i in range(1, len(parts) + 1):
+            rel_dir = "/".join(parts[:i])
+            is_pruned = pruned_dirs.get(rel_dir)
+            if is_pruned is None:
+                is_pruned = parts[i - 1] in ALWAYS_PRUNED_DIR_NAMES or self.is_pruned_dir(
+                    rel_dir
+                )
+                pruned_dirs[rel_dir] = is_pruned
+                pass
+            if is_pruned:
+                return True
+            pass
+        return False
+
+    pass
@@ -0,0 +1,133 @@
+import logging
+import mmap
+from pathlib import Path
+import threading
+
+import numpy as np
+
+
+class _IndexedFile:
+    def __init__(self, path: Path) -> None:
+        self.mm: mmap.mmap | None = None
+        buf: bytes | mmap.mmap = b""
+        with open(path, "rb") as f:
+            # zero-length files cannot be memory-mapped
+            if f.seek(0, 2):
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                buf = self.mm
+                pass
+            pass
+        self.buf = buf
+        newlines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == ord("\n"))
+        # byte offset at which each line starts, plus the end of the file
+        self.line_starts = np.concatenate([[0], newlines + 1, [len(buf)]])
+        if self.line_starts[-2] == len(buf):
+            # trailing newline, no extra (empty) last line
+            self.line_starts = self.line_starts[:-1]
+            pass
+        return
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.line_starts) - 1
+
+    def get_byte_range(self, start_line_incl: int, end_line_excl: int) -> tuple[int, int]:
+        start_line_incl = min(max(start_line_incl, 0), self.n_lines)
+        end_line_excl = min(max(end_line_excl, start_line_incl), self.n_lines)
+        return (
+            int(self.line_starts[start_line_incl]),
+            int(self.line_starts[end_line_excl]),
+        )
+
+    def close(self) -> None:
+        if self.mm:
+            self.mm.close()
+            pass
+        return
+
+    pass
+
+
+class FragmentReader:
+    """
+    Reads line ranges ('fragments') of source files under 'base_path'.
+
+    Each file is opened and memory-mapped once, and its newline offsets are indexed,
+    so every fragment is a single slice of the mapped file.
+    When 'max_total_bytes' is set, reads stop once that much text has been returned.
+    """
+
+    def __init__(
+        self,
+        *,
+        base_path: Path,
+        max_total_bytes: int | None = None,
+    ) -> None:
+        self.base_path = Path(base_path)
+        self.max_total_bytes = max_total_bytes
+        self.total_bytes = 0
+        self._files: dict[str, _IndexedFile] = {}
+        self._lock = threading.Lock()
+        return
+
+    def __enter__(self) -> "FragmentReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+        return
+
+    @property
+    def budget_exhausted(self) -> bool:
+        return (
+            self.max_total_bytes is not None
+            and self.total_bytes >= self.max_total_bytes
+        )
+
+    def read_lines(
+        self,
+        source_path: str,
+        start_line_incl: int,
+        end_line_excl: int,
+    ) -> str:
+        """
+        Returns the given lines of 'source_path', truncated to whatever remains of the byte budget.
+        """
+        with self._lock:
+            indexed = self._get_indexed_file(source_path)
+            lo, hi = indexed.get_byte_range(start_line_incl, end_line_excl)
+            if self.max_total_bytes is not None:
+                hi = min(hi, lo + max(self.max_total_bytes - self.total_bytes, 0))
+                pass
+            self.total_bytes += hi - lo
+            raw = indexed.buf[lo:hi]
+            pass
+        # a truncated read may split a multi-byte character
+        return raw.decode("utf-8", errors="ignore")
+
+    def read_fragment(self, fragment: dict) -> str:
+        return self.read_lines(
+            fragment["source_path"],
+            fragment["start_line_incl"],
+            fragment["end_line_excl"],
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            for indexed in self._files.values():
+                indexed.close()
+                pass
+            self._files.clear()
+            pass
+        return
+
+    def _get_indexed_file(self, source_path: str) -> _IndexedFile:
+        indexed = self._files.get(source_path)
+        if indexed is None:
+            logging.debug("indexing source file %s", source_path)
+            indexed = _IndexedFile(self.base_path / source_path)
+            self._files[source_path] = indexed
+            pass
+        return indexed
+
+    pass
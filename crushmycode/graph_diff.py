@@ -0,0 +1,629 @@
+"""
+Structural diff between two builds of a knowledge graph: code nodes added, removed or redescribed,
+and communities matched across the builds by the code nodes they contain.
+
+Community IDs are not stable between builds, so communities are matched by the similarity of
+their descendant node sets, without comparing every pair:
+ - every community gets a MinHash signature of its descendant nodes, computed bottom-up over the
+   'CommunityHierarchyIndex' in a few vectorized passes
+ - locality-sensitive hashing (bands of signature rows) pairs up only the communities likely to be similar
+ - candidates are matched one-to-one, most similar first, on their estimated Jaccard similarity
+
+An old community whose nodes now make up several new communities was split,
+and a new community that takes in several old ones is the result of a merge.
+Parts are found by exact containment: the communities of the other build that the nodes of
+a community fall into, counted up their ancestor chains.
+Similarities are estimates; whether the members of a matched community changed at all is exact.
+"""
+
+import json
+from typing import NamedTuple
+
+import numpy as np
+
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.snapshot import KgSnapshot
+
+
+NUM_PERMUTATIONS = 128
+ROWS_PER_BAND = 2
+# the permutations hashed at once, to bound memory on large graphs
+PERMUTATION_CHUNK = 32
+MERSENNE_PRIME = (1 << 31) - 1
+# matched communities are at least this similar
+MATCH_MIN_JACCARD = 0.5
+# the share of a smaller community that must lie in a larger one to count as a part of a split or merge
+PART_MIN_CONTAINMENT = 0.8
+# buckets holding more pairs than this are ignored as uninformative
+MAX_BUCKET_PAIRS = 10_000
+NODE_FIELDS = ("entity_type", "description")
+MAX_LISTED_ITEMS = 50
+SEED = 0
+# highlights in the graph of the new build
+ADDED_COLOR = "#2ca02c"
+CHANGED_COLOR = "#ff7f0e"
+SPLIT_OR_MERGED_COLOR = "#9467bd"
+
+
+class NodeChange(NamedTuple):
+    node_id: str
+    field: str
+    old: str | None
+    new: str | None
+    pass
+
+
+class CommunityMatch(NamedTuple):
+    old_id: str
+    new_id: str
+    # estimated
+    jaccard: float
+    old_size: int
+    new_size: int
+    membership_changed: bool
+    summary_changed: bool
+    pass
+
+
+class CommunitySplit(NamedTuple):
+    old_id: str
+    new_ids: list[str]
+    pass
+
+
+class CommunityMerge(NamedTuple):
+    old_ids: list[str]
+    new_id: str
+    pass
+
+
+class GraphDiff(NamedTuple):
+    nodes_added: list[str]
+    nodes_removed: list[str]
+    nodes_changed: list[NodeChange]
+    # only the matches whose members or summary changed
+    communities_changed: list[CommunityMatch]
+    num_communities_unchanged: int
+    communities_split: list[CommunitySplit]
+    communities_merged: list[CommunityMerge]
+    communities_added: list[str]
+    communities_removed: list[str]
+    pass
+
+
+class _Signatures(NamedTuple):
+    # (n_communities, NUM_PERMUTATIONS) minima of the permuted node hashes
+    minhash: np.ndarray
+    # order-independent hash of the descendant nodes, for exact comparison
+    set_hash: np.ndarray
+    # number of descendant nodes
+    size: np.ndarray
+    pass
+
+
+def _get_signatures(
+    hierarchy: CommunityHierarchyIndex,
+    *,
+    node_keys: np.ndarray,
+    node_hashes: np.ndarray,
+    coefs: np.ndarray,
+) -> _Signatures:
+    """
+    'node_keys' and 'node_hashes' are per position in 'hierarchy.node_ids'.
+    Each community's direct nodes are one run of positions, reduced at once;
+    then the minima and sums are carried up from the deepest communities to their parents.
+    """
+    n = len(hierarchy.community_ids)
+    minhash = np.full((n, NUM_PERMUTATIONS), MERSENNE_PRIME, dtype=np.uint64)
+    set_hash = np.zeros(n, dtype=np.uint64)
+    owner = hierarchy.node_owner
+    if len(owner):
+        # positions are laid out in pre-order, so each community's direct nodes are contiguous
+        run_starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+        run_owners = owner[run_starts]
+        for lo in range(0, NUM_PERMUTATIONS, PERMUTATION_CHUNK):
+            a = coefs[0, lo : lo + PERMUTATION_CHUNK]
+            b = coefs[1, lo : lo + PERMUTATION_CHUNK]
+            permuted = (node_keys[:, None] * a[None, :] + b[None, :]) % MERSENNE_PRIME
+            minhash[run_owners, lo : lo + PERMUTATION_CHUNK] = np.minimum.reduceat(
+                permuted, run_starts, axis=0
+            )
+            pass
+        set_hash[run_owners] = np.add.reduceat(node_hashes, run_starts)
+        pass
+    depth = hierarchy.depth
+    for d in range(int(depth.max()) if n else 0, 0, -1):
+        children = np.flatnonzero(depth == d)
+        parents = hierarchy.parent[children]
+        np.minimum.at(minhash, parents, minhash[children])
+        np.add.at(set_hash, parents, set_hash[children])
+        pass
+    return _Signatures(
+        minhash=minhash,
+        set_hash=set_hash,
+        size=(hierarchy.node_hi - hierarchy.node_lo).astype(np.int64),
+    )
+
+
+def _get_candidate_pairs(old_minhash: np.ndarray, new_minhash: np.ndarray) -> np.ndarray:
+    """
+    (k, 2) array of (old, new) community indexes sharing at least one band of their signatures.
+    """
+    n_old = len(old_minhash)
+    if not n_old or not len(new_minhash):
+        return np.zeros((0, 2), dtype=np.int64)
+    sides = np.r_[np.zeros(n_old, dtype=np.int8), np.ones(len(new_minhash), dtype=np.int8)]
+    indexes = np.r_[np.arange(n_old), np.arange(len(new_minhash))]
+    minhash = np.concatenate([old_minhash, new_minhash])
+    pair_keys: list[np.ndarray] = []
+    for lo in range(0, NUM_PERMUTATIONS, ROWS_PER_BAND):
+        # rows are below 2^31, so two rows pack into one key
+        band_keys = minhash[:, lo] << np.uint64(32)
+        if ROWS_PER_BAND > 1:
+            band_keys = band_keys | minhash[:, lo + 1]
+            pass
+        for row in range(lo + 2, lo + ROWS_PER_BAND):
+            band_keys = band_keys * np.uint64(1_000_003) ^ minhash[:, row]
+            pass
+        # olds before news within every bucket
+        order = np.lexsort((sides, band_keys))
+        keys, s, ix = band_keys[order], sides[order], indexes[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+        n_olds = np.add.reduceat((s == 0).astype(np.int64), starts)
+        n_news = (ends - starts) - n_olds
+        n_pairs = n_olds * n_news
+        valid = (n_pairs > 0) & (n_pairs <= MAX_BUCKET_PAIRS)
+        if not valid.any():
+            continue
+        starts, n_olds, n_news, n_pairs = (
+            starts[valid],
+            n_olds[valid],
+            n_news[valid],
+            n_pairs[valid],
+        )
+        # the cross product of olds and news in every bucket
+        bucket = np.repeat(np.arange(len(starts)), n_pairs)
+        t = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+        old_i = ix[starts[bucket] + t // n_news[bucket]]
+        new_i = ix[starts[bucket] + n_olds[bucket] + t % n_news[bucket]]
+        pair_keys.append(old_i.astype(np.int64) * len(new_minhash) + new_i)
+        pass
+    if not pair_keys:
+        return np.zeros((0, 2), dtype=np.int64)
+    unique_keys = np.unique(np.concatenate(pair_keys))
+    return np.stack(
+        [unique_keys // len(new_minhash), unique_keys % len(new_minhash)], axis=1
+    )
+
+
+def _estimate_jaccard(
+    old_minhash: np.ndarray, new_minhash: np.ndarray, pairs: np.ndarray
+) -> np.ndarray:
+    jaccard = np.zeros(len(pairs))
+    for lo in range(0, len(pairs), 100_000):
+        chunk = pairs[lo : lo + 100_000]
+        jaccard[lo : lo + len(chunk)] = (
+            old_minhash[chunk[:, 0]] == new_minhash[chunk[:, 1]]
+        ).mean(axis=1)
+        pass
+    return jaccard
+
+
+def _get_node_changes(old: KgSnapshot, new: KgSnapshot) -> list[NodeChange]:
+    changes: list[NodeChange] = []
+    for field in NODE_FIELDS:
+        old_values = dict(zip(old.node_ids, old.get_node_attribute(field)))
+        for node_id, new_value in zip(new.node_ids, new.get_node_attribute(field)):
+            if node_id not in old_values:
+                continue
+            old_value = old_values[node_id]
+            if old_value != new_value:
+                changes.append(
+                    NodeChange(node_id=node_id, field=field, old=old_value, new=new_value)
+                )
+                pass
+            pass
+        pass
+    return changes
+
+
+def _get_parts(
+    whole_hierarchy: CommunityHierarchyIndex,
+    part_hierarchy: CommunityHierarchyIndex,
+    *,
+    part_owner: np.ndarray,
+    wholes: list[int],
+) -> dict[int, list[int]]:
+    """
+    'part_owner' is, per position in 'whole_hierarchy.node_ids', the community of 'part_hierarchy'
+    directly containing that node, or -1.
+    For every whole, its outermost parts with at least PART_MIN_CONTAINMENT of their nodes inside it,
+    if there are at least 2.
+    """
+    parent = part_hierarchy.parent
+    part_lo = part_hierarchy.node_lo
+    part_hi = part_hierarchy.node_hi
+    parts_by_whole: dict[int, list[int]] = {}
+    for whole in wholes:
+        whole_lo, whole_hi = int(whole_hierarchy.node_lo[whole]), int(whole_hierarchy.node_hi[whole])
+        owners = part_owner[whole_lo:whole_hi]
+        owners = owners[owners >= 0]
+        if len(owners) < 2:
+            continue
+        owner_ids, owner_counts = np.unique(owners, return_counts=True)
+        # the owners and all their ancestors, up each chain
+        candidates = [owner_ids]
+        up = parent[owner_ids]
+        while True:
+            up = np.unique(up[up >= 0])
+            if not len(up):
+                break
+            candidates.append(up)
+            up = parent[up]
+            pass
+        candidates = np.unique(np.concatenate(candidates))
+        # in pre-order, an owner is in the subtree of 'c' iff its first node position is in c's node range
+        owner_lo = part_lo[owner_ids]
+        cumulative = np.r_[0, np.cumsum(owner_counts)]
+        inside = (
+            cumulative[np.searchsorted(owner_lo, part_hi[candidates])]
+            - cumulative[np.searchsorted(owner_lo, part_lo[candidates])]
+        )
+        part_size = (part_hi - part_lo)[candidates]
+        is_contained = inside >= PART_MIN_CONTAINMENT * part_size
+        jaccard = inside / (whole_hi - whole_lo + part_size - inside)
+        # a part inside another part is not an outermost part;
+        # in pre-order, the parts inside a part directly follow it, within its subtree range
+        parts: list[int] = []
+        last_end = -1
+        for part in candidates[is_contained].tolist():
+            if part < last_end:
+                continue
+            parts.append(part)
+            last_end = int(part_hierarchy.subtree_end[part])
+            pass
+        if len(parts) < 2:
+            continue
+        # the whole grown or shrunk is not split or merged: one of its parts is nearly the whole,
+        # or the smallest community holding all the parts (the last one in pre-order) is a match of it
+        if (jaccard[is_contained] >= PART_MIN_CONTAINMENT).any():
+            continue
+        holds_all = (candidates <= parts[0]) & (
+            part_hierarchy.subtree_end[candidates] > parts[-1]
+        )
+        if holds_all.any() and jaccard[np.flatnonzero(holds_all)[-1]] > MATCH_MIN_JACCARD:
+            continue
+        parts_by_whole[whole] = parts
+        pass
+    return parts_by_whole
+
+
+def _get_part_owner(
+    whole_hierarchy: CommunityHierarchyIndex, part_hierarchy: CommunityHierarchyIndex
+) -> np.ndarray:
+    positions = np.array(
+        [part_hierarchy.node_position.get(node_id, -1) for node_id in whole_hierarchy.node_ids],
+        dtype=np.int64,
+    )
+    return np.where(positions >= 0, part_hierarchy.node_owner[positions], -1)
+
+
+def diff_snapshots(
+    *,
+    old: KgSnapshot,
+    new: KgSnapshot,
+    old_hierarchy: CommunityHierarchyIndex,
+    new_hierarchy: CommunityHierarchyIndex,
+) -> GraphDiff:
+    old_node_ids = set(old.node_ids)
+    new_node_ids = set(new.node_ids)
+
+    # the same random key for a node in both builds
+    universe: dict[str, int] = {}
+    for node_ids in (old_hierarchy.node_ids, new_hierarchy.node_ids):
+        for node_id in node_ids:
+            universe.setdefault(node_id, len(universe))
+            pass
+        pass
+    rng = np.random.default_rng(SEED)
+    universe_keys = rng.integers(0, MERSENNE_PRIME, size=len(universe), dtype=np.uint64)
+    universe_hashes = rng.integers(
+        0, np.iinfo(np.uint64).max, size=len(universe), dtype=np.uint64, endpoint=True
+    )
+    coefs = rng.integers(1, MERSENNE_PRIME, size=(2, NUM_PERMUTATIONS), dtype=np.uint64)
+    signatures: list[_Signatures] = []
+    for hierarchy in (old_hierarchy, new_hierarchy):
+        positions = np.array(
+            [universe[node_id] for node_id in hierarchy.node_ids], dtype=np.int64
+        )
+        signatures.append(
+            _get_signatures(
+                hierarchy,
+                node_keys=universe_keys[positions],
+                node_hashes=universe_hashes[positions],
+                coefs=coefs,
+            )
+        )
+        pass
+    old_sig, new_sig = signatures
+
+    # communities without nodes have no signature to match; they match by ID only
+    old_nonempty = np.flatnonzero(old_sig.size > 0)
+    new_nonempty = np.flatnonzero(new_sig.size > 0)
+    pairs = _get_candidate_pairs(
+        old_sig.minhash[old_nonempty], new_sig.minhash[new_nonempty]
+    )
+    pairs = np.stack([old_nonempty[pairs[:, 0]], new_nonempty[pairs[:, 1]]], axis=1)
+    jaccard = _estimate_jaccard(old_sig.minhash, new_sig.minhash, pairs)
+
+    # splits and merges first, so that their largest parts are not taken for matches;
+    # parts are found by exact containment, as they are too dissimilar to the whole for LSH to pair them.
+    # A community with the exact same nodes in the other build is neither split nor merged.
+    old_sets = list(zip(old_sig.set_hash.tolist(), old_sig.size.tolist()))
+    new_sets = list(zip(new_sig.set_hash.tolist(), new_sig.size.tolist()))
+    old_set_keys, new_set_keys = set(old_sets), set(new_sets)
+    splits = _get_parts(
+        old_hierarchy,
+        new_hierarchy,
+        part_owner=_get_part_owner(old_hierarchy, new_hierarchy),
+        wholes=[o for o, key in enumerate(old_sets) if key not in new_set_keys],
+    )
+    merges = _get_parts(
+        new_hierarchy,
+        old_hierarchy,
+        part_owner=_get_part_owner(new_hierarchy, old_hierarchy),
+        wholes=[n for n, key in enumerate(new_sets) if key not in old_set_keys],
+    )
+    split_parts = set(n for parts in splits.values() for n in parts)
+    merge_parts = set(o for parts in merges.values() for o in parts)
+
+    old_ids = old_hierarchy.community_ids
+    new_ids = new_hierarchy.community_ids
+    # most similar first, preferring the same ID, then the same depth
+    same_id = np.array([old_ids[o] == new_ids[n] for o, n in pairs.tolist()], dtype=bool)
+    depth_gap = np.abs(old_hierarchy.depth[pairs[:, 0]] - new_hierarchy.depth[pairs[:, 1]])
+    order = np.lexsort((depth_gap, ~same_id, -jaccard))
+    matched_old: dict[int, int] = {}
+    matched_new: set[int] = set()
+    for k in order.tolist():
+        if jaccard[k] < MATCH_MIN_JACCARD:
+            break
+        o, n = pairs[k].tolist()
+        if o in matched_old or n in matched_new or o in splits or n in merges:
+            continue
+        matched_old[o] = n
+        matched_new.add(n)
+        pass
+    # what is left matches by ID, including the communities without nodes
+    new_index = new_hierarchy.community_index
+    for o, old_id in enumerate(old_ids):
+        n = new_index.get(old_id)
+        if (
+            n is None
+            or o in matched_old
+            or n in matched_new
+            or o in splits
+            or n in merges
+        ):
+            continue
+        matched_old[o] = n
+        matched_new.add(n)
+        pass
+
+    changed: list[CommunityMatch] = []
+    for o, n in sorted(matched_old.items()):
+        membership_changed = bool(
+            old_sig.set_hash[o] != new_sig.set_hash[n] or old_sig.size[o] != new_sig.size[n]
+        )
+        summary_changed = old.summaries_by_id.get(old_ids[o]) != new.summaries_by_id.get(
+            new_ids[n]
+        )
+        if membership_changed or summary_changed:
+            changed.append(
+                CommunityMatch(
+                    old_id=old_ids[o],
+                    new_id=new_ids[n],
+                    jaccard=float(
+                        (old_sig.minhash[o] == new_sig.minhash[n]).mean()
+                    ),
+                    old_size=int(old_sig.size[o]),
+                    new_size=int(new_sig.size[n]),
+                    membership_changed=membership_changed,
+                    summary_changed=summary_changed,
+                )
+            )
+            pass
+        pass
+
+    return GraphDiff(
+        nodes_added=[node_id for node_id in new.node_ids if node_id not in old_node_ids],
+        nodes_removed=[node_id for node_id in old.node_ids if node_id not in new_node_ids],
+        nodes_changed=_get_node_changes(old, new),
+        communities_changed=changed,
+        num_communities_unchanged=len(matched_old) - len(changed),
+        communities_split=[
+            CommunitySplit(old_id=old_ids[o], new_ids=[new_ids[n] for n in parts])
+            for o, parts in sorted(splits.items())
+        ],
+        communities_merged=[
+            CommunityMerge(old_ids=[old_ids[o] for o in parts], new_id=new_ids[n])
+            for n, parts in sorted(merges.items())
+        ],
+        communities_added=[
+            new_ids[n]
+            for n in range(len(new_ids))
+            if n not in matched_new and n not in merges and n not in split_parts
+        ],
+        communities_removed=[
+            old_ids[o]
+            for o in range(len(old_ids))
+            if o not in matched_old and o not in splits and o not in merge_parts
+        ],
+    )
+
+
+def _load(cache_dir: str) -> tuple[KgSnapshot, CommunityHierarchyIndex]:
+    snapshot = KgSnapshot.load_or_build(cache_dir=cache_dir)
+    hierarchy = CommunityHierarchyIndex.load_or_build(
+        cache_dir=cache_dir,
+        communities=snapshot.communities,
+        root_ids=snapshot.community_hierarchy[0],
+    )
+    return snapshot, hierarchy
+
+
+def diff_packages(
+    *,
+    old_cache_dir: str,
+    new_cache_dir: str,
+) -> tuple[GraphDiff, KgSnapshot, KgSnapshot]:
+    """
+    Also returns both snapshots, for rendering the diff.
+    """
+    old, old_hierarchy = _load(old_cache_dir)
+    new, new_hierarchy = _load(new_cache_dir)
+    diff = diff_snapshots(
+        old=old,
+        new=new,
+        old_hierarchy=old_hierarchy,
+        new_hierarchy=new_hierarchy,
+    )
+    return diff, old, new
+
+
+def get_diff_json(diff: GraphDiff) -> str:
+    data = diff._asdict()
+    for field in (
+        "nodes_changed",
+        "communities_changed",
+        "communities_split",
+        "communities_merged",
+    ):
+        data[field] = [item._asdict() for item in data[field]]
+        pass
+    return json.dumps(data, indent=2)
+
+
+def _get_community_name(snapshot: KgSnapshot, community_id: str) -> str:
+    summary = snapshot.summaries_by_id.get(community_id)
+    if not summary or not summary.get("name"):
+        return f"`{community_id}`"
+    return f"{summary['name']} (`{community_id}`)"
+
+
+def _get_listed(lines: list[str]) -> list[str]:
+    if len(lines) <= MAX_LISTED_ITEMS:
+        return lines
+    return [
+        *lines[:MAX_LISTED_ITEMS],
+        f" - ... and {len(lines) - MAX_LISTED_ITEMS} more",
+    ]
+
+
+def render_markdown(diff: GraphDiff, *, old: KgSnapshot, new: KgSnapshot) -> str:
+    """
+    Lists at most MAX_LISTED_ITEMS of every kind of change; the JSON output has them all.
+    """
+    sections: list[tuple[str, list[str]]] = [
+        (
+            "Code nodes added",
+            [f" - `{node_id}`" for node_id in diff.nodes_added],
+        ),
+        (
+            "Code nodes removed",
+            [f" - `{node_id}`" for node_id in diff.nodes_removed],
+        ),
+        (
+            "Code nodes changed",
+            [
+                f" - `{change.node_id}` {change.field}: {change.old!r} -> {change.new!r}"
+                for change in diff.nodes_changed
+            ],
+        ),
+        (
+            "Communities split",
+            [
+                f" - {_get_community_name(old, split.old_id)} -> "
+                + ", ".join(_get_community_name(new, new_id) for new_id in split.new_ids)
+                for split in diff.communities_split
+            ],
+        ),
+        (
+            "Communities merged",
+            [
+                " - "
+                + ", ".join(_get_community_name(old, old_id) for old_id in merge.old_ids)
+                + f" -> {_get_community_name(new, merge.new_id)}"
+                for merge in diff.communities_merged
+            ],
+        ),
+        (
+            "Communities changed",
+            [
+                f" - {_get_community_name(old, match.old_id)} -> "
+                f"{_get_community_name(new, match.new_id)}: "
+                + ", ".join(
+                    [
+                        *(
+                            [
+                                f"members changed ({match.old_size} -> {match.new_size} nodes, "
+                                f"~{match.jaccard:.0%} similar)"
+                            ]
+                            if match.membership_changed
+                            else []
+                        ),
+                        *(["summary changed"] if match.summary_changed else []),
+                    ]
+                )
+                for match in diff.communities_changed
+            ],
+        ),
+        (
+            "Communities added",
+            [f" - {_get_community_name(new, cid)}" for cid in diff.communities_added],
+        ),
+        (
+            "Communities removed",
+            [f" - {_get_community_name(old, cid)}" for cid in diff.communities_removed],
+        ),
+    ]
+    lines = [
+        "# Knowledge Graph Diff",
+        "",
+        f" - code nodes: {len(old.node_ids)} -> {len(new.node_ids)}",
+        f" - communities: {len(old.communities)} -> {len(new.communities)},"
+        f" {diff.num_communities_unchanged} unchanged",
+    ]
+    for title, items in sections:
+        if not items:
+            continue
+        lines.extend(["", f"## {title} ({len(items)})", "", *_get_listed(items)])
+        pass
+    return "\n".join(lines) + "\n"
+
+
+def get_highlight_colors(diff: GraphDiff) -> dict[str, str]:
+    """
+    Colors for the nodes of the new graph that differ from the old one.
+    """
+    colors: dict[str, str] = {}
+    for change in diff.nodes_changed:
+        colors[change.node_id] = CHANGED_COLOR
+        pass
+    for match in diff.communities_changed:
+        colors[match.new_id] = CHANGED_COLOR
+        pass
+    for split in diff.communities_split:
+        for new_id in split.new_ids:
+            colors[new_id] = SPLIT_OR_MERGED_COLOR
+            pass
+        pass
+    for merge in diff.communities_merged:
+        colors[merge.new_id] = SPLIT_OR_MERGED_COLOR
+        pass
+    for node_id in [*diff.nodes_added, *diff.communities_added]:
+        colors[node_id] = ADDED_COLOR
+        pass
+    return colors
+
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+LAYOUT_CACHE_DIR_NAME = "viz-layout"
+MAX_CACHED_LAYOUTS = 4
+# minimum distances between rings, and between neighbouring nodes on a ring
+RING_GAP = 250.0
+NODE_GAP = 60.0
+
+
+def _gather_children(
+    frontier: np.ndarray,
+    child_ptr: np.ndarray,
+    children: np.ndarray,
+) -> np.ndarray:
+    starts = child_ptr[frontier]
+    counts = child_ptr[frontier + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    # index of every child slot, without a python-level loop over the frontier
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return children[offsets + np.arange(total)]
+
+
+def _get_children_csr(parent: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    has_parent = np.flatnonzero(parent >= 0)
+    children = has_parent[np.argsort(parent[has_parent], kind="stable")]
+    child_ptr = np.zeros(len(parent) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(parent[has_parent], minlength=len(parent)), out=child_ptr[1:])
+    return child_ptr, children
+
+
+def _get_levels(
+    parent: np.ndarray,
+    child_ptr: np.ndarray,
+    children: np.ndarray,
+) -> tuple[np.ndarray, list[np.ndarray]]:
+    depth = np.full(len(parent), -1, dtype=np.int64)
+    levels: list[np.ndarray] = []
+    frontier = np.flatnonzero(parent < 0)
+    while len(frontier):
+        depth[frontier] = len(levels)
+        levels.append(frontier)
+        frontier = _gather_children(frontier, child_ptr, children)
+        frontier = frontier[depth[frontier] < 0]
+        pass
+    return depth, levels
+
+
+def radial_tree_layout(n: int, edges: np.ndarray) -> np.ndarray:
+    """
+    Lays out a (mostly tree-shaped) graph as concentric rings around its roots,
+    with one ring per depth.
+    Every node gets an angular wedge proportional to the number of leaves below it,
+    nested inside its parent's wedge, so subtrees never overlap.
+
+    'edges' is an (m, 2) array of (parent, child) indexes; a node with several parents
+    is placed under the first one.
+    Returns an (n, 2) array of coordinates.
+    """
+    if not n:
+        return np.zeros((0, 2))
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+
+    parent = np.full(n, -1, dtype=np.int64)
+    targets, first_edge = np.unique(edges[:, 1], return_index=True)
+    parent[targets] = edges[first_edge, 0]
+
+    # breadth-first levels; a node that is unreachable (in a cycle) is cut loose as an extra root
+    while True:
+        child_ptr, children = _get_children_csr(parent)
+        depth, levels = _get_levels(parent, child_ptr, children)
+        unvisited = np.flatnonzero(depth < 0)
+        if not len(unvisited):
+            break
+        parent[unvisited[0]] = -1
+        pass
+
+    # leaf counts, bottom-up
+    n_children = np.diff(child_ptr)
+    leaves = (n_children == 0).astype(float)
+    for level in reversed(levels[1:]):
+        np.add.at(leaves, parent[level], leaves[level])
+        pass
+
+    # angular wedges, top-down
+    wedge_start = np.zeros(n)
+    wedge_span = np.zeros(n)
+    for i, level in enumerate(levels):
+        if i == 0:
+            spans = 2 * math.pi * leaves[level] / leaves[level].sum()
+            wedge_span[level] = spans
+            wedge_start[level] = np.cumsum(spans) - spans
+            continue
+        level = level[np.argsort(parent[level], kind="stable")]
+        level_parents = parent[level]
+        level_leaves = leaves[level]
+        cum = np.cumsum(level_leaves)
+        _, group_first = np.unique(level_parents, return_index=True)
+        group_sizes = np.diff(np.append(group_first, len(level)))
+        # leaves of earlier siblings, within each parent
+        preceding = cum - level_leaves - np.repeat(cum[group_first] - level_leaves[group_first], group_sizes)
+        scale = wedge_span[level_parents] / leaves[level_parents]
+        wedge_start[level] = wedge_start[level_parents] + preceding * scale
+        wedge_span[level] = level_leaves * scale
+        pass
+
+    # ring radii grow with depth, and with how crowded each ring is
+    radii = np.zeros(len(levels))
+    for i, level in enumerate(levels):
+        crowded = len(level) * NODE_GAP / (2 * math.pi) if len(level) > 1 else 0.0
+        radii[i] = max(crowded, radii[i - 1] + RING_GAP if i else 0.0)
+        pass
+    theta = wedge_start + wedge_span / 2
+    r = radii[depth]
+    return np.stack([r * np.cos(theta), r * np.sin(theta)], axis=1)
+
+
+def _get_layout_key(node_ids: list[str], edges: np.ndarray) -> str:
+    h = hashlib.sha256()
+    h.update("\n".join(node_ids).encode("utf-8"))
+    h.update(np.ascontiguousarray(edges, dtype=np.int64).tobytes())
+    return h.hexdigest()[:32]
+
+
+def load_or_compute_layout(
+    *,
+    cache_dir: Path | str | None,
+    node_ids: list[str],
+    edges: np.ndarray,
+) -> np.ndarray:
+    """
+    Layouts are cached in 'cache_dir' by a hash of the graph they were computed for.
+    """
+    if not cache_dir:
+        return radial_tree_layout(len(node_ids), edges)
+    layout_dir = Path(cache_dir) / LAYOUT_CACHE_DIR_NAME
+    layout_path = layout_dir / f"{_get_layout_key(node_ids, edges)}.npy"
+    if layout_path.exists():
+        try:
+            positions = np.load(layout_path)
+            if positions.shape == (len(node_ids), 2):
+                logging.debug("using cached layout %s", layout_path)
+                return positions
+            pass
+        except (OSError, ValueError) as e:
+            logging.error("failed to load cached layout %s: %s", layout_path, e)
+            pass
+        pass
+
+    positions = radial_tree_layout(len(node_ids), edges)
+    os.makedirs(layout_dir, exist_ok=True)
+    tmp_path = layout_path.with_name(f"{layout_path.stem}.{os.getpid()}.tmp.npy")
+    np.save(tmp_path, positions.astype(np.float32))
+    os.replace(tmp_path, layout_path)
+
+    # only keep the most recent layouts
+    cached = sorted(layout_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime)
+    for stale_path in cached[:-MAX_CACHED_LAYOUTS]:
+        stale_path.unlink(missing_ok=True)
+        pass
+    return positions
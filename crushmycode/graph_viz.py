@@ -1,7 +1,23 @@
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Literal
+
 from minikg.models import Community, Group
 
+from crushmycode import profiling
+from crushmycode.graph_layout import load_or_compute_layout
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.pruning import GraphSelection, HiddenChildren
+from crushmycode.vis_writer import VisNetworkWriter
+
 
 MAX_WORDS_PER_LINE = 10
+# with 'auto' layout, graphs at least this large are laid out ahead of time
+# instead of by the browser's physics simulation
+AUTO_LAYOUT_MIN_NODES = 1000
+AGGREGATE_NODE_COLOR = "#cccccc"
+
+LayoutMode = Literal["auto", "physics", "radial"]
 
 
 def _format_title(text: str) -> str:
@@ -13,101 +29,267 @@ def _format_title(text: str) -> str:
     return "\n".join([" ".join(words) for words in line_words])
 
 
-def draw_communities_graph(
+def get_group_node_options(group: Group) -> dict[str, str]:
+    return {
+        "label": group.summary["name"],
+        "title": _format_title(group.summary["purpose"]),
+    }
+
+
+def get_community_node_options(
+    community: Community,
+    com_summaries: dict[str, dict[str, str]],
+) -> dict[str, str]:
+    community_title = _format_title(com_summaries[community.id]["purpose"])
+    child_node_blurb = (
+        ""
+        if not community.child_node_ids
+        else "\n".join(
+            [
+                "Code components:",
+                *[f" - {node_id}" for node_id in community.child_node_ids],
+            ]
+        )
+    )
+    return {
+        "label": com_summaries[community.id]["name"],
+        "title": "\n".join(
+            [
+                com_summaries[community.id]["name"],
+                community_title,
+                child_node_blurb,
+            ]
+        ),
+    }
+
+
+def get_aggregate_node_id(community_id: str) -> str:
+    return f"{community_id}::+more"
+
+
+def get_group_aggregate_node_id(group_id: str | None) -> str:
+    """
+    Apart from 'get_aggregate_node_id', as the first clustering round's input groups share
+    the IDs of the root communities.
+    """
+    return f"{group_id or ''}::+more-communities"
+
+
+def get_aggregate_node_options(hidden: HiddenChildren) -> dict[str, str]:
+    parts = [
+        f"{count} {kind}"
+        for count, kind in [
+            (hidden.communities, "communities"),
+            (hidden.code_nodes, "code components"),
+        ]
+        if count
+    ]
+    return {
+        "label": f"+{hidden.communities + hidden.code_nodes} more",
+        "title": f"Less important: {', '.join(parts)}",
+        "color": AGGREGATE_NODE_COLOR,
+    }
+
+
+def get_code_node_options(node_details: dict[str, str]) -> dict[str, str]:
+    return {
+        "title": _format_title(
+            "\n".join(
+                [
+                    node_details["entity_type"],
+                    node_details["description"],
+                ]
+            )
+        ),
+    }
+
+
+def _get_color_option(node_id: str, node_colors: Mapping[str, str]) -> dict[str, str]:
+    color = node_colors.get(node_id)
+    return {"color": color} if color else {}
+
+
+def build_communities_network(
     *,
     groups: dict[str, Group],
     communities: dict[str, Community],
     com_summaries: dict[str, dict[str, str]],
-    node_details_by_id: dict[str, dict[str, str]],
-    outfile_name: str,
+    node_details_by_id: Mapping[str, dict],
     include_nodes: bool = False,
-):
-    from pyvis.network import Network
+    hierarchy: CommunityHierarchyIndex | None = None,
+    layout: LayoutMode = "auto",
+    layout_cache_dir: Path | str | None = None,
+    node_colors: Mapping[str, str] | None = None,
+    selection: GraphSelection | None = None,
+) -> VisNetworkWriter:
+    """
+    'node_colors' overrides the color of some nodes, by ID, to highlight them.
+    With a 'selection' (see 'crushmycode.pruning'), only the communities and code nodes in it are drawn,
+    and the children left out of every community are drawn as one '+N more' node,
+    as are the top-level communities left out under every group.
+    """
+    hierarchy = hierarchy or CommunityHierarchyIndex.build(communities)
+    # parents before children
+    ordered_communities = [
+        communities[community_id]
+        for community_id in hierarchy.community_ids
+        if selection is None or community_id in selection.community_ids
+    ]
+
+    def is_drawn(node_id: str) -> bool:
+        return (
+            selection is None
+            or node_id in selection.community_ids
+            or node_id in selection.code_node_ids
+        )
 
-    net = Network()
+    net = VisNetworkWriter()
+    node_colors = node_colors or {}
 
     # NODES
-    for group in groups.values():
-        net.add_node(
-            group.group_id,
-            label=group.summary["name"],
-            title=_format_title(group.summary["purpose"]),
-        )
-        pass
+    with profiling.stage("graph-nodes"):
+        for group in groups.values():
+            net.add_node(
+                group.group_id,
+                **get_group_node_options(group),
+                **_get_color_option(group.group_id, node_colors),
+            )
+            pass
 
-    for community in communities.values():
-        community_title = _format_title(com_summaries[community.id]["purpose"])
-        child_node_blurb = (
-            ""
-            if not community.child_node_ids
-            else "\n".join(
-                [
-                    "Code components:",
-                    *[f" - {node_id}" for node_id in community.child_node_ids],
-                ]
+        for community in ordered_communities:
+            net.add_node(
+                community.id,
+                **get_community_node_options(community, com_summaries),
+                **_get_color_option(community.id, node_colors),
             )
-        )
-        net.add_node(
-            community.id,
-            label=com_summaries[community.id]["name"],
-            title="\n".join(
-                [
-                    com_summaries[community.id]["name"],
-                    community_title,
-                    child_node_blurb,
-                ]
-            ),
-        )
-        if not include_nodes:
-            continue
-        for code_node_id in community.child_node_ids:
-            node_details = node_details_by_id[code_node_id]
+            if not include_nodes:
+                continue
+            for code_node_id in community.child_node_ids:
+                if not is_drawn(code_node_id):
+                    continue
+                net.add_node(
+                    code_node_id,
+                    **get_code_node_options(node_details_by_id[code_node_id]),
+                    **_get_color_option(code_node_id, node_colors),
+                )
+                pass
+            pass
+        for community_id, hidden in (
+            selection.hidden_by_community.items() if selection else []
+        ):
             net.add_node(
-                code_node_id,
-                title=_format_title(
-                    "\n".join(
-                        [
-                            node_details["entity_type"],
-                            node_details["description"],
-                        ]
-                    )
+                get_aggregate_node_id(community_id),
+                **get_aggregate_node_options(hidden),
+            )
+            pass
+        for group_id, count in selection.hidden_by_group.items() if selection else []:
+            net.add_node(
+                get_group_aggregate_node_id(group_id),
+                **get_aggregate_node_options(
+                    HiddenChildren(communities=count, code_nodes=0)
                 ),
             )
             pass
         pass
 
     # EDGES
-    for group in groups.values():
-        for child_group_id in group.child_group_ids:
-            net.add_edge(
-                group.group_id,
-                child_group_id,
-            )
+    with profiling.stage("graph-edges"):
+        for group in groups.values():
+            for child_group_id in group.child_group_ids:
+                net.add_edge(
+                    group.group_id,
+                    child_group_id,
+                )
+                pass
+            for child_com_id in group.child_community_ids:
+                if is_drawn(child_com_id):
+                    net.add_edge(
+                        group.group_id,
+                        child_com_id,
+                    )
+                    pass
+                pass
+            if selection is None:
+                continue
+            # the shallowest communities drawn hang off their group, even below '--min-depth'
+            for top_id in selection.top_community_ids_by_group.get(group.group_id, []):
+                if top_id != group.group_id:
+                    net.add_edge(group.group_id, top_id)
+                    pass
+                pass
+            if group.group_id in selection.hidden_by_group:
+                net.add_edge(group.group_id, get_group_aggregate_node_id(group.group_id))
+                pass
             pass
-        for child_com_id in group.child_community_ids:
-            net.add_edge(
-                group.group_id,
-                child_com_id,
-            )
+
+        for community in ordered_communities:
+            for child_com_id in community.child_community_ids:
+                if not is_drawn(child_com_id):
+                    continue
+                net.add_edge(
+                    community.id,
+                    child_com_id,
+                )
+                pass
+            if selection and community.id in selection.hidden_by_community:
+                net.add_edge(community.id, get_aggregate_node_id(community.id))
+                pass
+            if not include_nodes:
+                continue
+            for child_node_id in community.child_node_ids:
+                if not is_drawn(child_node_id):
+                    continue
+                net.add_edge(
+                    community.id,
+                    child_node_id,
+                )
+                pass
             pass
         pass
 
-    for community in communities.values():
-        for child_com_id in community.child_community_ids:
-            net.add_edge(
-                community.id,
-                child_com_id,
-            )
-            pass
-        if not include_nodes:
-            continue
-        for child_node_id in community.child_node_ids:
-            net.add_edge(
-                community.id,
-                child_node_id,
+    with profiling.stage("graph-layout"):
+        if layout == "radial" or (
+            layout == "auto" and net.n_nodes >= AUTO_LAYOUT_MIN_NODES
+        ):
+            net.set_positions(
+                load_or_compute_layout(
+                    cache_dir=layout_cache_dir,
+                    node_ids=net.node_ids,
+                    edges=net.get_edge_index_pairs(),
+                )
             )
             pass
         pass
+    return net
 
-    net.show(outfile_name, notebook=False)
+
+def draw_communities_graph(
+    *,
+    groups: dict[str, Group],
+    communities: dict[str, Community],
+    com_summaries: dict[str, dict[str, str]],
+    node_details_by_id: Mapping[str, dict],
+    outfile_name: str,
+    include_nodes: bool = False,
+    hierarchy: CommunityHierarchyIndex | None = None,
+    layout: LayoutMode = "auto",
+    layout_cache_dir: Path | str | None = None,
+    node_colors: Mapping[str, str] | None = None,
+    selection: GraphSelection | None = None,
+):
+    net = build_communities_network(
+        groups=groups,
+        communities=communities,
+        com_summaries=com_summaries,
+        node_details_by_id=node_details_by_id,
+        include_nodes=include_nodes,
+        hierarchy=hierarchy,
+        layout=layout,
+        layout_cache_dir=layout_cache_dir,
+        node_colors=node_colors,
+        selection=selection,
+    )
+    with profiling.stage("graph-write-html"), open(outfile_name, "w") as f:
+        net.write_html(f)
+        pass
     pass
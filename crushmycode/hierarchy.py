@@ -0,0 +1,249 @@
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from minikg.models import Community
+
+from crushmycode.kgcache import get_package_fingerprint, pack_strings, unpack_strings
+
+
+INDEX_FILE_NAME = "hierarchy-index.npz"
+
+
+class CommunityHierarchyIndex:
+    """
+    Precomputed index over the community tree.
+
+    Communities are numbered in depth-first pre-order (an Euler tour of the tree),
+    so the subtree of the community numbered 'i' is the contiguous range [i, subtree_end[i]).
+    Code node IDs are laid out in the same order, so all descendant nodes of a community
+    are the contiguous slice node_ids[node_lo[i] : node_hi[i]].
+
+    This answers:
+     - descendant nodes of a community in O(k)
+     - ancestors of a node in O(depth)
+     - depth of a community, and whether one community contains another, in O(1)
+    """
+
+    def __init__(
+        self,
+        *,
+        community_ids: list[str],
+        parent: np.ndarray,
+        depth: np.ndarray,
+        subtree_end: np.ndarray,
+        node_lo: np.ndarray,
+        node_hi: np.ndarray,
+        node_ids: list[str],
+        node_owner: np.ndarray,
+    ) -> None:
+        self.community_ids = community_ids
+        self.parent = parent
+        self.depth = depth
+        self.subtree_end = subtree_end
+        self.node_lo = node_lo
+        self.node_hi = node_hi
+        self.node_ids = node_ids
+        # index of the community that directly contains the node at each position
+        self.node_owner = node_owner
+        self.community_index = {
+            community_id: i for i, community_id in enumerate(community_ids)
+        }
+        self.node_position: dict[str, int] = {}
+        for i, node_id in enumerate(node_ids):
+            self.node_position.setdefault(node_id, i)
+            pass
+        return
+
+    @classmethod
+    def build(
+        cls,
+        communities: dict[str, Community],
+        root_ids: list[str] | None = None,
+    ) -> "CommunityHierarchyIndex":
+        """
+        'root_ids' defaults to every community that is not the child of another.
+        """
+        if root_ids is None:
+            child_ids = set(
+                child_id
+                for community in communities.values()
+                for child_id in community.child_community_ids
+            )
+            root_ids = [
+                community_id
+                for community_id in communities
+                if community_id not in child_ids
+            ]
+            pass
+
+        community_ids: list[str] = []
+        parent: list[int] = []
+        depth: list[int] = []
+        node_ids: list[str] = []
+        node_owner: list[int] = []
+        n = len(communities)
+        subtree_end = np.zeros(n, dtype=np.int32)
+        node_lo = np.zeros(n, dtype=np.int64)
+        node_hi = np.zeros(n, dtype=np.int64)
+        seen: set[str] = set()
+
+        # iterative DFS; a 'None' entry marks the exit from the last entered community
+        stack: list[tuple[str | None, int, int]] = [
+            (root_id, -1, 0) for root_id in reversed(root_ids)
+        ]
+        exits: list[int] = []
+        while stack:
+            community_id, parent_i, d = stack.pop()
+            if community_id is None:
+                i = exits.pop()
+                subtree_end[i] = len(community_ids)
+                node_hi[i] = len(node_ids)
+                continue
+            if community_id in seen:
+                logging.warning(
+                    "community %s has more than one parent, indexing it under the first only",
+                    community_id,
+                )
+                continue
+            seen.add(community_id)
+            i = len(community_ids)
+            community = communities[community_id]
+            community_ids.append(community_id)
+            parent.append(parent_i)
+            depth.append(d)
+            node_lo[i] = len(node_ids)
+            node_ids.extend(community.child_node_ids)
+            node_owner.extend([i] * len(community.child_node_ids))
+            exits.append(i)
+            stack.append((None, -1, -1))
+            for child_id in reversed(community.child_community_ids):
+                stack.append((child_id, i, d + 1))
+                pass
+            pass
+
+        n_indexed = len(community_ids)
+        if n_indexed < n:
+            logging.warning(
+                "%d communities are unreachable from the roots and were not indexed",
+                n - n_indexed,
+            )
+            pass
+        return cls(
+            community_ids=community_ids,
+            parent=np.array(parent, dtype=np.int32),
+            depth=np.array(depth, dtype=np.int32),
+            subtree_end=subtree_end[:n_indexed],
+            node_lo=node_lo[:n_indexed],
+            node_hi=node_hi[:n_indexed],
+            node_ids=node_ids,
+            node_owner=np.array(node_owner, dtype=np.int32),
+        )
+
+    @classmethod
+    def load_or_build(
+        cls,
+        *,
+        cache_dir: Path | str,
+        communities: dict[str, Community],
+        root_ids: list[str] | None = None,
+    ) -> "CommunityHierarchyIndex":
+        """
+        Loads the index persisted in 'cache_dir', (re)building it if the package has changed since.
+        """
+        index_path = Path(cache_dir) / INDEX_FILE_NAME
+        fingerprint = get_package_fingerprint(cache_dir)
+        if fingerprint and index_path.exists():
+            try:
+                loaded = cls.load(index_path)
+                if loaded[1] == fingerprint:
+                    return loaded[0]
+                pass
+            except Exception as e:
+                logging.error("failed to load hierarchy index %s: %s", index_path, e)
+                pass
+            pass
+        index = cls.build(communities, root_ids)
+        if fingerprint:
+            index.save(index_path, fingerprint=fingerprint)
+            pass
+        return index
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["CommunityHierarchyIndex", str]:
+        """
+        Returns the index and the package fingerprint it was built from.
+        """
+        with np.load(path) as data:
+            index = cls(
+                community_ids=unpack_strings(
+                    data["community_ids_buf"], data["community_ids_offsets"]
+                ),
+                parent=data["parent"],
+                depth=data["depth"],
+                subtree_end=data["subtree_end"],
+                node_lo=data["node_lo"],
+                node_hi=data["node_hi"],
+                node_ids=unpack_strings(data["node_ids_buf"], data["node_ids_offsets"]),
+                node_owner=data["node_owner"],
+            )
+            return index, str(data["fingerprint"])
+        pass
+
+    def save(self, path: Path, *, fingerprint: str) -> None:
+        community_ids_buf, community_ids_offsets = pack_strings(self.community_ids)
+        node_ids_buf, node_ids_offsets = pack_strings(self.node_ids)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp_path,
+            fingerprint=np.array(fingerprint),
+            community_ids_buf=community_ids_buf,
+            community_ids_offsets=community_ids_offsets,
+            parent=self.parent,
+            depth=self.depth,
+            subtree_end=self.subtree_end,
+            node_lo=self.node_lo,
+            node_hi=self.node_hi,
+            node_ids_buf=node_ids_buf,
+            node_ids_offsets=node_ids_offsets,
+            node_owner=self.node_owner,
+        )
+        os.replace(tmp_path, path)
+        return
+
+    def get_descendant_node_ids(self, community_id: str) -> list[str]:
+        i = self.community_index[community_id]
+        descendants = self.node_ids[self.node_lo[i] : self.node_hi[i]]
+        # a node may be a direct child of more than one community
+        return list(dict.fromkeys(descendants))
+
+    def get_depth(self, community_id: str) -> int:
+        return int(self.depth[self.community_index[community_id]])
+
+    def get_parent_id(self, community_id: str) -> str | None:
+        parent_i = int(self.parent[self.community_index[community_id]])
+        return self.community_ids[parent_i] if parent_i >= 0 else None
+
+    def get_ancestor_community_ids(self, node_id: str) -> list[str]:
+        """
+        Communities containing 'node_id', innermost first.
+        """
+        position = self.node_position.get(node_id)
+        if position is None:
+            return []
+        ancestors: list[str] = []
+        i = int(self.node_owner[position])
+        while i >= 0:
+            ancestors.append(self.community_ids[i])
+            i = int(self.parent[i])
+            pass
+        return ancestors
+
+    def contains(self, ancestor_id: str, community_id: str) -> bool:
+        a = self.community_index[ancestor_id]
+        c = self.community_index[community_id]
+        return a <= c < self.subtree_end[a]
+
+    pass
@@ -0,0 +1,124 @@
+"""
+Structural importance of code nodes, for deciding what to draw when a graph is too large to draw whole.
+
+Scores are computed over the snapshot's edge list with numpy alone (no scipy, which takes most
+of a second to import), and persisted in the cache directory next to the package they were computed from.
+A community is as important as the code it contains: the sum of the scores of its descendant nodes.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Literal, get_args
+
+import numpy as np
+
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.kgcache import get_package_fingerprint
+from crushmycode.snapshot import KgSnapshot
+
+
+ImportanceMeasure = Literal["pagerank", "degree"]
+
+IMPORTANCE_MEASURES: tuple[ImportanceMeasure, ...] = get_args(ImportanceMeasure)
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITER = 100
+PAGERANK_TOL = 1e-8
+
+
+def _get_importance_path(cache_dir: Path | str, measure: ImportanceMeasure) -> Path:
+    return Path(cache_dir) / f"importance-{measure}.npz"
+
+
+def get_degrees(n: int, edges: np.ndarray) -> np.ndarray:
+    """
+    Undirected degrees, counting parallel edges.
+    """
+    return np.bincount(edges.ravel(), minlength=n).astype(np.float64)
+
+
+def get_pageranks(n: int, edges: np.ndarray) -> np.ndarray:
+    """
+    PageRank of the undirected graph, every edge walked in both directions.
+    """
+    if not n:
+        return np.zeros(0)
+    sources = np.concatenate([edges[:, 0], edges[:, 1]])
+    targets = np.concatenate([edges[:, 1], edges[:, 0]])
+    out_degree = np.bincount(sources, minlength=n).astype(np.float64)
+    dangling = out_degree == 0
+    inv_out_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITER):
+        prev = rank
+        dangling_mass = prev[dangling].sum()
+        spread = np.bincount(
+            targets, weights=(prev * inv_out_degree)[sources], minlength=n
+        )
+        rank = PAGERANK_DAMPING * (spread + dangling_mass / n) + (
+            1 - PAGERANK_DAMPING
+        ) / n
+        if np.abs(rank - prev).sum() < n * PAGERANK_TOL:
+            break
+        pass
+    return rank
+
+
+def load_or_compute_node_importance(
+    *,
+    cache_dir: Path | str,
+    snapshot: KgSnapshot,
+    measure: ImportanceMeasure = "pagerank",
+) -> np.ndarray:
+    """
+    Scores of the nodes in the order of 'snapshot.node_ids', recomputed if the package has changed since.
+    """
+    if measure not in IMPORTANCE_MEASURES:
+        raise Exception(
+            f"unknown importance measure '{measure}', expected one of {list(IMPORTANCE_MEASURES)}"
+        )
+    path = _get_importance_path(cache_dir, measure)
+    fingerprint = get_package_fingerprint(cache_dir)
+    if fingerprint and path.exists():
+        try:
+            with np.load(path) as data:
+                if str(data["fingerprint"]) == fingerprint and len(data["scores"]) == len(
+                    snapshot.node_ids
+                ):
+                    return data["scores"]
+                pass
+            pass
+        except Exception as e:
+            logging.error("failed to load node importance %s: %s", path, e)
+            pass
+        pass
+    n = len(snapshot.node_ids)
+    edges = np.asarray(snapshot.edges, dtype=np.int64).reshape(-1, 2)
+    scores = get_pageranks(n, edges) if measure == "pagerank" else get_degrees(n, edges)
+    logging.debug("computed %s of %d nodes over %d edges", measure, n, len(edges))
+    if fingerprint:
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, fingerprint=np.array(fingerprint), scores=scores)
+        os.replace(tmp_path, path)
+        pass
+    return scores
+
+
+def get_community_importance(
+    hierarchy: CommunityHierarchyIndex,
+    *,
+    node_index: dict[str, int],
+    node_scores: np.ndarray,
+) -> np.ndarray:
+    """
+    Scores of the communities in the order of 'hierarchy.community_ids'.
+    """
+    indexes = np.array(
+        [node_index.get(node_id, -1) for node_id in hierarchy.node_ids], dtype=np.int64
+    )
+    position_scores = np.zeros(len(indexes))
+    known = indexes >= 0
+    position_scores[known] = node_scores[indexes[known]]
+    # descendants are contiguous positions, so every sum is a difference of prefix sums
+    prefix = np.concatenate([[0.0], np.cumsum(position_scores)])
+    return prefix[hierarchy.node_hi] - prefix[hierarchy.node_lo]
@@ -0,0 +1,45 @@
+"""
+Helpers for the files crushmycode keeps alongside the minikg package in a cache directory.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+
+# minikg persists the package as the output of its packaging step, keyed by config version
+PACKAGE_PATH_PARTS = ("Step_Package", "1")
+
+
+def get_package_path(cache_dir: Path | str) -> Path:
+    return Path(cache_dir).joinpath(*PACKAGE_PATH_PARTS)
+
+
+def get_package_fingerprint(cache_dir: Path | str) -> str:
+    """
+    Changes whenever the package is rebuilt.
+    Derived artifacts store this, so that they can tell when they are stale.
+    Empty if there is no package in 'cache_dir'.
+    """
+    path = get_package_path(cache_dir)
+    if not path.exists():
+        return ""
+    stat = path.stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def pack_strings(strings: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Packs strings into a flat utf-8 buffer plus offsets, which (unlike numpy unicode arrays)
+    does not pad every string to the longest one.
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(buf: np.ndarray, offsets: np.ndarray) -> list[str]:
+    raw = buf.tobytes()
+    bounds = offsets.tolist()
+    return [raw[lo:hi].decode("utf-8") for lo, hi in zip(bounds[:-1], bounds[1:])]
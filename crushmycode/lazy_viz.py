@@ -0,0 +1,270 @@
+"""
+Multi-resolution 'show-graph' output.
+
+The page itself only holds the groups and the top-level communities.
+The children of every community (sub-communities and code nodes) are written to a small
+shard of their own, which the page loads when that community is double-clicked.
+Shards are javascript files rather than JSON, so that they load from 'file://' pages,
+where browsers refuse to 'fetch'.
+"""
+
+from collections.abc import Mapping
+import logging
+import os
+from pathlib import Path
+import shutil
+
+from minikg.models import Community, Group
+
+from crushmycode.graph_viz import (
+    get_code_node_options,
+    get_community_node_options,
+    get_group_node_options,
+)
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.vis_writer import VisNetworkWriter, make_node, script_json
+
+
+SHARD_CALLBACK = "crushmycodeShardLoaded"
+EXPANDABLE_BORDER_WIDTH = 4
+EXPAND_HINT = "(double-click to expand or collapse)"
+
+_EXPAND_SCRIPT = """
+              var shardDir = %(shard_dir)s;
+              var expanded = {};
+              // number of expanded communities that each loaded node is a child of
+              var refCounts = {};
+
+              function %(callback)s(parentId, shard) {
+                  var entry = expanded[parentId];
+                  if (!entry || entry.loaded) {
+                      return;
+                  }
+                  entry.loaded = true;
+                  var origin = network.getPosition(parentId);
+                  shard.nodes.forEach(function (node) {
+                      if (refCounts[node.id]) {
+                          refCounts[node.id] += 1;
+                          entry.nodeIds.push(node.id);
+                          return;
+                      }
+                      if (nodes.get(node.id)) {
+                          // part of the initial page
+                          return;
+                      }
+                      refCounts[node.id] = 1;
+                      entry.nodeIds.push(node.id);
+                      node.x = origin.x + (Math.random() - 0.5) * 200;
+                      node.y = origin.y + (Math.random() - 0.5) * 200;
+                      nodes.add(node);
+                  });
+                  entry.edgeIds = shard.edges.map(function (edge) { return edge.id; });
+                  edges.update(shard.edges);
+              }
+
+              function expand(nodeId) {
+                  var node = nodes.get(nodeId);
+                  if (!node || node.shard === undefined || expanded[nodeId]) {
+                      return;
+                  }
+                  expanded[nodeId] = {loaded: false, nodeIds: [], edgeIds: []};
+                  var script = document.createElement('script');
+                  script.src = encodeURIComponent(shardDir) + '/' + node.shard + '.js';
+                  script.onload = function () { script.remove(); };
+                  document.body.appendChild(script);
+              }
+
+              function collapse(nodeId) {
+                  var entry = expanded[nodeId];
+                  if (!entry) {
+                      return;
+                  }
+                  delete expanded[nodeId];
+                  edges.remove(entry.edgeIds);
+                  entry.nodeIds.forEach(function (childId) {
+                      refCounts[childId] -= 1;
+                      if (refCounts[childId] > 0) {
+                          return;
+                      }
+                      delete refCounts[childId];
+                      collapse(childId);
+                      nodes.remove(childId);
+                  });
+              }
+
+              network.on("doubleClick", function (params) {
+                  params.nodes.forEach(function (nodeId) {
+                      if (expanded[nodeId]) {
+                          collapse(nodeId);
+                      } else {
+                          expand(nodeId);
+                      }
+                  });
+              });
+"""
+
+
+def get_shard_dir(outfile_name: str) -> Path:
+    path = Path(outfile_name)
+    return path.with_name(f"{path.stem}_shards")
+
+
+def _make_community_node(
+    community: Community,
+    *,
+    com_summaries: dict[str, dict[str, str]],
+    hierarchy: CommunityHierarchyIndex,
+) -> dict:
+    options = get_community_node_options(community, com_summaries)
+    if community.child_community_ids or community.child_node_ids:
+        options["title"] = "\n".join([options["title"], EXPAND_HINT])
+        options["shard"] = hierarchy.community_index[community.id]
+        options["borderWidth"] = EXPANDABLE_BORDER_WIDTH
+        pass
+    return make_node(community.id, **options)
+
+
+def _make_edge(source: str, to: str) -> dict:
+    # ids let the page drop exactly the edges it loaded with a shard when collapsing
+    return {"id": f"{source}->{to}", "from": source, "to": to}
+
+
+def render_shard(
+    community: Community,
+    *,
+    communities: dict[str, Community],
+    com_summaries: dict[str, dict[str, str]],
+    node_details_by_id: Mapping[str, dict],
+    hierarchy: CommunityHierarchyIndex,
+) -> str:
+    """
+    The sub-communities and code nodes of 'community', as the javascript of its shard.
+    """
+    shard_nodes = [
+        _make_community_node(
+            communities[child_com_id],
+            com_summaries=com_summaries,
+            hierarchy=hierarchy,
+        )
+        for child_com_id in community.child_community_ids
+    ]
+    shard_nodes.extend(
+        make_node(code_node_id, **get_code_node_options(node_details_by_id[code_node_id]))
+        for code_node_id in community.child_node_ids
+    )
+    shard_edges = [
+        _make_edge(community.id, child_id)
+        for child_id in [*community.child_community_ids, *community.child_node_ids]
+    ]
+    return (
+        f"{SHARD_CALLBACK}({script_json(community.id)}, "
+        f"{script_json({'nodes': shard_nodes, 'edges': shard_edges})});\n"
+    )
+
+
+def get_expand_script(shard_dir_name: str) -> str:
+    """
+    Loads shards from 'shard_dir_name', relative to the page.
+    """
+    return _EXPAND_SCRIPT % {
+        "shard_dir": script_json(shard_dir_name),
+        "callback": SHARD_CALLBACK,
+    }
+
+
+def build_lazy_network(
+    *,
+    groups: dict[str, Group],
+    communities: dict[str, Community],
+    com_summaries: dict[str, dict[str, str]],
+    hierarchy: CommunityHierarchyIndex,
+) -> VisNetworkWriter:
+    """
+    Only the groups and the top-level communities.
+    """
+    net = VisNetworkWriter()
+    root_ids = [
+        community_id
+        for community_id in hierarchy.community_ids
+        if hierarchy.get_parent_id(community_id) is None
+    ]
+    # added before the groups, since the first clustering round reuses the IDs of the communities it groups
+    for community_id in root_ids:
+        node = _make_community_node(
+            communities[community_id],
+            com_summaries=com_summaries,
+            hierarchy=hierarchy,
+        )
+        net.add_node(node.pop("id"), **node)
+        pass
+    for group in groups.values():
+        net.add_node(group.group_id, **get_group_node_options(group))
+        pass
+
+    for group in groups.values():
+        for child_id in [*group.child_group_ids, *group.child_community_ids]:
+            if net.has_node(child_id):
+                net.add_edge(group.group_id, child_id)
+                pass
+            pass
+        pass
+    return net
+
+
+def draw_lazy_communities_graph(
+    *,
+    groups: dict[str, Group],
+    communities: dict[str, Community],
+    com_summaries: dict[str, dict[str, str]],
+    node_details_by_id: Mapping[str, dict],
+    outfile_name: str,
+    hierarchy: CommunityHierarchyIndex | None = None,
+) -> None:
+    """
+    Writes the page to 'outfile_name', and one shard per expandable community
+    to a '<page name>_shards' directory next to it.
+    """
+    hierarchy = hierarchy or CommunityHierarchyIndex.build(communities)
+    shard_dir = get_shard_dir(outfile_name)
+    # shards from a previous run would be numbered differently
+    if shard_dir.exists():
+        shutil.rmtree(shard_dir)
+        pass
+    os.makedirs(shard_dir)
+
+    net = build_lazy_network(
+        groups=groups,
+        communities=communities,
+        com_summaries=com_summaries,
+        hierarchy=hierarchy,
+    )
+
+    n_shards = 0
+    for i, community_id in enumerate(hierarchy.community_ids):
+        community = communities[community_id]
+        if not (community.child_community_ids or community.child_node_ids):
+            continue
+        with open(shard_dir / f"{i}.js", "w") as f:
+            f.write(
+                render_shard(
+                    community,
+                    communities=communities,
+                    com_summaries=com_summaries,
+                    node_details_by_id=node_details_by_id,
+                    hierarchy=hierarchy,
+                )
+            )
+            pass
+        n_shards += 1
+        pass
+    logging.info(
+        "wrote %d top-level nodes, and %d shards to '%s'",
+        net.n_nodes,
+        n_shards,
+        shard_dir,
+    )
+
+    with open(outfile_name, "w") as f:
+        net.write_html(f, script=get_expand_script(shard_dir.name))
+        pass
+    return
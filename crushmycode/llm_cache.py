@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+
+from expert_llm.models import LlmResponse
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_DIR_NAME = "report-llm-cache"
+
+
+class LlmResponseCache:
+    """
+    Content-addressed, on-disk cache of LLM responses.
+
+    Each response is stored as its own JSON file, named by a hash of everything
+    that determines the response.  Once the cache grows past 'max_bytes',
+    the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        *,
+        cache_dir: Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(
+            entry.stat().st_size for entry in self._iter_entries()
+        )
+        return
+
+    @staticmethod
+    def get_key(
+        *,
+        model: str,
+        req_name: str,
+        system: str,
+        user: str,
+        output_schema: dict | None,
+    ) -> str:
+        raw = json.dumps(
+            {
+                "model": model,
+                "output_schema": output_schema,
+                "req_name": req_name,
+                "system": system,
+                "user": user,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> LlmResponse | None:
+        path = self._get_entry_path(key)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+                pass
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error("failed to read cached LLM response %s: %s", path, e)
+            return None
+        # bump recency, so that eviction drops the least recently used entries
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return LlmResponse(
+            message=data.get("message"),
+            structured_output=data.get("structured_output"),
+        )
+
+    def put(self, key: str, response: LlmResponse) -> None:
+        path = self._get_entry_path(key)
+        raw = json.dumps(response._asdict()).encode("utf-8")
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+            pass
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total_bytes += len(raw)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+                pass
+            pass
+        return
+
+    def _get_entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _iter_entries(self):
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".json"):
+                    yield entry
+                    pass
+                pass
+            pass
+        return
+
+    def _evict(self) -> None:
+        entries = sorted(
+            (
+                (stat.st_mtime, stat.st_size, entry.path)
+                for entry in self._iter_entries()
+                for stat in [entry.stat()]
+            ),
+        )
+        total = sum(size for _, size, _ in entries)
+        n_evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            n_evicted += 1
+            pass
+        logging.debug("evicted %d cached LLM responses", n_evicted)
+        self._total_bytes = total
+        return
+
+    pass
@@ -0,0 +1,465 @@
+"""
+Instrumentation for '--profile': wall time per stage, every LLM call, and peak RSS.
+
+Stages are timed with 'stage(...)', which does nothing unless a profiler is installed.
+LLM calls are recorded per 'req_name' by wrapping 'expert_llm.api.LlmApi.completion' (used by
+both the report and minikg's build steps), with tokens and retries filled in by the request
+scheduler from the HTTP responses.
+Build steps run in worker processes, which record their own events and send them back with the
+completed step (see 'crushmycode.step_pool').
+
+Events are kept in Chrome's trace event format, so the profile opens in chrome://tracing or Perfetto.
+"""
+
+from contextlib import contextmanager
+import functools
+import json
+import logging
+import os
+from pathlib import Path
+import resource
+import sys
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+
+PROFILE_DIR_NAME = "profiles"
+# USD per million (prompt, completion) tokens, for estimating the cost of a run
+MODEL_PRICES_PER_MILLION_TOKENS: dict[str, tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+
+
+def _now_us() -> float:
+    # wall clock, so that events from worker processes line up
+    return time.time() * 1_000_000
+
+
+def get_peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def estimate_cost_usd(
+    *, model: str, prompt_tokens: int, completion_tokens: int
+) -> float | None:
+    # also matches dated versions, like 'gpt-4o-2024-08-06'
+    matches = [name for name in MODEL_PRICES_PER_MILLION_TOKENS if model.startswith(name)]
+    if not matches:
+        return None
+    prices = MODEL_PRICES_PER_MILLION_TOKENS[max(matches, key=len)]
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class StageSummary(NamedTuple):
+    name: str
+    count: int
+    total_s: float
+    max_s: float
+    pass
+
+
+class LlmCallSummary(NamedTuple):
+    req_name: str
+    calls: int
+    cached: int
+    retries: int
+    errors: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_latency_s: float
+    max_latency_s: float
+    cost_usd: float | None
+    pass
+
+
+class ProfileSummary(NamedTuple):
+    wall_s: float
+    peak_rss_mb: float
+    # the largest peak of any worker process
+    worker_peak_rss_mb: float
+    stages: list[StageSummary]
+    llm_calls: list[LlmCallSummary]
+    pass
+
+
+class Profiler:
+    """
+    Thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self.events: list[dict] = []
+        self.started_us = _now_us()
+        self._lock = threading.Lock()
+        return
+
+    def add_events(self, events: list[dict]) -> None:
+        with self._lock:
+            self.events.extend(events)
+            pass
+        return
+
+    def add_span(
+        self,
+        name: str,
+        *,
+        cat: str,
+        started_us: float,
+        args: dict | None = None,
+    ) -> None:
+        self.add_events(
+            [
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": started_us,
+                    "dur": _now_us() - started_us,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args or {},
+                }
+            ]
+        )
+        return
+
+    def sample_rss(self) -> None:
+        self.add_events(
+            [
+                {
+                    "name": "peak_rss_mb",
+                    "ph": "C",
+                    "ts": _now_us(),
+                    "pid": os.getpid(),
+                    "args": {"peak_rss_mb": round(get_peak_rss_mb(), 1)},
+                }
+            ]
+        )
+        return
+
+    @contextmanager
+    def stage(self, name: str, *, cat: str = "stage", **args) -> Iterator[None]:
+        started_us = _now_us()
+        try:
+            yield
+        finally:
+            self.add_span(name, cat=cat, started_us=started_us, args=args)
+            self.sample_rss()
+            pass
+        return
+
+    def get_summary(self) -> ProfileSummary:
+        with self._lock:
+            events = list(self.events)
+            pass
+        stages: dict[str, list[float]] = {}
+        llm_calls: dict[str, list[dict]] = {}
+        peak_rss_mb: dict[int, float] = {}
+        for event in events:
+            if event["ph"] == "C":
+                peak_rss_mb[event["pid"]] = max(
+                    peak_rss_mb.get(event["pid"], 0), event["args"]["peak_rss_mb"]
+                )
+                continue
+            if event["cat"] == "llm":
+                llm_calls.setdefault(event["args"]["req_name"], []).append(event)
+                continue
+            stages.setdefault(event["name"], []).append(event["dur"] / 1_000_000)
+            pass
+
+        llm_summaries: list[LlmCallSummary] = []
+        for req_name, calls in llm_calls.items():
+            costs = [
+                estimate_cost_usd(
+                    model=call["args"]["model"],
+                    prompt_tokens=call["args"]["prompt_tokens"],
+                    completion_tokens=call["args"]["completion_tokens"],
+                )
+                for call in calls
+                if not call["args"]["cached"]
+            ]
+            latencies = [call["dur"] / 1_000_000 for call in calls]
+            llm_summaries.append(
+                LlmCallSummary(
+                    req_name=req_name,
+                    calls=len(calls),
+                    cached=sum(call["args"]["cached"] for call in calls),
+                    retries=sum(call["args"]["retries"] for call in calls),
+                    errors=sum(bool(call["args"]["error"]) for call in calls),
+                    prompt_tokens=sum(call["args"]["prompt_tokens"] for call in calls),
+                    completion_tokens=sum(
+                        call["args"]["completion_tokens"] for call in calls
+                    ),
+                    total_latency_s=sum(latencies),
+                    max_latency_s=max(latencies),
+                    cost_usd=(
+                        sum(cost for cost in costs if cost is not None)
+                        if any(cost is not None for cost in costs)
+                        else None
+                    ),
+                )
+            )
+            pass
+
+        own_pid = os.getpid()
+        return ProfileSummary(
+            wall_s=(_now_us() - self.started_us) / 1_000_000,
+            peak_rss_mb=max(peak_rss_mb.get(own_pid, 0), get_peak_rss_mb()),
+            worker_peak_rss_mb=max(
+                [mb for pid, mb in peak_rss_mb.items() if pid != own_pid] or [0]
+            ),
+            stages=sorted(
+                [
+                    StageSummary(
+                        name=name,
+                        count=len(durations),
+                        total_s=sum(durations),
+                        max_s=max(durations),
+                    )
+                    for name, durations in stages.items()
+                ],
+                key=lambda stage: -stage.total_s,
+            ),
+            llm_calls=sorted(llm_summaries, key=lambda call: -call.total_latency_s),
+        )
+
+    def write_trace(self, path: Path, *, metadata: dict) -> None:
+        """
+        Writes the events as a Chrome trace, with the summary under 'otherData'.
+        """
+        self.sample_rss()
+        summary = self.get_summary()
+        with self._lock:
+            events = list(self.events)
+            pass
+        process_names = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": "crushmycode" if pid == os.getpid() else f"worker {pid}"},
+            }
+            for pid in sorted({event["pid"] for event in events})
+        ]
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "traceEvents": [
+                        *process_names,
+                        *(
+                            {**event, "ts": event["ts"] - self.started_us}
+                            for event in events
+                        ),
+                    ],
+                    "displayTimeUnit": "ms",
+                    "otherData": {
+                        **metadata,
+                        "wall_s": summary.wall_s,
+                        "peak_rss_mb": summary.peak_rss_mb,
+                        "worker_peak_rss_mb": summary.worker_peak_rss_mb,
+                        "stages": [stage._asdict() for stage in summary.stages],
+                        "llm_calls": [call._asdict() for call in summary.llm_calls],
+                    },
+                },
+                f,
+            )
+            pass
+        os.replace(tmp_path, path)
+        return
+
+    pass
+
+
+def format_summary(summary: ProfileSummary) -> str:
+    lines = [
+        f"wall time {summary.wall_s:.1f}s, peak RSS {summary.peak_rss_mb:.0f} MB"
+        + (
+            f" (largest worker {summary.worker_peak_rss_mb:.0f} MB)"
+            if summary.worker_peak_rss_mb
+            else ""
+        ),
+        "",
+        f"{'stage':<40} {'count':>7} {'total (s)':>10} {'max (s)':>9}",
+    ]
+    for stage in summary.stages:
+        lines.append(
+            f"{stage.name[:40]:<40} {stage.count:>7} {stage.total_s:>10.2f} {stage.max_s:>9.2f}"
+        )
+        pass
+    if summary.llm_calls:
+        lines.extend(
+            [
+                "",
+                f"{'LLM request':<40} {'calls':>7} {'cached':>7} {'retries':>8} {'errors':>7}"
+                f" {'prompt tok':>11} {'compl. tok':>11} {'total (s)':>10} {'max (s)':>9} {'cost ($)':>9}",
+            ]
+        )
+        for call in summary.llm_calls:
+            cost = f"{call.cost_usd:.3f}" if call.cost_usd is not None else "?"
+            lines.append(
+                f"{call.req_name[:40]:<40} {call.calls:>7} {call.cached:>7} {call.retries:>8} {call.errors:>7}"
+                f" {call.prompt_tokens:>11} {call.completion_tokens:>11}"
+                f" {call.total_latency_s:>10.2f} {call.max_latency_s:>9.2f} {cost:>9}"
+            )
+            pass
+        pass
+    return "\n".join(lines)
+
+
+_profiler: Profiler | None = None
+_local = threading.local()
+
+
+def get_profiler() -> Profiler | None:
+    return _profiler
+
+
+@contextmanager
+def stage(name: str, *, cat: str = "stage", **args) -> Iterator[None]:
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name, cat=cat, **args):
+        yield
+        pass
+    return
+
+
+@contextmanager
+def llm_call(req_name: str) -> Iterator[dict]:
+    """
+    Records one LLM call, which may take several HTTP requests; see 'record_request'.
+    Yields the call's arguments, in which the caller may set 'cached'.
+    Calls nested in another on the same thread are part of the outer call.
+    """
+    profiler = _profiler
+    current = getattr(_local, "call", None)
+    if profiler is None or current is not None:
+        yield current if current is not None else {}
+        return
+    call = {
+        "req_name": req_name,
+        "model": "",
+        "cached": False,
+        "requests": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "error": "",
+    }
+    started_us = _now_us()
+    _local.call = call
+    try:
+        yield call
+    except BaseException as e:
+        call["error"] = str(e)[:200]
+        raise e
+    finally:
+        _local.call = None
+        profiler.add_span(req_name, cat="llm", started_us=started_us, args=call)
+        pass
+    return
+
+
+def record_request(
+    *,
+    name: str,
+    started_us: float,
+    model: str,
+    attempts: int,
+    usage: dict | None,
+    error: str = "",
+) -> None:
+    """
+    Called by the request scheduler once per request, after its last attempt.
+    Counts towards the LLM call in progress on this thread, or is recorded as a call of its own.
+    """
+    profiler = _profiler
+    if profiler is None:
+        return
+    usage = usage or {}
+    call = getattr(_local, "call", None)
+    if call is None:
+        profiler.add_span(
+            name,
+            cat="llm",
+            started_us=started_us,
+            args={
+                "req_name": name,
+                "model": model,
+                "cached": False,
+                "requests": 1,
+                "retries": attempts - 1,
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+                "error": error,
+            },
+        )
+        return
+    # an LLM call that is retried by the LLM client takes several requests
+    call["retries"] += attempts - 1 + (call["requests"] > 0)
+    call["requests"] += 1
+    call["model"] = call["model"] or model
+    call["prompt_tokens"] += usage.get("prompt_tokens", 0)
+    call["completion_tokens"] += usage.get("completion_tokens", 0)
+    return
+
+
+def _patch_llm_api() -> None:
+    from expert_llm.api import LlmApi
+
+    if getattr(LlmApi.completion, "is_profiled", False):
+        return
+    original = LlmApi.completion
+
+    @functools.wraps(original)
+    def completion(self, *, req_name: str, **kwargs):
+        with llm_call(req_name):
+            return original(self, req_name=req_name, **kwargs)
+        pass
+
+    completion.is_profiled = True  # type: ignore[attr-defined]
+    LlmApi.completion = completion  # type: ignore[method-assign]
+    return
+
+
+def install_profiler(profiler: Profiler | None) -> None:
+    """
+    Records stages and LLM calls in this process to 'profiler', or stops recording if None.
+    """
+    global _profiler
+    _profiler = profiler
+    if profiler:
+        _patch_llm_api()
+        pass
+    return
+
+
+def get_profile_path(cache_dir: Path | str, *, command: str) -> Path:
+    return (
+        Path(cache_dir)
+        / PROFILE_DIR_NAME
+        / f"{command}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json"
+    )
+
+
+def write_profile(
+    profiler: Profiler, *, cache_dir: Path | str, command: str, argv: list[str]
+) -> Path:
+    """
+    Writes the profile to the cache directory, and prints its summary.
+    """
+    path = get_profile_path(cache_dir, command=command)
+    profiler.write_trace(path, metadata={"command": command, "argv": argv})
+    logging.info("profile of '%s' written to '%s'", command, path)
+    print(format_summary(profiler.get_summary()), file=sys.stderr)
+    return path
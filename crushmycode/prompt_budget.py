@@ -0,0 +1,44 @@
+import math
+
+
+# rough average for English prose and code with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    A cheap, tokenizer-free upper-ish estimate of the number of tokens in 'text'.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def chunk_by_token_budget(
+    entries: list[str],
+    *,
+    token_budget: int,
+    min_chunk_size: int = 1,
+) -> list[list[int]]:
+    """
+    Splits 'entries' into consecutive chunks whose combined token estimate fits 'token_budget'.
+    Returns the chunks as lists of entry indexes.
+
+    A chunk always holds at least 'min_chunk_size' entries (where that many remain),
+    even if this overflows the budget.
+    """
+    chunks: list[list[int]] = []
+    cur: list[int] = []
+    cur_tokens = 0
+    for i, entry in enumerate(entries):
+        entry_tokens = estimate_tokens(entry)
+        if len(cur) >= min_chunk_size and cur_tokens + entry_tokens > token_budget:
+            chunks.append(cur)
+            cur = []
+            cur_tokens = 0
+            pass
+        cur.append(i)
+        cur_tokens += entry_tokens
+        pass
+    if cur:
+        chunks.append(cur)
+        pass
+    return chunks
@@ -0,0 +1,259 @@
+"""
+Chooses which communities and code nodes of a large graph to draw, by importance
+(see 'crushmycode.importance'), within:
+ - 'max_nodes': communities, code nodes and '+N more' nodes drawn in total
+ - 'top_k_per_community': children drawn under every community
+ - 'min_depth' / 'max_depth': depths of the communities drawn, roots being at depth 0
+
+The graph is grown top-down from the shallowest communities drawn, most important item first,
+so every item drawn below 'min_depth' hangs off its drawn parent.
+The children of a drawn community that are left out are counted, to be drawn as one '+N more' node,
+and so are the shallowest communities left out under every group, to be drawn as one '+N more' node under it.
+"""
+
+from collections.abc import Mapping
+import heapq
+from pathlib import Path
+from typing import NamedTuple
+
+from minikg.models import Group
+import numpy as np
+
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.importance import (
+    ImportanceMeasure,
+    get_community_importance,
+    load_or_compute_node_importance,
+)
+from crushmycode.snapshot import KgSnapshot
+
+
+class HiddenChildren(NamedTuple):
+    communities: int
+    code_nodes: int
+    pass
+
+
+class GraphSelection(NamedTuple):
+    community_ids: set[str]
+    code_node_ids: set[str]
+    # the shallowest communities drawn, by the group they hang off (None for no group)
+    top_community_ids_by_group: dict[str | None, list[str]]
+    # children left out, by drawn community
+    hidden_by_community: dict[str, HiddenChildren]
+    # the shallowest communities left out, by the group they hang off (None for no group)
+    hidden_by_group: dict[str | None, int]
+    pass
+
+
+def get_top_group_ids(
+    hierarchy: CommunityHierarchyIndex, groups: Mapping[str, Group]
+) -> list[str | None]:
+    """
+    The group every community hangs off when it is among the shallowest drawn, in the order of
+    'hierarchy.community_ids': the group listing its closest ancestor (or itself) as a child community,
+    or sharing its ID, as the first clustering round's input groups share those of the root communities.
+    """
+    group_id_by_child: dict[str, str] = {}
+    for group in groups.values():
+        for community_id in group.child_community_ids:
+            group_id_by_child.setdefault(community_id, group.group_id)
+            pass
+        pass
+    top_group_ids: list[str | None] = []
+    # parents come before their children
+    for i, community_id in enumerate(hierarchy.community_ids):
+        group_id = group_id_by_child.get(community_id)
+        if group_id is None and community_id in groups:
+            group_id = community_id
+            pass
+        parent = int(hierarchy.parent[i])
+        if group_id is None and parent >= 0:
+            group_id = top_group_ids[parent]
+            pass
+        top_group_ids.append(group_id)
+        pass
+    return top_group_ids
+
+
+def select_graph(
+    hierarchy: CommunityHierarchyIndex,
+    *,
+    community_scores: np.ndarray,
+    node_scores: dict[str, float],
+    include_nodes: bool = False,
+    max_nodes: int | None = None,
+    top_k_per_community: int | None = None,
+    min_depth: int = 0,
+    max_depth: int | None = None,
+    top_group_ids: list[str | None] | None = None,
+) -> GraphSelection:
+    """
+    'community_scores' and 'top_group_ids' (see 'get_top_group_ids') follow the order of
+    'hierarchy.community_ids'; without 'top_group_ids', all the communities are under no group.
+    Only the '+N more' nodes of the groups can exceed 'max_nodes', when there are more groups than it allows.
+    Code nodes are only drawn with 'include_nodes', and do not count towards 'top_k_per_community'
+    separately: sub-communities and code nodes compete for the same places.
+    """
+    if max_depth is not None and max_depth < min_depth:
+        raise Exception(f"max depth {max_depth} is below min depth {min_depth}")
+    community_ids = hierarchy.community_ids
+    n = len(community_ids)
+    # sub-communities of every community, in order
+    child_communities: list[list[int]] = [[] for _ in range(n)]
+    for i in range(n):
+        parent = int(hierarchy.parent[i])
+        if parent >= 0:
+            child_communities[parent].append(i)
+            pass
+        pass
+
+    if top_group_ids is None:
+        top_group_ids = [None] * n
+        pass
+
+    # the direct code nodes of a community are the first positions of its node range
+    owner = hierarchy.node_owner
+    direct_counts = np.bincount(owner, minlength=n) if len(owner) else np.zeros(n, dtype=np.int64)
+
+    # communities are indexes into 'community_ids', code nodes positions in 'hierarchy.node_ids'
+    selected_communities: set[int] = set()
+    selected_positions: set[int] = set()
+    # (is_node, index, parent community) in the order selected
+    selected: list[tuple[bool, int, int]] = []
+    hidden: dict[int, list[int]] = {}
+    hidden_by_group: dict[str | None, int] = {}
+
+    # (-score, order, is_node, index, parent community); 'order' keeps ties deterministic
+    heap: list[tuple[float, int, bool, int, int]] = [
+        (-float(community_scores[i]), i, False, i, -1)
+        for i in np.flatnonzero(hierarchy.depth == min_depth).tolist()
+    ]
+    heapq.heapify(heap)
+    order = n
+    budget = max_nodes if max_nodes is not None else len(hierarchy.node_ids) + n
+    while heap and len(selected) < budget:
+        _, _, is_node, index, parent = heapq.heappop(heap)
+        selected.append((is_node, index, parent))
+        if is_node:
+            selected_positions.add(index)
+            continue
+        selected_communities.add(index)
+        hidden[index] = [0, 0]
+        lo = int(hierarchy.node_lo[index])
+        node_positions = (
+            list(range(lo, lo + int(direct_counts[index]))) if include_nodes else []
+        )
+        if max_depth is not None and int(hierarchy.depth[index]) >= max_depth:
+            hidden[index] = [len(child_communities[index]), len(node_positions)]
+            continue
+        children: list[tuple[float, bool, int]] = [
+            (-float(community_scores[c]), False, c) for c in child_communities[index]
+        ] + [
+            (-node_scores.get(hierarchy.node_ids[p], 0.0), True, p)
+            for p in node_positions
+        ]
+        children.sort()
+        if top_k_per_community is not None:
+            for _, child_is_node, _ in children[top_k_per_community:]:
+                hidden[index][int(child_is_node)] += 1
+                pass
+            children = children[:top_k_per_community]
+            pass
+        for neg_score, child_is_node, child in children:
+            heapq.heappush(heap, (neg_score, order, child_is_node, child, index))
+            order += 1
+            pass
+        pass
+    # whatever did not fit within 'max_nodes'
+    for _, _, is_node, index, parent in heap:
+        if parent >= 0:
+            hidden[parent][int(is_node)] += 1
+            pass
+        else:
+            group_id = top_group_ids[index]
+            hidden_by_group[group_id] = hidden_by_group.get(group_id, 0) + 1
+            pass
+        pass
+
+    # '+N more' nodes count towards 'max_nodes' too: give back the least important selections until they fit.
+    # The last selected has no selected children, as they would have been selected after it.
+    n_aggregates = sum(1 for counts in hidden.values() if counts[0] or counts[1]) + len(
+        hidden_by_group
+    )
+    while max_nodes is not None and selected and len(selected) + n_aggregates > max_nodes:
+        is_node, index, parent = selected.pop()
+        if is_node:
+            selected_positions.discard(index)
+            pass
+        else:
+            selected_communities.discard(index)
+            counts = hidden.pop(index)
+            n_aggregates -= int(bool(counts[0] or counts[1]))
+            pass
+        if parent >= 0:
+            counts = hidden[parent]
+            n_aggregates += int(not (counts[0] or counts[1]))
+            counts[int(is_node)] += 1
+            pass
+        else:
+            group_id = top_group_ids[index]
+            n_aggregates += int(group_id not in hidden_by_group)
+            hidden_by_group[group_id] = hidden_by_group.get(group_id, 0) + 1
+            pass
+        pass
+
+    top_by_group: dict[str | None, list[str]] = {}
+    for is_node, index, parent in selected:
+        if not is_node and parent < 0:
+            top_by_group.setdefault(top_group_ids[index], []).append(community_ids[index])
+            pass
+        pass
+    return GraphSelection(
+        community_ids=set(community_ids[i] for i in selected_communities),
+        code_node_ids=set(hierarchy.node_ids[p] for p in selected_positions),
+        top_community_ids_by_group=top_by_group,
+        hidden_by_community={
+            community_ids[i]: HiddenChildren(communities=counts[0], code_nodes=counts[1])
+            for i, counts in hidden.items()
+            if counts[0] or counts[1]
+        },
+        hidden_by_group=hidden_by_group,
+    )
+
+
+def select_graph_by_importance(
+    *,
+    cache_dir: Path | str,
+    snapshot: KgSnapshot,
+    hierarchy: CommunityHierarchyIndex,
+    measure: ImportanceMeasure = "pagerank",
+    include_nodes: bool = False,
+    max_nodes: int | None = None,
+    top_k_per_community: int | None = None,
+    min_depth: int = 0,
+    max_depth: int | None = None,
+) -> GraphSelection:
+    """
+    'select_graph', with node importance loaded from (or computed into) 'cache_dir'.
+    """
+    node_scores = load_or_compute_node_importance(
+        cache_dir=cache_dir,
+        snapshot=snapshot,
+        measure=measure,
+    )
+    return select_graph(
+        hierarchy,
+        community_scores=get_community_importance(
+            hierarchy,
+            node_index=snapshot.node_index,
+            node_scores=node_scores,
+        ),
+        node_scores=dict(zip(snapshot.node_ids, node_scores.tolist())),
+        include_nodes=include_nodes,
+        max_nodes=max_nodes,
+        top_k_per_community=top_k_per_community,
+        min_depth=min_depth,
+        max_depth=max_depth,
+        top_group_ids=get_top_group_ids(hierarchy, snapshot.cluster_groups),
+    )
@@ -0,0 +1,200 @@
+import logging
+from typing import Iterable, Literal
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+from crushmycode.importance import PAGERANK_DAMPING, PAGERANK_MAX_ITER, PAGERANK_TOL
+
+
+RankingMode = Literal["llm", "graph", "hybrid"]
+
+# betweenness is estimated from this many sampled source nodes
+BETWEENNESS_SAMPLES = 64
+BETWEENNESS_BATCH_SIZE = 16
+
+MEASURE_WEIGHTS = {
+    "pagerank": 0.5,
+    "degree": 0.25,
+    "betweenness": 0.25,
+}
+
+
+def _pagerank(A: sparse.csr_matrix) -> np.ndarray:
+    n = A.shape[0]
+    out_degree = np.asarray(A.sum(axis=1)).ravel()
+    dangling = out_degree == 0
+    inv_out_degree = np.divide(
+        1.0,
+        out_degree,
+        out=np.zeros(n),
+        where=~dangling,
+    )
+    # column-stochastic transition matrix
+    P = (sparse.diags(inv_out_degree) @ A).T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITER):
+        prev = rank
+        dangling_mass = prev[dangling].sum()
+        rank = PAGERANK_DAMPING * (P @ prev + dangling_mass / n) + (
+            1 - PAGERANK_DAMPING
+        ) / n
+        if np.abs(rank - prev).sum() < n * PAGERANK_TOL:
+            break
+        pass
+    return rank
+
+
+def _betweenness(A: sparse.csr_matrix) -> np.ndarray:
+    """
+    Brandes' algorithm over a sample of source nodes.
+    Sources are processed in batches, so every BFS level is a single
+    sparse-matrix x dense-matrix product.
+    """
+    n = A.shape[0]
+    A_bin = A.copy()
+    A_bin.data[:] = 1.0
+    rng = np.random.default_rng(0)
+    sources = rng.choice(n, size=min(n, BETWEENNESS_SAMPLES), replace=False)
+    betweenness = np.zeros(n)
+    for lo in range(0, len(sources), BETWEENNESS_BATCH_SIZE):
+        batch = sources[lo : lo + BETWEENNESS_BATCH_SIZE]
+        cols = np.arange(len(batch))
+        # number of shortest paths from each source, and BFS depth
+        sigma = np.zeros((n, len(batch)))
+        sigma[batch, cols] = 1.0
+        depth = np.full((n, len(batch)), -1, dtype=np.int32)
+        depth[batch, cols] = 0
+        frontier = sigma.copy()
+        max_depth = 0
+        while True:
+            frontier = A_bin @ frontier
+            frontier[depth >= 0] = 0.0
+            reached = frontier > 0
+            if not reached.any():
+                break
+            max_depth += 1
+            depth[reached] = max_depth
+            sigma += frontier
+            pass
+
+        # accumulate dependencies, deepest level first
+        delta = np.zeros((n, len(batch)))
+        safe_sigma = np.where(sigma > 0, sigma, 1.0)
+        for d in range(max_depth, 0, -1):
+            coef = np.where(depth == d, (1.0 + delta) / safe_sigma, 0.0)
+            delta += np.where(depth == d - 1, sigma * (A_bin @ coef), 0.0)
+            pass
+        delta[batch, cols] = 0.0
+        betweenness += delta.sum(axis=1)
+        pass
+    return betweenness * (n / len(sources))
+
+
+def _average_rank(values: np.ndarray) -> np.ndarray:
+    """
+    1-based ranks, where tied values share the average of their ranks
+    (as 'scipy.stats.rankdata', which takes most of a second to import).
+    """
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    is_run_start = np.concatenate([[True], sorted_values[1:] != sorted_values[:-1]])
+    run_starts = np.flatnonzero(is_run_start)
+    run_ends = np.append(run_starts[1:], len(values))
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = ((run_starts + 1 + run_ends) / 2)[np.cumsum(is_run_start) - 1]
+    return ranks
+
+
+def _normalized_rank(values: np.ndarray) -> np.ndarray:
+    """
+    Maps values onto (0, 1] by rank, so that measures on different scales can be combined.
+    """
+    if not len(values):
+        return values
+    return _average_rank(values) / len(values)
+
+
+class GraphRanker:
+    """
+    Ranks code nodes and communities by their structural importance in the
+    knowledge graph, without involving the LLM.
+
+    Each node's score is a weighted combination of its (rank-normalized)
+    PageRank, degree and betweenness centrality.
+    """
+
+    def __init__(
+        self,
+        *,
+        node_ids: list[str],
+        edges: np.ndarray,
+    ) -> None:
+        """
+        'edges' is an (m, 2) array of indexes into 'node_ids'.
+        """
+        self.node_ids = node_ids
+        self.node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        n = len(node_ids)
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        # undirected: count each edge in both directions
+        rows = np.concatenate([edges[:, 0], edges[:, 1]])
+        cols = np.concatenate([edges[:, 1], edges[:, 0]])
+        A = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(n, n),
+        )
+        self.measures: dict[str, np.ndarray] = {
+            "pagerank": _pagerank(A) if n else np.zeros(0),
+            "degree": np.asarray(A.sum(axis=1)).ravel(),
+            "betweenness": _betweenness(A) if n else np.zeros(0),
+        }
+        self.node_scores = sum(
+            weight * _normalized_rank(self.measures[measure])
+            for measure, weight in MEASURE_WEIGHTS.items()
+        )
+        logging.debug("ranked %d nodes over %d edges", n, len(edges))
+        return
+
+    @classmethod
+    def from_graph(cls, G: nx.Graph) -> "GraphRanker":
+        node_ids = list(G.nodes)
+        node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        edges = np.array(
+            [(node_index[u], node_index[v]) for u, v in G.edges() if u != v],
+            dtype=np.int64,
+        )
+        return cls(
+            node_ids=node_ids,
+            edges=edges,
+        )
+
+    def get_node_score(self, node_id: str) -> float:
+        i = self.node_index.get(node_id)
+        if i is None:
+            return 0.0
+        return float(self.node_scores[i])
+
+    def rank_nodes(self, node_ids: Iterable[str], top_k: int | None = None) -> list[str]:
+        """
+        Returns 'node_ids' in descending order of importance, ties broken by ID.
+        """
+        ranked = sorted(
+            node_ids,
+            key=lambda node_id: (-self.get_node_score(node_id), node_id),
+        )
+        return ranked if top_k is None else ranked[:top_k]
+
+    def get_community_score(self, descendant_node_ids: Iterable[str]) -> float:
+        """
+        A community is as important as the code it contains.
+        """
+        indexes = [
+            self.node_index[node_id]
+            for node_id in descendant_node_ids
+            if node_id in self.node_index
+        ]
+        return float(self.node_scores[indexes].sum())
+
+    pass
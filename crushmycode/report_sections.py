@@ -0,0 +1,260 @@
+"""
+Sections of the report, each saved to the cache directory as soon as it has been generated,
+along with a fingerprint of what it was generated from:
+ - a key of everything known before generating it: settings, model and candidate communities
+ - the community summaries and memberships, code constructs and source files it read while being generated
+
+A section is reused as long as its key is unchanged and everything it read still hashes the same,
+so after a rebuild only the sections whose inputs changed are generated again.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Iterator, Literal, NamedTuple, get_args
+
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.snapshot import KgSnapshot
+
+
+ReportSection = Literal["executive", "components", "skills"]
+
+SECTIONS_DIR_NAME = "report-sections"
+# bump whenever a section's prompts or formatting change
+SECTIONS_VERSION = 1
+SECTION_NAMES: tuple[ReportSection, ...] = get_args(ReportSection)
+SECTION_TITLES: dict[ReportSection, str] = {
+    "executive": "Executive Summary",
+    "components": "Major Modules and Components",
+    "skills": "Suggested Developer Skillset",
+}
+
+
+def parse_sections(spec: str) -> list[ReportSection]:
+    """
+    Parses a comma-separated list of section names, like 'executive,skills'.
+    """
+    sections = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in sections if name not in SECTION_NAMES]
+    if unknown or not sections:
+        raise Exception(
+            f"unknown report sections {unknown}, expected some of {list(SECTION_NAMES)}"
+        )
+    # always in the order of the report
+    return [name for name in SECTION_NAMES if name in sections]
+
+
+def get_key(**values) -> str:
+    raw = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SectionInputs:
+    """
+    What a section read while it was generated.
+    Thread-safe, as a section may be generated by several threads.
+    """
+
+    def __init__(self) -> None:
+        # communities whose summaries were read
+        self.community_ids: set[str] = set()
+        # communities whose code constructs were listed
+        self.member_community_ids: set[str] = set()
+        self.node_ids: set[str] = set()
+        self.source_paths: set[str] = set()
+        self._lock = threading.Lock()
+        return
+
+    def add(
+        self,
+        *,
+        community_ids: list[str],
+        member_community_ids: list[str],
+        node_ids: list[str],
+        source_paths: list[str],
+    ) -> None:
+        with self._lock:
+            self.community_ids.update(community_ids)
+            self.member_community_ids.update(member_community_ids)
+            self.node_ids.update(node_ids)
+            self.source_paths.update(source_paths)
+            pass
+        return
+
+    pass
+
+
+_current_inputs: ContextVar[SectionInputs | None] = ContextVar(
+    "report_section_inputs", default=None
+)
+
+
+@contextmanager
+def recording_inputs(inputs: SectionInputs) -> Iterator[None]:
+    """
+    Records what is read in this context into 'inputs'; see 'record_inputs'.
+    Threads started inside it must run in a copy of the context (see 'contextvars.copy_context').
+    """
+    token = _current_inputs.set(inputs)
+    try:
+        yield
+    finally:
+        _current_inputs.reset(token)
+        pass
+    return
+
+
+def record_inputs(
+    *,
+    community_ids: list[str] | None = None,
+    member_community_ids: list[str] | None = None,
+    node_ids: list[str] | None = None,
+    source_paths: list[str] | None = None,
+) -> None:
+    inputs = _current_inputs.get()
+    if inputs is None:
+        return
+    inputs.add(
+        community_ids=community_ids or [],
+        member_community_ids=member_community_ids or [],
+        node_ids=node_ids or [],
+        source_paths=source_paths or [],
+    )
+    return
+
+
+def _hash_source_file(path: Path) -> str | None:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def get_inputs_digest(
+    *,
+    snapshot: KgSnapshot,
+    hierarchy: CommunityHierarchyIndex,
+    code_base_path: Path,
+    community_ids: list[str],
+    member_community_ids: list[str],
+    node_ids: list[str],
+    source_paths: list[str],
+) -> str | None:
+    """
+    None if any of the inputs no longer exists.
+    """
+    h = hashlib.sha256()
+    for community_id in sorted(community_ids):
+        summaries = snapshot.summaries_by_id.get(community_id)
+        if summaries is None:
+            return None
+        h.update(json.dumps([community_id, summaries], sort_keys=True).encode("utf-8"))
+        pass
+    for community_id in sorted(member_community_ids):
+        if community_id not in snapshot.communities:
+            return None
+        member_node_ids = sorted(hierarchy.get_descendant_node_ids(community_id))
+        h.update(json.dumps([community_id, member_node_ids]).encode("utf-8"))
+        pass
+    for node_id in sorted(node_ids):
+        if node_id not in snapshot.node_details_by_id:
+            return None
+        details = snapshot.node_details_by_id[node_id]
+        h.update(json.dumps([node_id, details], sort_keys=True).encode("utf-8"))
+        pass
+    for source_path in sorted(source_paths):
+        file_hash = _hash_source_file(code_base_path / source_path)
+        if file_hash is None:
+            return None
+        h.update(f"{source_path}\0{file_hash}\0".encode("utf-8"))
+        pass
+    return h.hexdigest()
+
+
+class SectionFingerprint(NamedTuple):
+    key: str
+    community_ids: list[str]
+    member_community_ids: list[str]
+    node_ids: list[str]
+    source_paths: list[str]
+    digest: str
+    # the code constructs the section covers, for the sections that depend on it
+    code_node_ids: list[str]
+    pass
+
+
+class StoredSection(NamedTuple):
+    content: str
+    fingerprint: SectionFingerprint
+    pass
+
+
+class ReportSectionStore:
+    """
+    Every section is a markdown file, with its fingerprint in a JSON file next to it.
+    The fingerprint is written last, so a section is only ever reused once it is complete.
+    """
+
+    def __init__(self, sections_dir: Path | str) -> None:
+        self.sections_dir = Path(sections_dir)
+        return
+
+    def _get_paths(self, name: ReportSection) -> tuple[Path, Path]:
+        return (
+            self.sections_dir / f"{name}.md",
+            self.sections_dir / f"{name}.json",
+        )
+
+    def load(self, name: ReportSection) -> StoredSection | None:
+        content_path, fingerprint_path = self._get_paths(name)
+        if not fingerprint_path.exists():
+            return None
+        try:
+            with open(fingerprint_path, "r") as f:
+                data = json.load(f)
+                pass
+            if data.get("version") != SECTIONS_VERSION:
+                return None
+            fingerprint = SectionFingerprint(
+                key=data["key"],
+                community_ids=data["community_ids"],
+                member_community_ids=data["member_community_ids"],
+                node_ids=data["node_ids"],
+                source_paths=data["source_paths"],
+                digest=data["digest"],
+                code_node_ids=data["code_node_ids"],
+            )
+            content = content_path.read_text()
+        except (OSError, ValueError, KeyError) as e:
+            logging.error("failed to load report section %s: %s", fingerprint_path, e)
+            return None
+        return StoredSection(content=content, fingerprint=fingerprint)
+
+    def save(self, name: ReportSection, section: StoredSection) -> None:
+        os.makedirs(self.sections_dir, exist_ok=True)
+        content_path, fingerprint_path = self._get_paths(name)
+        # the old fingerprint must not vouch for the new content, even briefly
+        fingerprint_path.unlink(missing_ok=True)
+        for path, data in [
+            (content_path, section.content),
+            (
+                fingerprint_path,
+                json.dumps(
+                    {"version": SECTIONS_VERSION, **section.fingerprint._asdict()}
+                ),
+            ),
+        ]:
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                f.write(data)
+                pass
+            os.replace(tmp_path, path)
+            pass
+        return
+
+    pass
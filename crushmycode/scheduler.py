@@ -0,0 +1,263 @@
+"""
+Scheduling of LLM API traffic, for builds (across worker processes) and reports (across threads).
+
+ - Requests wait on a token bucket shared by every process, with a requests-per-minute
+   and a tokens-per-minute limit.
+ - Rate-limited (429), failed (5xx) and dropped requests are retried with jittered exponential backoff.
+   A 429 pauses every process, for at least as long as the API's 'Retry-After' asks.
+
+Every request made through 'btdcore's 'RestClientBase' (which 'expert_llm' and minikg use)
+is scheduled once 'install_scheduler' has run in the process.
+"""
+
+import functools
+import json
+import logging
+import multiprocessing
+import random
+import time
+from typing import NamedTuple
+
+import requests
+from btdcore.rest_client_base import RestClientBase
+
+from crushmycode import profiling
+from crushmycode.prompt_budget import estimate_tokens
+
+
+# requests may burst up to this many seconds' worth of the per-minute limits
+BURST_SECONDS = 10
+# assumed size of a completion, when the request does not cap it
+DEFAULT_COMPLETION_TOKENS = 500
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# (connect, read) seconds; without one, a stalled connection stalls its worker forever
+REQUEST_TIMEOUT_S = (10, 300)
+
+# indexes into the shared state
+_REQUESTS_LEVEL = 0
+_TOKENS_LEVEL = 1
+_LAST_REFILL = 2
+_PAUSED_UNTIL = 3
+
+
+class RetryPolicy(NamedTuple):
+    max_attempts: int = 8
+    base_delay_s: float = 1.0
+    max_delay_s: float = 60.0
+
+    def get_delay(self, attempt: int) -> float:
+        # 'full jitter', so that clients which failed together do not retry together
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2**attempt))
+
+    pass
+
+
+class RequestScheduler:
+    """
+    Token buckets in shared memory, so they are respected by every process
+    the scheduler is passed to (see 'install_scheduler').
+    A limit of None is not enforced.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: float | None,
+        tokens_per_minute: float | None,
+        retry_policy: RetryPolicy = RetryPolicy(),
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.retry_policy = retry_policy
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray("d", 4)
+        self._state[_REQUESTS_LEVEL] = self._get_capacity(requests_per_minute)
+        self._state[_TOKENS_LEVEL] = self._get_capacity(tokens_per_minute)
+        self._state[_LAST_REFILL] = time.time()
+        self._state[_PAUSED_UNTIL] = 0.0
+        return
+
+    @staticmethod
+    def _get_capacity(per_minute: float | None) -> float:
+        if per_minute is None:
+            return 0.0
+        return max(1.0, per_minute * BURST_SECONDS / 60)
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._state[_LAST_REFILL])
+        self._state[_LAST_REFILL] = now
+        for i, per_minute in [
+            (_REQUESTS_LEVEL, self.requests_per_minute),
+            (_TOKENS_LEVEL, self.tokens_per_minute),
+        ]:
+            if per_minute is not None:
+                self._state[i] = min(
+                    self._get_capacity(per_minute),
+                    self._state[i] + elapsed * per_minute / 60,
+                )
+                pass
+            pass
+        return
+
+    def acquire(self, n_tokens: int) -> None:
+        """
+        Blocks until a request of (an estimated) 'n_tokens' may be sent.
+        A request larger than the bucket goes through once the bucket is full,
+        and leaves it in debt.
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                wait_s = self._state[_PAUSED_UNTIL] - now
+                for i, per_minute, needed in [
+                    (_REQUESTS_LEVEL, self.requests_per_minute, 1),
+                    (_TOKENS_LEVEL, self.tokens_per_minute, n_tokens),
+                ]:
+                    if per_minute is None:
+                        continue
+                    needed = min(needed, self._get_capacity(per_minute))
+                    deficit = needed - self._state[i]
+                    wait_s = max(wait_s, deficit * 60 / per_minute)
+                    pass
+                if wait_s <= 0:
+                    self._state[_REQUESTS_LEVEL] -= 1
+                    self._state[_TOKENS_LEVEL] -= n_tokens
+                    return
+                pass
+            time.sleep(wait_s)
+            pass
+        return
+
+    def settle(self, *, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Corrects the token bucket once a response reports how many tokens were really used.
+        """
+        if self.tokens_per_minute is None:
+            return
+        with self._lock:
+            self._state[_TOKENS_LEVEL] += estimated_tokens - actual_tokens
+            pass
+        return
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._state[_PAUSED_UNTIL] = max(
+                self._state[_PAUSED_UNTIL], time.time() + seconds
+            )
+            pass
+        return
+
+    pass
+
+
+def estimate_request_tokens(kwargs: dict) -> int:
+    payload = kwargs.get("json")
+    if not isinstance(payload, dict):
+        return 0
+    prompt = json.dumps(payload.get("messages") or payload.get("input") or "")
+    completion = payload.get("max_tokens") or (
+        DEFAULT_COMPLETION_TOKENS if "messages" in payload else 0
+    )
+    return estimate_tokens(prompt) + completion
+
+
+def _get_usage(res: requests.Response) -> dict | None:
+    try:
+        usage = res.json()["usage"]
+        int(usage["total_tokens"])
+        return usage
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _get_retry_after_s(res: requests.Response) -> float:
+    try:
+        return float(res.headers.get("Retry-After", 0))
+    except ValueError:
+        # may also be an HTTP date, which we do not bother with
+        return 0.0
+
+
+_scheduler: RequestScheduler | None = None
+_original_req = RestClientBase._req
+
+
+def _scheduled_req(
+    self: RestClientBase,
+    method: str,
+    path: str,
+    *,
+    ignore_error: bool = False,
+    **kwargs,
+):
+    scheduler = _scheduler
+    assert scheduler
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT_S)
+    n_tokens = estimate_request_tokens(kwargs)
+    policy = scheduler.retry_policy
+    payload = kwargs.get("json")
+    record_request = functools.partial(
+        profiling.record_request,
+        name=f"{method} {path}",
+        started_us=time.time() * 1_000_000,
+        model=str(payload.get("model", "")) if isinstance(payload, dict) else "",
+    )
+    for attempt in range(policy.max_attempts):
+        is_last_attempt = attempt + 1 == policy.max_attempts
+        scheduler.acquire(n_tokens)
+        try:
+            res = _original_req(self, method, path, ignore_error=True, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if is_last_attempt:
+                record_request(attempts=attempt + 1, usage=None, error=str(e))
+                raise e
+            delay_s = policy.get_delay(attempt)
+            logging.warning(
+                "request to %s%s failed (%s), retrying in %.1fs", self.base, path, e, delay_s
+            )
+            time.sleep(delay_s)
+            continue
+
+        if res.ok:
+            usage = _get_usage(res)
+            if usage is not None:
+                scheduler.settle(
+                    estimated_tokens=n_tokens, actual_tokens=int(usage["total_tokens"])
+                )
+                pass
+            record_request(attempts=attempt + 1, usage=usage)
+            return res
+        if res.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+            break
+        delay_s = max(_get_retry_after_s(res), policy.get_delay(attempt))
+        if res.status_code == 429:
+            # every process is over the limit, not just this one
+            scheduler.pause(delay_s)
+            pass
+        logging.warning(
+            "request to %s%s got status %d, retrying in %.1fs",
+            self.base,
+            path,
+            res.status_code,
+            delay_s,
+        )
+        time.sleep(delay_s)
+        pass
+
+    record_request(attempts=attempt + 1, usage=None, error=f"status {res.status_code}")
+    if not ignore_error:
+        res.raise_for_status()
+        pass
+    return res
+
+
+def install_scheduler(scheduler: RequestScheduler) -> None:
+    """
+    Routes every 'RestClientBase' request in this process through 'scheduler'.
+    Also the initializer of the build's worker processes (see 'crushmycode.step_pool').
+    """
+    global _scheduler
+    _scheduler = scheduler
+    RestClientBase._req = _scheduled_req
+    return
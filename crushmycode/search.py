@@ -0,0 +1,379 @@
+"""
+Full-text search over a knowledge graph: code nodes (by ID, entity type and description),
+and communities and groups (by summary name and purpose), ranked by BM25.
+
+The index is built once per package and persisted in the cache directory as plain '.npy' arrays,
+which are memory-mapped on load, so a query only touches the postings of its own terms:
+ - postings in CSR form: 'postings_ptr' (one range per term), 'postings_docs', and 'postings_weights',
+   the BM25 score contribution of the term to the document, computed at build time
+ - for every document: its kind, its parent document (so that ancestry is a walk up 'doc_parent'),
+   and its ID, title and snippet as packed strings
+"""
+
+from collections import Counter
+import json
+import logging
+import os
+from pathlib import Path
+import re
+import shutil
+from typing import Iterator, Literal, NamedTuple
+
+import numpy as np
+
+from minikg.models import Group
+
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.kgcache import get_package_fingerprint, pack_strings
+from crushmycode.snapshot import KgSnapshot
+
+
+SEARCH_INDEX_DIR_NAME = "search-index"
+SEARCH_INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+# names and IDs count for more than descriptions
+TITLE_WEIGHT = 2
+MAX_SNIPPET_CHARS = 200
+
+DocKind = Literal["node", "community", "group"]
+DOC_KINDS: tuple[DocKind, ...] = ("node", "community", "group")
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+# parts of camelCase and PascalCase words, keeping acronyms together ('HTTPServer' -> 'HTTP', 'Server')
+_WORD_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_ARRAY_NAMES = (
+    "postings_ptr",
+    "postings_docs",
+    "postings_weights",
+    "doc_kind",
+    "doc_parent",
+    "doc_ids_buf",
+    "doc_ids_offsets",
+    "titles_buf",
+    "titles_offsets",
+    "snippets_buf",
+    "snippets_offsets",
+)
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """
+    Lowercased words, plus the parts of camelCase words.
+    snake_case and path-like identifiers are split into their parts.
+    """
+    for word in _WORD_RE.findall(text):
+        yield word.lower()
+        parts = _WORD_PART_RE.findall(word)
+        if len(parts) > 1:
+            for part in parts:
+                yield part.lower()
+                pass
+            pass
+        pass
+    return
+
+
+class SearchHit(NamedTuple):
+    kind: DocKind
+    id: str
+    title: str
+    snippet: str
+    score: float
+    # (ID, title) of the communities and groups containing the hit, innermost first
+    ancestry: list[tuple[str, str]]
+    pass
+
+
+class _Doc(NamedTuple):
+    kind: DocKind
+    id: str
+    title: str
+    text: str
+    parent_id: str | None
+    pass
+
+
+def _get_group_parents(groups: dict[str, Group]) -> dict[str, str]:
+    """
+    The group containing every (top-level) community and group.
+    """
+    parents: dict[str, str] = {}
+    for group in groups.values():
+        for child_id in [*group.child_group_ids, *group.child_community_ids]:
+            # the first clustering round reuses the IDs of the communities it groups
+            if child_id != group.group_id:
+                parents.setdefault(child_id, group.group_id)
+                pass
+            pass
+        pass
+    return parents
+
+
+def _iter_docs(
+    snapshot: KgSnapshot,
+    hierarchy: CommunityHierarchyIndex,
+) -> Iterator[_Doc]:
+    group_parents = _get_group_parents(snapshot.cluster_groups)
+    for node_id in snapshot.node_ids:
+        details = snapshot.node_details_by_id[node_id]
+        ancestors = hierarchy.get_ancestor_community_ids(node_id)
+        yield _Doc(
+            kind="node",
+            id=node_id,
+            title=node_id,
+            text=" ".join(
+                [details.get("entity_type", ""), details.get("description", "")]
+            ),
+            parent_id=ancestors[0] if ancestors else None,
+        )
+        pass
+    for community_id in hierarchy.community_ids:
+        summary = snapshot.summaries_by_id.get(community_id, {})
+        yield _Doc(
+            kind="community",
+            id=community_id,
+            title=summary.get("name", community_id),
+            text=summary.get("purpose", ""),
+            parent_id=hierarchy.get_parent_id(community_id)
+            or group_parents.get(community_id),
+        )
+        pass
+    for group in snapshot.cluster_groups.values():
+        # otherwise the same as the community of the same ID
+        if group.group_id in hierarchy.community_index:
+            continue
+        yield _Doc(
+            kind="group",
+            id=group.group_id,
+            title=group.summary.get("name", group.group_id),
+            text=group.summary.get("purpose", ""),
+            parent_id=group_parents.get(group.group_id),
+        )
+        pass
+    return
+
+
+def _get_string(buf: np.ndarray, offsets: np.ndarray, i: int) -> str:
+    return bytes(buf[offsets[i] : offsets[i + 1]]).decode("utf-8")
+
+
+class KgSearchIndex:
+    def __init__(self, *, terms: list[str], arrays: dict[str, np.ndarray]) -> None:
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.arrays = arrays
+        self.n_docs = len(arrays["doc_kind"])
+        return
+
+    @classmethod
+    def build(
+        cls,
+        snapshot: KgSnapshot,
+        hierarchy: CommunityHierarchyIndex,
+    ) -> "KgSearchIndex":
+        docs = list(_iter_docs(snapshot, hierarchy))
+        doc_index = {}
+        for i, doc in enumerate(docs):
+            # communities before groups, for the IDs they share
+            doc_index.setdefault(doc.id, i)
+            pass
+
+        term_ids: dict[str, int] = {}
+        posting_terms: list[int] = []
+        posting_docs: list[int] = []
+        posting_tfs: list[int] = []
+        doc_len = np.zeros(len(docs), dtype=np.float64)
+        for i, doc in enumerate(docs):
+            counts = Counter(tokenize(doc.text))
+            for token in tokenize(doc.title):
+                counts[token] += TITLE_WEIGHT
+                pass
+            doc_len[i] = sum(counts.values())
+            for term, tf in counts.items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_docs.append(i)
+                posting_tfs.append(tf)
+                pass
+            pass
+
+        terms_arr = np.array(posting_terms, dtype=np.int64)
+        # stable, so every term's postings stay in document order
+        order = np.argsort(terms_arr, kind="stable")
+        docs_arr = np.array(posting_docs, dtype=np.int32)[order]
+        tfs = np.array(posting_tfs, dtype=np.float64)[order]
+        df = np.bincount(terms_arr, minlength=len(term_ids))
+        postings_ptr = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        np.cumsum(df, out=postings_ptr[1:])
+
+        n = len(docs)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        avg_len = doc_len.mean() if n else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[docs_arr] / avg_len)
+        weights = idf[terms_arr[order]] * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        doc_ids_buf, doc_ids_offsets = pack_strings([doc.id for doc in docs])
+        titles_buf, titles_offsets = pack_strings([doc.title for doc in docs])
+        snippets_buf, snippets_offsets = pack_strings(
+            [doc.text[:MAX_SNIPPET_CHARS] for doc in docs]
+        )
+        arrays = {
+            "postings_ptr": postings_ptr,
+            "postings_docs": docs_arr,
+            "postings_weights": weights.astype(np.float32),
+            "doc_kind": np.array(
+                [DOC_KINDS.index(doc.kind) for doc in docs], dtype=np.uint8
+            ),
+            "doc_parent": np.array(
+                [
+                    doc_index.get(doc.parent_id, -1) if doc.parent_id else -1
+                    for doc in docs
+                ],
+                dtype=np.int32,
+            ),
+            "doc_ids_buf": doc_ids_buf,
+            "doc_ids_offsets": doc_ids_offsets,
+            "titles_buf": titles_buf,
+            "titles_offsets": titles_offsets,
+            "snippets_buf": snippets_buf,
+            "snippets_offsets": snippets_offsets,
+        }
+        return cls(terms=list(term_ids), arrays=arrays)
+
+    @classmethod
+    def load_or_build(cls, *, cache_dir: Path | str) -> "KgSearchIndex":
+        """
+        Loads the index persisted in 'cache_dir', (re)building it if the package has changed since.
+        """
+        index_dir = Path(cache_dir) / SEARCH_INDEX_DIR_NAME
+        fingerprint = get_package_fingerprint(cache_dir)
+        if fingerprint and index_dir.exists():
+            try:
+                loaded = cls.load(index_dir)
+                if loaded[1] == fingerprint:
+                    return loaded[0]
+                pass
+            except Exception as e:
+                logging.error("failed to load search index %s: %s", index_dir, e)
+                pass
+            pass
+        logging.info("building search index of the knowledge graph in '%s'", cache_dir)
+        snapshot = KgSnapshot.load_or_build(cache_dir=cache_dir)
+        index = cls.build(
+            snapshot,
+            CommunityHierarchyIndex.load_or_build(
+                cache_dir=cache_dir,
+                communities=snapshot.communities,
+                root_ids=snapshot.community_hierarchy[0],
+            ),
+        )
+        if fingerprint:
+            index.save(index_dir, fingerprint=fingerprint)
+            pass
+        return index
+
+    @classmethod
+    def load(cls, index_dir: Path) -> tuple["KgSearchIndex", str]:
+        """
+        Returns the index and the package fingerprint it was built from.
+        """
+        with open(index_dir / "meta.json", "r") as f:
+            meta = json.load(f)
+            pass
+        if meta["version"] != SEARCH_INDEX_VERSION:
+            raise Exception(f"unsupported search index version {meta['version']}")
+        with open(index_dir / "terms.json", "r") as f:
+            terms = json.load(f)
+            pass
+        arrays = {
+            name: np.load(index_dir / f"{name}.npy", mmap_mode="r")
+            for name in _ARRAY_NAMES
+        }
+        return cls(terms=terms, arrays=arrays), meta["fingerprint"]
+
+    def save(self, index_dir: Path, *, fingerprint: str) -> None:
+        # written next to the old index, then swapped in
+        tmp_dir = index_dir.with_name(f"{index_dir.name}.{os.getpid()}.tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+            pass
+        os.makedirs(tmp_dir)
+        for name in _ARRAY_NAMES:
+            np.save(tmp_dir / f"{name}.npy", np.asarray(self.arrays[name]))
+            pass
+        with open(tmp_dir / "terms.json", "w") as f:
+            json.dump(list(self.term_ids), f)
+            pass
+        with open(tmp_dir / "meta.json", "w") as f:
+            json.dump({"version": SEARCH_INDEX_VERSION, "fingerprint": fingerprint}, f)
+            pass
+        if index_dir.exists():
+            old_dir = index_dir.with_name(f"{index_dir.name}.{os.getpid()}.old")
+            os.replace(index_dir, old_dir)
+            os.replace(tmp_dir, index_dir)
+            shutil.rmtree(old_dir)
+            pass
+        else:
+            os.replace(tmp_dir, index_dir)
+            pass
+        return
+
+    def _get_doc_string(self, name: str, i: int) -> str:
+        return _get_string(self.arrays[f"{name}_buf"], self.arrays[f"{name}_offsets"], i)
+
+    def get_ancestry(self, doc: int) -> list[tuple[str, str]]:
+        ancestry: list[tuple[str, str]] = []
+        parent = int(self.arrays["doc_parent"][doc])
+        # bounded, in case the groups are not a tree
+        while parent >= 0 and len(ancestry) < self.n_docs:
+            ancestry.append(
+                (self._get_doc_string("doc_ids", parent), self._get_doc_string("titles", parent))
+            )
+            parent = int(self.arrays["doc_parent"][parent])
+            pass
+        return ancestry
+
+    def search(
+        self,
+        query: str,
+        *,
+        limit: int = 10,
+        kinds: list[DocKind] | None = None,
+    ) -> list[SearchHit]:
+        term_ids = {self.term_ids[t] for t in tokenize(query) if t in self.term_ids}
+        if not term_ids or limit <= 0:
+            return []
+        ptr = self.arrays["postings_ptr"]
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term_id in term_ids:
+            lo, hi = int(ptr[term_id]), int(ptr[term_id + 1])
+            # a document appears once in the postings of a term
+            scores[self.arrays["postings_docs"][lo:hi]] += self.arrays[
+                "postings_weights"
+            ][lo:hi]
+            pass
+        if kinds:
+            kind_codes = [DOC_KINDS.index(kind) for kind in kinds]
+            scores[~np.isin(self.arrays["doc_kind"], kind_codes)] = 0
+            pass
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit:
+            candidates = candidates[
+                np.argpartition(-scores[candidates], limit - 1)[:limit]
+            ]
+            pass
+        # best first, then in index order
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [
+            SearchHit(
+                kind=DOC_KINDS[int(self.arrays["doc_kind"][i])],
+                id=self._get_doc_string("doc_ids", i),
+                title=self._get_doc_string("titles", i),
+                snippet=self._get_doc_string("snippets", i),
+                score=float(scores[i]),
+                ancestry=self.get_ancestry(i),
+            )
+            for i in candidates.tolist()
+        ]
+
+    pass
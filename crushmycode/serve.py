@@ -0,0 +1,395 @@
+"""
+A local HTTP server over one or more knowledge graph cache directories.
+
+Every package is loaded once, and every rendered response is kept in memory until the
+cache directory (or its package) changes, so requests do not pay for the startup,
+imports and package loading that every 'show-graph' or 'report' invocation does.
+
+Routes, for a package named after its cache directory:
+ - '/': the packages being served
+ - '/<package>/graph.html' and '/<package>/graph.json': the graph, as 'show-graph' draws it
+   ('?nodes=1' to include code nodes, '?layout=auto|physics|radial')
+ - '/<package>/lazy.html': the graph, as 'show-graph --lazy' draws it, with its shards under '/<package>/lazy_shards/'
+ - '/<package>/report': the report generated by 'report', from the report directory
+ - '/<package>/nodes?q=<text>': code nodes whose ID contains the text
+ - '/<package>/nodes/<node ID>': the attributes of a code node, and the communities containing it
+ - '/<package>/search?q=<words>': full-text search ('&limit=', '&kinds=node,community,group')
+"""
+
+from collections.abc import Callable
+import gzip
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+from pathlib import Path
+import threading
+from typing import NamedTuple, get_args
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from crushmycode.graph_viz import LayoutMode, build_communities_network
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.kgcache import get_package_fingerprint
+from crushmycode.lazy_viz import build_lazy_network, get_expand_script, render_shard
+from crushmycode.search import DOC_KINDS, KgSearchIndex
+from crushmycode.snapshot import KgSnapshot
+
+
+LAZY_SHARD_DIR_NAME = "lazy_shards"
+DEFAULT_RESULT_LIMIT = 50
+# smaller responses are not worth compressing
+MIN_GZIP_BYTES = 1024
+
+
+class Response(NamedTuple):
+    body: bytes
+    content_type: str
+    pass
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        return
+
+    pass
+
+
+def _json_response(data) -> Response:
+    return Response(
+        body=json.dumps(data).encode("utf-8"),
+        content_type="application/json",
+    )
+
+
+class ServedPackage:
+    """
+    A package, and the responses rendered from it.
+    Reloaded on the next request after the cache directory or the package changes.
+    """
+
+    def __init__(self, *, cache_dir: Path, report_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self.name = cache_dir.name
+        self.report_path = report_dir / f"{self.name}.md"
+        # also held while rendering, so that concurrent requests do not render the same thing twice
+        self._lock = threading.RLock()
+        self._fingerprint: tuple | None = None
+        self._snapshot: KgSnapshot | None = None
+        self._hierarchy: CommunityHierarchyIndex | None = None
+        self._search_index: KgSearchIndex | None = None
+        self._responses: dict[tuple, Response] = {}
+        return
+
+    def _get_fingerprint(self) -> tuple:
+        return (
+            self.cache_dir.stat().st_mtime_ns,
+            get_package_fingerprint(self.cache_dir),
+        )
+
+    def _refresh(self) -> None:
+        # called with the lock held
+        fingerprint = self._get_fingerprint()
+        if fingerprint == self._fingerprint:
+            return
+        logging.info("loading package '%s'", self.cache_dir)
+        self._snapshot = KgSnapshot.load_or_build(cache_dir=self.cache_dir)
+        self._hierarchy = CommunityHierarchyIndex.load_or_build(
+            cache_dir=self.cache_dir,
+            communities=self._snapshot.communities,
+            root_ids=self._snapshot.community_hierarchy[0],
+        )
+        self._search_index = None
+        self._responses = {}
+        # loading may have written derived artifacts into the cache directory
+        self._fingerprint = self._get_fingerprint()
+        return
+
+    @property
+    def snapshot(self) -> KgSnapshot:
+        with self._lock:
+            self._refresh()
+            assert self._snapshot
+            return self._snapshot
+
+    @property
+    def hierarchy(self) -> CommunityHierarchyIndex:
+        with self._lock:
+            self._refresh()
+            assert self._hierarchy
+            return self._hierarchy
+
+    @property
+    def search_index(self) -> KgSearchIndex:
+        with self._lock:
+            self._refresh()
+            if self._search_index is None:
+                # built on first use
+                self._search_index = KgSearchIndex.load_or_build(cache_dir=self.cache_dir)
+                pass
+            return self._search_index
+
+    def get_response(self, key: tuple, render: Callable[[], Response]) -> Response:
+        with self._lock:
+            self._refresh()
+            if key not in self._responses:
+                self._responses[key] = render()
+                pass
+            return self._responses[key]
+
+    def get_graph(self, *, include_nodes: bool, layout: LayoutMode, fmt: str) -> Response:
+        def render() -> Response:
+            snapshot = self.snapshot
+            net = build_communities_network(
+                groups=snapshot.cluster_groups,
+                communities=snapshot.communities,
+                com_summaries=snapshot.summaries_by_id,
+                node_details_by_id=snapshot.node_details_by_id,
+                include_nodes=include_nodes,
+                hierarchy=self.hierarchy,
+                layout=layout,
+                layout_cache_dir=self.cache_dir,
+            )
+            if fmt == "json":
+                return Response(
+                    body="".join(net.iter_json()).encode("utf-8"),
+                    content_type="application/json",
+                )
+            return Response(
+                body=net.render_html().encode("utf-8"),
+                content_type="text/html; charset=utf-8",
+            )
+
+        return self.get_response(("graph", include_nodes, layout, fmt), render)
+
+    def get_lazy_page(self) -> Response:
+        def render() -> Response:
+            snapshot = self.snapshot
+            net = build_lazy_network(
+                groups=snapshot.cluster_groups,
+                communities=snapshot.communities,
+                com_summaries=snapshot.summaries_by_id,
+                hierarchy=self.hierarchy,
+            )
+            return Response(
+                body=net.render_html(
+                    script=get_expand_script(LAZY_SHARD_DIR_NAME)
+                ).encode("utf-8"),
+                content_type="text/html; charset=utf-8",
+            )
+
+        return self.get_response(("lazy",), render)
+
+    def get_lazy_shard(self, shard: int) -> Response:
+        def render() -> Response:
+            hierarchy = self.hierarchy
+            if not 0 <= shard < len(hierarchy.community_ids):
+                raise HttpError(HTTPStatus.NOT_FOUND, f"no shard {shard}")
+            snapshot = self.snapshot
+            return Response(
+                body=render_shard(
+                    snapshot.communities[hierarchy.community_ids[shard]],
+                    communities=snapshot.communities,
+                    com_summaries=snapshot.summaries_by_id,
+                    node_details_by_id=snapshot.node_details_by_id,
+                    hierarchy=hierarchy,
+                ).encode("utf-8"),
+                content_type="text/javascript; charset=utf-8",
+            )
+
+        return self.get_response(("shard", shard), render)
+
+    def get_report(self) -> Response:
+        if not self.report_path.exists():
+            raise HttpError(
+                HTTPStatus.NOT_FOUND,
+                f"no report at '{self.report_path}', generate one with 'crushmycode report'",
+            )
+        mtime_ns = self.report_path.stat().st_mtime_ns
+
+        def render() -> Response:
+            return Response(
+                body=self.report_path.read_bytes(),
+                content_type="text/markdown; charset=utf-8",
+            )
+
+        return self.get_response(("report", mtime_ns), render)
+
+    def find_nodes(self, text: str, *, limit: int) -> Response:
+        text = text.lower()
+        snapshot = self.snapshot
+        matches = [node_id for node_id in snapshot.node_ids if text in node_id.lower()]
+        return _json_response({"n_matches": len(matches), "node_ids": matches[:limit]})
+
+    def search(self, query: str, *, limit: int, kinds: list) -> Response:
+        hits = self.search_index.search(query, limit=limit, kinds=kinds)
+        return _json_response([hit._asdict() for hit in hits])
+
+    def get_node(self, node_id: str) -> Response:
+        snapshot = self.snapshot
+        if node_id not in snapshot.node_details_by_id:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"no node '{node_id}'")
+        return _json_response(
+            {
+                "id": node_id,
+                "details": snapshot.node_details_by_id[node_id],
+                "community_ids": self.hierarchy.get_ancestor_community_ids(node_id),
+            }
+        )
+
+    pass
+
+
+class KgServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        *,
+        packages: list[ServedPackage],
+    ) -> None:
+        super().__init__(address, KgRequestHandler)
+        self.packages = {package.name: package for package in packages}
+        return
+
+    pass
+
+
+class KgRequestHandler(BaseHTTPRequestHandler):
+    server: KgServer
+
+    def do_GET(self) -> None:
+        try:
+            response = self._route()
+        except HttpError as e:
+            self._send_error(e.status, str(e))
+            return
+        except Exception as e:
+            logging.exception("failed to serve '%s'", self.path)
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            return
+        self._send(HTTPStatus.OK, response)
+        return
+
+    def _route(self) -> Response:
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip("/").split("/", 2)]
+        if parts == [""]:
+            return _json_response(
+                [
+                    {"name": package.name, "cache_dir": str(package.cache_dir)}
+                    for package in self.server.packages.values()
+                ]
+            )
+        package = self.server.packages.get(parts[0])
+        if package is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"no package '{parts[0]}'")
+        route = parts[1] if len(parts) > 1 else ""
+        rest = parts[2] if len(parts) > 2 else None
+
+        if route in ("graph.html", "graph.json"):
+            layout = query.get("layout", "auto")
+            if layout not in get_args(LayoutMode):
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"unknown layout '{layout}'")
+            return package.get_graph(
+                include_nodes=query.get("nodes", "0") not in ("", "0", "false"),
+                layout=layout,
+                fmt=route.split(".")[1],
+            )
+        if route == "lazy.html":
+            return package.get_lazy_page()
+        if route == LAZY_SHARD_DIR_NAME and rest and rest.endswith(".js"):
+            try:
+                shard = int(rest[: -len(".js")])
+            except ValueError:
+                raise HttpError(HTTPStatus.NOT_FOUND, f"no shard '{rest}'")
+            return package.get_lazy_shard(shard)
+        if route == "report":
+            return package.get_report()
+        if route == "search":
+            kinds = [kind for kind in query.get("kinds", "").split(",") if kind]
+            if any(kind not in DOC_KINDS for kind in kinds):
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"'kinds' must be among {DOC_KINDS}")
+            return package.search(
+                query.get("q", ""),
+                limit=self._get_limit(query),
+                kinds=kinds,
+            )
+        if route == "nodes" and rest:
+            return package.get_node(rest)
+        if route == "nodes":
+            return package.find_nodes(query.get("q", ""), limit=self._get_limit(query))
+        raise HttpError(HTTPStatus.NOT_FOUND, f"no route '{url.path}'")
+
+    def _get_limit(self, query: dict[str, str]) -> int:
+        try:
+            return int(query.get("limit", DEFAULT_RESULT_LIMIT))
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'limit' must be an integer")
+
+    def _send(self, status: HTTPStatus, response: Response) -> None:
+        body = response.body
+        is_gzipped = len(body) >= MIN_GZIP_BYTES and "gzip" in self.headers.get(
+            "Accept-Encoding", ""
+        )
+        if is_gzipped:
+            body = gzip.compress(body, compresslevel=5)
+            pass
+        self.send_response(status)
+        self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if is_gzipped:
+            self.send_header("Content-Encoding", "gzip")
+            pass
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send(status, _json_response({"error": message}))
+        return
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug("%s - %s", self.address_string(), format % args)
+        return
+
+    pass
+
+
+def serve(
+    *,
+    cache_dirs: list[str],
+    report_dir: str,
+    host: str,
+    port: int,
+) -> None:
+    packages: list[ServedPackage] = []
+    for cache_dir in cache_dirs:
+        path = Path(cache_dir)
+        if not path.exists():
+            raise Exception(f"cache path '{cache_dir}' does not exist")
+        package = ServedPackage(cache_dir=path, report_dir=Path(report_dir))
+        if any(served.name == package.name for served in packages):
+            raise Exception(f"more than one package is named '{package.name}'")
+        # loaded up front, so that the first request is as fast as the rest
+        package.snapshot
+        packages.append(package)
+        pass
+    server = KgServer((host, port), packages=packages)
+    logging.info(
+        "serving %d packages on http://%s:%d/",
+        len(packages),
+        host,
+        server.server_address[1],
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pass
+    return
@@ -0,0 +1,682 @@
+"""
+A compact snapshot of the parts of a minikg package that 'show-graph' and 'report' read.
+
+The package itself pickles the whole networkx graph, which has to be materialized to read anything.
+The snapshot is a single '.npz' of flat arrays instead:
+every string is stored once in an interned string table, and everything else refers to strings by index.
+Node details are only decoded when they are looked up.
+
+'KgSnapshot' loads the whole snapshot; 'SnapshotTables' memory-maps it to read a range of rows at a time.
+"""
+
+from collections.abc import Mapping
+import logging
+import os
+from pathlib import Path
+import struct
+from typing import Iterable, Iterator
+import zipfile
+
+import numpy as np
+
+from minikg.build_output import BuildStepOutput_Package
+from minikg.models import Community, Group
+
+from crushmycode.kgcache import (
+    get_package_fingerprint,
+    get_package_path,
+    pack_strings,
+)
+
+
+SNAPSHOT_FILE_NAME = "kg-snapshot.npz"
+# fields of a node's 'defining_fragment', stored as columns
+FRAGMENT_STRING_FIELDS = ("fragment_id", "source_path")
+FRAGMENT_INT_FIELDS = ("start_line_incl", "end_line_excl")
+
+
+def load_package(cache_dir: Path | str) -> BuildStepOutput_Package:
+    """
+    Reads the package minikg persisted in 'cache_dir'.
+    """
+    path = get_package_path(cache_dir)
+    if not path.exists():
+        raise Exception(f"no knowledge graph package at '{path}'")
+    return BuildStepOutput_Package.from_bytes(path.read_bytes())
+
+
+class _StringInterner:
+    def __init__(self) -> None:
+        self.index: dict[str, int] = {}
+        return
+
+    def add(self, s: str) -> int:
+        return self.index.setdefault(s, len(self.index))
+
+    def add_all(self, strings: Iterable[str]) -> np.ndarray:
+        return np.array([self.add(s) for s in strings], dtype=np.int32)
+
+    def add_lists(self, lists: list[list[str]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the lists in CSR form: list 'i' is values[ptr[i] : ptr[i + 1]].
+        """
+        ptr = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(strings) for strings in lists], out=ptr[1:])
+        values = self.add_all(s for strings in lists for s in strings)
+        return ptr, values
+
+    def add_dicts(
+        self,
+        dicts: list[dict[str, str]],
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        ptr, keys = self.add_lists([list(d.keys()) for d in dicts])
+        values = self.add_all(str(v) for d in dicts for v in d.values())
+        return ptr, keys, values
+
+    pass
+
+
+class _StringTable:
+    def __init__(self, buf: np.ndarray, offsets: np.ndarray) -> None:
+        self.raw = buf.tobytes()
+        self.offsets = offsets.tolist()
+        return
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw[self.offsets[i] : self.offsets[i + 1]].decode("utf-8")
+
+    def get_all(self, indexes: np.ndarray) -> list[str]:
+        return [self[i] for i in indexes.tolist()]
+
+    def get_lists(self, ptr: np.ndarray, values: np.ndarray) -> list[list[str]]:
+        strings = self.get_all(values)
+        bounds = ptr.tolist()
+        return [strings[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def get_dicts(
+        self,
+        ptr: np.ndarray,
+        keys: np.ndarray,
+        values: np.ndarray,
+    ) -> list[dict[str, str]]:
+        key_lists = self.get_lists(ptr, keys)
+        value_lists = self.get_lists(ptr, values)
+        return [dict(zip(k, v)) for k, v in zip(key_lists, value_lists)]
+
+    pass
+
+
+class _MappedStringTable(_StringTable):
+    """
+    Decodes every string straight from the (memory-mapped) buffer, without copying the whole table.
+    """
+
+    def __init__(self, buf: np.ndarray, offsets: np.ndarray) -> None:
+        self.raw = memoryview(buf)
+        self.offsets_array = offsets
+        return
+
+    def __getitem__(self, i: int) -> str:
+        lo, hi = self.offsets_array[i : i + 2].tolist()
+        return str(self.raw[lo:hi], "utf-8")
+
+    def get_all(self, indexes: np.ndarray) -> list[str]:
+        indexes = np.asarray(indexes)
+        raw = self.raw
+        return [
+            str(raw[lo:hi], "utf-8")
+            for lo, hi in zip(
+                self.offsets_array[indexes].tolist(),
+                self.offsets_array[indexes + 1].tolist(),
+            )
+        ]
+
+    pass
+
+
+def _map_npz(path: Path) -> dict[str, np.ndarray]:
+    """
+    Memory-maps every array of an uncompressed '.npz' (as 'np.savez' writes), which 'np.load' cannot do.
+    Scalars and empty arrays, which cannot be mapped, are read.
+    """
+    arrays: dict[str, np.ndarray] = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise Exception(f"'{info.filename}' of '{path}' is compressed and cannot be mapped")
+            # the local header's name and extra field lengths may differ from the central directory's
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<26xHH", f.read(30))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                pass
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                pass
+            name = info.filename.removesuffix(".npy")
+            if dtype.hasobject or not shape or 0 in shape:
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                arrays[name] = np.lib.format.read_array(f)
+                continue
+            arrays[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=f.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+            pass
+        pass
+    return arrays
+
+
+def _read_fingerprint(path: Path) -> str | None:
+    """
+    The package fingerprint the snapshot at 'path' was built from, reading nothing else;
+    None if there is no readable snapshot.
+    """
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as data:
+            return str(data["fingerprint"])
+    except Exception as e:
+        logging.error("failed to read snapshot %s: %s", path, e)
+        pass
+    return None
+
+
+def _get_node_attribute(
+    arrays: dict[str, np.ndarray],
+    strings: _StringTable,
+    key: str,
+    *,
+    start: int,
+    stop: int,
+) -> list[str | None]:
+    ptr = arrays["node_attr_ptr"]
+    lo, hi = int(ptr[start]), int(ptr[stop])
+    attr_keys = np.asarray(arrays["node_attr_keys"][lo:hi])
+    values: list[str | None] = [None] * (stop - start)
+    # strings are interned, so every occurrence of 'key' has the same index
+    key_indexes = [i for i in np.unique(attr_keys).tolist() if strings[i] == key]
+    if not key_indexes:
+        return values
+    positions = lo + np.flatnonzero(attr_keys == key_indexes[0])
+    owners = np.searchsorted(ptr[start : stop + 1], positions, side="right") - 1
+    for i, value in zip(
+        owners.tolist(),
+        strings.get_all(arrays["node_attr_values"][positions]),
+    ):
+        values[i] = value
+        pass
+    return values
+
+
+def _get_fragment_attribute(
+    arrays: dict[str, np.ndarray],
+    strings: _StringTable,
+    field: str,
+    *,
+    start: int,
+    stop: int,
+) -> list[str | int | None]:
+    has_fragment = arrays["has_fragment"][start:stop].tolist()
+    values: list
+    if field in FRAGMENT_STRING_FIELDS:
+        values = strings.get_all(arrays[f"fragment_{field}"][start:stop])
+        pass
+    else:
+        j = FRAGMENT_INT_FIELDS.index(field)
+        values = arrays["fragment_ints"][start:stop, j].tolist()
+        pass
+    return [value if has else None for value, has in zip(values, has_fragment)]
+
+
+class _NodeDetails(Mapping):
+    """
+    Read-only 'node ID -> node attributes' mapping, in the shape of networkx node data.
+    """
+
+    def __init__(self, snapshot: "KgSnapshot") -> None:
+        self._snapshot = snapshot
+        return
+
+    def __getitem__(self, node_id: str) -> dict:
+        return self._snapshot.get_node_details(node_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snapshot.node_ids)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.node_ids)
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self._snapshot.node_index
+
+    pass
+
+
+class KgSnapshot:
+    """
+    Exposes the same 'communities', 'community_hierarchy', 'summaries_by_id' and 'cluster_groups'
+    as the package, with graph nodes and edges as:
+     - 'node_ids'
+     - 'edges', an (m, 2) array of indexes into 'node_ids'
+     - 'node_details_by_id', a mapping of node ID to its attributes
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        self._arrays = arrays
+        strings = _StringTable(arrays["strings_buf"], arrays["strings_offsets"])
+        self._strings = strings
+
+        self.node_ids = strings.get_all(arrays["node_ids"])
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.edges = arrays["edges"]
+        self.node_details_by_id: Mapping[str, dict] = _NodeDetails(self)
+
+        community_ids = strings.get_all(arrays["community_ids"])
+        child_community_ids = strings.get_lists(
+            arrays["community_child_community_ptr"],
+            arrays["community_child_community_ids"],
+        )
+        child_node_ids = strings.get_lists(
+            arrays["community_child_node_ptr"],
+            arrays["community_child_node_ids"],
+        )
+        # already validated when the snapshot was written
+        self.communities = {
+            community_id: Community.model_construct(
+                id=community_id,
+                child_community_ids=child_community_ids[i],
+                child_node_ids=child_node_ids[i],
+            )
+            for i, community_id in enumerate(community_ids)
+        }
+        self.community_hierarchy = strings.get_lists(
+            arrays["hierarchy_ptr"], arrays["hierarchy_ids"]
+        )
+        self.summaries_by_id = dict(
+            zip(
+                strings.get_all(arrays["summary_owner_ids"]),
+                strings.get_dicts(
+                    arrays["summary_ptr"],
+                    arrays["summary_keys"],
+                    arrays["summary_values"],
+                ),
+            )
+        )
+
+        group_ids = strings.get_all(arrays["group_ids"])
+        group_child_community_ids = strings.get_lists(
+            arrays["group_child_community_ptr"], arrays["group_child_community_ids"]
+        )
+        group_child_group_ids = strings.get_lists(
+            arrays["group_child_group_ptr"], arrays["group_child_group_ids"]
+        )
+        group_summaries = strings.get_dicts(
+            arrays["group_summary_ptr"],
+            arrays["group_summary_keys"],
+            arrays["group_summary_values"],
+        )
+        self.cluster_groups = {
+            group_id: Group.model_construct(
+                group_id=group_id,
+                child_community_ids=group_child_community_ids[i],
+                child_group_ids=group_child_group_ids[i],
+                summary=group_summaries[i],
+            )
+            for i, group_id in enumerate(group_ids)
+        }
+        return
+
+    @classmethod
+    def from_package(cls, pkg: BuildStepOutput_Package) -> "KgSnapshot":
+        interner = _StringInterner()
+        arrays: dict[str, np.ndarray] = {}
+
+        node_ids = list(pkg.G.nodes)
+        node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        arrays["node_ids"] = interner.add_all(node_ids)
+        arrays["edges"] = np.array(
+            [(node_index[u], node_index[v]) for u, v in pkg.G.edges() if u != v],
+            dtype=np.int32,
+        ).reshape(-1, 2)
+
+        # string attributes are kept generically, the defining fragment as columns
+        node_attrs: list[dict[str, str]] = []
+        fragment_strings = {field: [] for field in FRAGMENT_STRING_FIELDS}
+        fragment_ints = np.full(
+            (len(node_ids), len(FRAGMENT_INT_FIELDS)), -1, dtype=np.int64
+        )
+        has_fragment = np.zeros(len(node_ids), dtype=bool)
+        for i, node_id in enumerate(node_ids):
+            data = pkg.G.nodes[node_id]
+            node_attrs.append(
+                {k: v for k, v in data.items() if isinstance(v, str)}
+            )
+            fragment = data.get("defining_fragment")
+            has_fragment[i] = bool(fragment)
+            for field in FRAGMENT_STRING_FIELDS:
+                fragment_strings[field].append(
+                    str(fragment[field]) if fragment else ""
+                )
+                pass
+            for j, field in enumerate(FRAGMENT_INT_FIELDS):
+                if fragment:
+                    fragment_ints[i, j] = fragment[field]
+                    pass
+                pass
+            pass
+        (
+            arrays["node_attr_ptr"],
+            arrays["node_attr_keys"],
+            arrays["node_attr_values"],
+        ) = interner.add_dicts(node_attrs)
+        arrays["has_fragment"] = has_fragment
+        for field in FRAGMENT_STRING_FIELDS:
+            arrays[f"fragment_{field}"] = interner.add_all(fragment_strings[field])
+            pass
+        arrays["fragment_ints"] = fragment_ints
+
+        communities = list(pkg.communities.values())
+        arrays["community_ids"] = interner.add_all(c.id for c in communities)
+        (
+            arrays["community_child_community_ptr"],
+            arrays["community_child_community_ids"],
+        ) = interner.add_lists([c.child_community_ids for c in communities])
+        (
+            arrays["community_child_node_ptr"],
+            arrays["community_child_node_ids"],
+        ) = interner.add_lists([c.child_node_ids for c in communities])
+        arrays["hierarchy_ptr"], arrays["hierarchy_ids"] = interner.add_lists(
+            pkg.community_hierarchy
+        )
+        arrays["summary_owner_ids"] = interner.add_all(pkg.summaries_by_id.keys())
+        (
+            arrays["summary_ptr"],
+            arrays["summary_keys"],
+            arrays["summary_values"],
+        ) = interner.add_dicts(list(pkg.summaries_by_id.values()))
+
+        groups = list(pkg.cluster_groups.values())
+        arrays["group_ids"] = interner.add_all(g.group_id for g in groups)
+        (
+            arrays["group_child_community_ptr"],
+            arrays["group_child_community_ids"],
+        ) = interner.add_lists([g.child_community_ids for g in groups])
+        (
+            arrays["group_child_group_ptr"],
+            arrays["group_child_group_ids"],
+        ) = interner.add_lists([g.child_group_ids for g in groups])
+        (
+            arrays["group_summary_ptr"],
+            arrays["group_summary_keys"],
+            arrays["group_summary_values"],
+        ) = interner.add_dicts([g.summary for g in groups])
+
+        arrays["strings_buf"], arrays["strings_offsets"] = pack_strings(
+            list(interner.index)
+        )
+        return cls(arrays)
+
+    @classmethod
+    def load_or_build(cls, *, cache_dir: Path | str) -> "KgSnapshot":
+        """
+        Loads the snapshot persisted in 'cache_dir', (re)building it from the package
+        if the package has changed since.
+        """
+        snapshot_path = Path(cache_dir) / SNAPSHOT_FILE_NAME
+        fingerprint = get_package_fingerprint(cache_dir)
+        if fingerprint and _read_fingerprint(snapshot_path) == fingerprint:
+            try:
+                return cls.load(snapshot_path)[0]
+            except Exception as e:
+                logging.error("failed to load snapshot %s: %s", snapshot_path, e)
+                pass
+            pass
+        logging.info("building snapshot of the knowledge graph in '%s'", cache_dir)
+        snapshot = cls.from_package(load_package(cache_dir))
+        snapshot.save(snapshot_path, fingerprint=fingerprint)
+        return snapshot
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["KgSnapshot", str]:
+        """
+        Returns the snapshot and the package fingerprint it was built from.
+        """
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+            pass
+        fingerprint = str(arrays.pop("fingerprint"))
+        return cls(arrays), fingerprint
+
+    def save(self, path: Path, *, fingerprint: str) -> None:
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, fingerprint=np.array(fingerprint), **self._arrays)
+        os.replace(tmp_path, path)
+        return
+
+    def get_node_attribute(
+        self,
+        key: str,
+        *,
+        start: int = 0,
+        stop: int | None = None,
+    ) -> list[str | None]:
+        """
+        The string attribute 'key' of the nodes node_ids[start : stop];
+        None for the nodes without it.
+        """
+        stop = len(self.node_ids) if stop is None else min(stop, len(self.node_ids))
+        return _get_node_attribute(self._arrays, self._strings, key, start=start, stop=stop)
+
+    def get_fragment_attribute(
+        self,
+        field: str,
+        *,
+        start: int = 0,
+        stop: int | None = None,
+    ) -> list[str | int | None]:
+        """
+        The 'field' of the defining fragment of the nodes node_ids[start : stop];
+        None for the nodes without one.
+        """
+        stop = len(self.node_ids) if stop is None else min(stop, len(self.node_ids))
+        return _get_fragment_attribute(self._arrays, self._strings, field, start=start, stop=stop)
+
+    def get_node_details(self, node_id: str) -> dict:
+        i = self.node_index[node_id]
+        arrays = self._arrays
+        lo, hi = arrays["node_attr_ptr"][i : i + 2].tolist()
+        details: dict = {
+            self._strings[int(k)]: self._strings[int(v)]
+            for k, v in zip(
+                arrays["node_attr_keys"][lo:hi], arrays["node_attr_values"][lo:hi]
+            )
+        }
+        if arrays["has_fragment"][i]:
+            fragment: dict = {
+                field: self._strings[int(arrays[f"fragment_{field}"][i])]
+                for field in FRAGMENT_STRING_FIELDS
+            }
+            for j, field in enumerate(FRAGMENT_INT_FIELDS):
+                fragment[field] = int(arrays["fragment_ints"][i, j])
+                pass
+            details["defining_fragment"] = fragment
+            pass
+        return details
+
+    pass
+
+
+class SnapshotTables:
+    """
+    Reads the snapshot persisted in a cache directory a range of rows at a time, memory-mapped:
+    only the rows read are decoded, and the rest of the file stays on disk.
+    Rows follow the order of 'KgSnapshot': 'node_ids', 'edges', and the keys of
+    'communities', 'cluster_groups' and 'summaries_by_id'.
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        self._arrays = arrays
+        self._strings = _MappedStringTable(arrays["strings_buf"], arrays["strings_offsets"])
+        self.n_nodes = len(arrays["node_ids"])
+        self.n_edges = len(arrays["edges"])
+        self.n_communities = len(arrays["community_ids"])
+        self.n_groups = len(arrays["group_ids"])
+        self.n_summaries = len(arrays["summary_owner_ids"])
+        return
+
+    @classmethod
+    def open(cls, *, cache_dir: Path | str) -> "SnapshotTables":
+        """
+        (Re)builds the snapshot first if the package has changed since, which loads the package whole.
+        """
+        snapshot_path = Path(cache_dir) / SNAPSHOT_FILE_NAME
+        fingerprint = get_package_fingerprint(cache_dir)
+        if not fingerprint or _read_fingerprint(snapshot_path) != fingerprint:
+            KgSnapshot.load_or_build(cache_dir=cache_dir)
+            pass
+        arrays = _map_npz(snapshot_path)
+        arrays.pop("fingerprint")
+        return cls(arrays)
+
+    def _get_lists(self, name: str, start: int, stop: int) -> list[list[str]]:
+        ptr = np.asarray(self._arrays[f"{name}_ptr"][start : stop + 1])
+        values = self._arrays[f"{name}_ids"][ptr[0] : ptr[-1]]
+        return self._strings.get_lists(ptr - ptr[0], values)
+
+    def _get_dicts(self, name: str, start: int, stop: int) -> list[dict[str, str]]:
+        ptr = np.asarray(self._arrays[f"{name}_ptr"][start : stop + 1])
+        lo, hi = int(ptr[0]), int(ptr[-1])
+        return self._strings.get_dicts(
+            ptr - lo,
+            self._arrays[f"{name}_keys"][lo:hi],
+            self._arrays[f"{name}_values"][lo:hi],
+        )
+
+    def get_node_ids(self, *, start: int, stop: int) -> list[str]:
+        return self._strings.get_all(self._arrays["node_ids"][start:stop])
+
+    def get_edges(self, *, start: int, stop: int) -> tuple[list[str], list[str]]:
+        """
+        The source and target node IDs of the edges edges[start : stop].
+        """
+        edges = np.asarray(self._arrays["edges"][start:stop])
+        node_ids = self._arrays["node_ids"]
+        return (
+            self._strings.get_all(node_ids[edges[:, 0]]),
+            self._strings.get_all(node_ids[edges[:, 1]]),
+        )
+
+    def get_node_attribute(self, key: str, *, start: int, stop: int) -> list[str | None]:
+        """
+        See 'KgSnapshot.get_node_attribute'.
+        """
+        return _get_node_attribute(self._arrays, self._strings, key, start=start, stop=stop)
+
+    def get_fragment_attribute(
+        self, field: str, *, start: int, stop: int
+    ) -> list[str | int | None]:
+        """
+        See 'KgSnapshot.get_fragment_attribute'.
+        """
+        return _get_fragment_attribute(self._arrays, self._strings, field, start=start, stop=stop)
+
+    def get_community_ids(self, rows: np.ndarray) -> list[str]:
+        return self._strings.get_all(self._arrays["community_ids"][rows])
+
+    def get_communities(self, *, start: int, stop: int) -> list[Community]:
+        community_ids = self.get_community_ids(np.arange(start, stop))
+        child_community_ids = self._get_lists("community_child_community", start, stop)
+        child_node_ids = self._get_lists("community_child_node", start, stop)
+        return [
+            Community.model_construct(
+                id=community_id,
+                child_community_ids=child_community_ids[i],
+                child_node_ids=child_node_ids[i],
+            )
+            for i, community_id in enumerate(community_ids)
+        ]
+
+    def get_community_tree(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The parent row (-1 for none) and depth of every community row, as integer arrays;
+        -1 for both if the communities are not reached from the roots of the community hierarchy.
+        A community with more than one parent is under the one reached first, level by level.
+        """
+        arrays = self._arrays
+        n = self.n_communities
+        # community rows by string index
+        community_strings = np.asarray(arrays["community_ids"])
+        order = np.argsort(community_strings, kind="stable")
+        sorted_strings = community_strings[order]
+
+        def get_rows(strings: np.ndarray) -> np.ndarray:
+            if not n:
+                return np.full(len(strings), -1, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(sorted_strings, strings), n - 1)
+            return np.where(sorted_strings[positions] == strings, order[positions], -1)
+
+        ptr = np.asarray(arrays["community_child_community_ptr"])
+        children = get_rows(np.asarray(arrays["community_child_community_ids"]))
+        owners = np.repeat(np.arange(n), np.diff(ptr))
+        hierarchy_ptr = np.asarray(arrays["hierarchy_ptr"])
+        roots = (
+            get_rows(np.asarray(arrays["hierarchy_ids"][hierarchy_ptr[0] : hierarchy_ptr[1]]))
+            if len(hierarchy_ptr) > 1
+            else np.zeros(0, dtype=np.int64)
+        )
+        roots = np.unique(roots[roots >= 0])
+
+        parent = np.full(n, -1, dtype=np.int64)
+        depth = np.full(n, -1, dtype=np.int64)
+        depth[roots] = 0
+        frontier = roots
+        d = 0
+        while len(frontier):
+            in_frontier = np.zeros(n, dtype=bool)
+            in_frontier[frontier] = True
+            reached = in_frontier[owners] & (children >= 0)
+            new_children, new_parents = children[reached], owners[reached]
+            unseen = depth[new_children] < 0
+            new_children, first = np.unique(new_children[unseen], return_index=True)
+            d += 1
+            depth[new_children] = d
+            parent[new_children] = new_parents[unseen][first]
+            frontier = new_children
+            pass
+        return parent, depth
+
+    def get_groups(self, *, start: int, stop: int) -> list[Group]:
+        group_ids = self._strings.get_all(self._arrays["group_ids"][start:stop])
+        child_community_ids = self._get_lists("group_child_community", start, stop)
+        child_group_ids = self._get_lists("group_child_group", start, stop)
+        summaries = self._get_dicts("group_summary", start, stop)
+        return [
+            Group.model_construct(
+                group_id=group_id,
+                child_community_ids=child_community_ids[i],
+                child_group_ids=child_group_ids[i],
+                summary=summaries[i],
+            )
+            for i, group_id in enumerate(group_ids)
+        ]
+
+    def get_summaries(self, *, start: int, stop: int) -> list[tuple[str, dict[str, str]]]:
+        """
+        The (owner ID, summary) of the summaries summaries_by_id[start : stop].
+        """
+        return list(
+            zip(
+                self._strings.get_all(self._arrays["summary_owner_ids"][start:stop]),
+                self._get_dicts("summary", start, stop),
+            )
+        )
+
+    pass
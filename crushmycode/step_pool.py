@@ -0,0 +1,276 @@
+"""
+The process pool that build steps run on.
+
+The pool may be shared fairly by the builds of several repositories,
+and is replaced if a worker dies, in which case only the steps that had not completed are resubmitted.
+Every worker process routes its LLM requests through the request scheduler.
+When profiling, every step is timed in its worker, and the worker's events are sent back with the step.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import threading
+from typing import TypeVar
+
+from minikg.build_steps.base_step import MiniKgBuilderStep
+from minikg.models import MiniKgConfig
+from minikg.progress_emitter import ProgressEmitter
+from minikg.step_executor import DEBUG, StepExecutor, execute_step
+
+from crushmycode import profiling
+from crushmycode.scheduler import RequestScheduler, install_scheduler
+
+
+MAX_POOL_RESTARTS = 10
+
+T = TypeVar("T", bound=MiniKgBuilderStep)
+
+
+def _get_step_name(step: MiniKgBuilderStep) -> str:
+    return step.__class__.__name__
+
+
+def execute_step_profiled(step: T) -> tuple[T, list[dict]]:
+    """
+    Runs in a worker process: returns the completed step, and the events recorded while it ran.
+    """
+    profiler = profiling.Profiler()
+    profiling.install_profiler(profiler)
+    try:
+        with profiler.stage(_get_step_name(step), cat="step", step_id=step.get_id()):
+            completed = execute_step(step)
+            pass
+        pass
+    finally:
+        profiling.install_profiler(None)
+        pass
+    return completed, profiler.events
+
+
+class _StepBatch:
+    def __init__(
+        self,
+        steps: list,
+        *,
+        key: str,
+        profiler: profiling.Profiler | None = None,
+    ) -> None:
+        self.steps = steps
+        self.key = key
+        self.profiler = profiler
+        self.completed: list = [None] * len(steps)
+        self.n_remaining = len(steps)
+        self.error: BaseException | None = None
+        return
+
+    pass
+
+
+class StepPool:
+    """
+    A process pool that build steps of one or more knowledge graphs ('keys') are run on.
+     - Steps are dispatched round-robin between keys, and only a few more are handed to the
+       processes than there are workers, so no key's backlog can starve the others.
+     - If a worker dies, the pool is replaced, and the steps that had not completed are resubmitted.
+     - Every worker process routes its requests through the request scheduler.
+    Thread-safe: every key's steps are run by a thread of its own.
+    """
+
+    def __init__(self, *, scheduler: RequestScheduler, workers: int) -> None:
+        self.scheduler = scheduler
+        self.workers = max(1, workers)
+        # a small backlog in the pool keeps workers busy between completions
+        self.max_in_flight = 2 * self.workers
+        # reentrant, as a step that completes immediately runs its callback while dispatching
+        self._cond = threading.Condition(threading.RLock())
+        self._queues: dict[str, deque[tuple[_StepBatch, int]]] = {}
+        self._key_order: deque[str] = deque()
+        self._n_in_flight = 0
+        self._ex: ProcessPoolExecutor | None = None
+        self._n_restarts = 0
+        self._error: BaseException | None = None
+        return
+
+    def __enter__(self) -> "StepPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+        return
+
+    def shutdown(self) -> None:
+        with self._cond:
+            ex, self._ex = self._ex, None
+            pass
+        if ex:
+            ex.shutdown(wait=True)
+            pass
+        return
+
+    def run_steps(self, steps: list[T], *, key: str) -> list[T]:
+        if not steps:
+            return []
+        profiler = profiling.get_profiler()
+        if DEBUG:
+            completed = []
+            for step in steps:
+                with profiling.stage(
+                    _get_step_name(step), cat="step", step_id=step.get_id()
+                ):
+                    completed.append(execute_step(step))
+                    pass
+                pass
+            return completed
+        batch = _StepBatch(steps, key=key, profiler=profiler)
+        with self._cond:
+            if key not in self._queues:
+                self._queues[key] = deque()
+                self._key_order.append(key)
+                pass
+            self._queues[key].extend((batch, i) for i in range(len(steps)))
+            while batch.n_remaining and not self._error:
+                self._dispatch()
+                self._cond.wait()
+                pass
+            if self._error:
+                raise self._error
+            pass
+        if batch.error:
+            raise batch.error
+        return batch.completed
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._ex is None:
+            self._ex = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=install_scheduler,
+                initargs=(self.scheduler,),
+            )
+            pass
+        return self._ex
+
+    def _dispatch(self) -> None:
+        # called with the lock held
+        while self._n_in_flight < self.max_in_flight:
+            item = self._pop_next()
+            if item is None:
+                break
+            batch, i = item
+            ex = self._get_executor()
+            try:
+                future = (
+                    ex.submit(execute_step_profiled, batch.steps[i])
+                    if batch.profiler
+                    else ex.submit(execute_step, batch.steps[i])
+                )
+            except BrokenProcessPool:
+                # broke before the callbacks of its steps in flight ran
+                self._queues[batch.key].appendleft(item)
+                self._on_broken_pool(ex)
+                if self._error:
+                    break
+                continue
+            self._n_in_flight += 1
+            future.add_done_callback(
+                lambda future, batch=batch, i=i, ex=ex: self._on_done(
+                    future, batch=batch, i=i, ex=ex
+                )
+            )
+            pass
+        return
+
+    def _pop_next(self) -> tuple[_StepBatch, int] | None:
+        for _ in range(len(self._key_order)):
+            key = self._key_order[0]
+            self._key_order.rotate(-1)
+            if self._queues[key]:
+                return self._queues[key].popleft()
+            pass
+        return None
+
+    def _on_done(
+        self,
+        future: Future,
+        *,
+        batch: _StepBatch,
+        i: int,
+        ex: ProcessPoolExecutor,
+    ) -> None:
+        with self._cond:
+            self._n_in_flight -= 1
+            try:
+                result = future.result()
+                if batch.profiler:
+                    result, events = result
+                    batch.profiler.add_events(events)
+                    pass
+                batch.completed[i] = result
+                batch.n_remaining -= 1
+            except BrokenProcessPool:
+                self._on_broken_pool(ex)
+                # run again, ahead of everything else
+                self._queues[batch.key].appendleft((batch, i))
+            except BaseException as e:
+                batch.error = batch.error or e
+                batch.n_remaining -= 1
+                pass
+            self._cond.notify_all()
+            pass
+        return
+
+    def _on_broken_pool(self, ex: ProcessPoolExecutor) -> None:
+        # every step in flight on a broken pool fails, but it only counts as one restart
+        if self._ex is not ex:
+            return
+        self._ex = None
+        ex.shutdown(wait=False)
+        self._n_restarts += 1
+        if self._n_restarts > MAX_POOL_RESTARTS:
+            self._error = Exception(
+                f"worker processes died {self._n_restarts} times, giving up"
+            )
+            return
+        logging.warning("a worker process died, restarting the pool")
+        return
+
+    pass
+
+
+class SupervisedStepExecutor(StepExecutor):
+    """
+    minikg's step executor, running the steps of one knowledge graph on a 'StepPool'.
+    """
+
+    def __init__(
+        self,
+        config: MiniKgConfig,
+        *,
+        step_pool: StepPool,
+        key: str,
+        progress_emitter: ProgressEmitter | None = None,
+    ):
+        super().__init__(config, progress_emitter=progress_emitter)
+        self.step_pool = step_pool
+        self.key = key
+        return
+
+    def _execute_all_steps(self, steps: list[T]) -> list[T]:
+        if not steps:
+            return []
+        logging.debug(
+            "executing %d steps of type %s for %s",
+            len(steps),
+            steps[0].__class__.__name__,
+            self.key,
+        )
+        with profiling.stage(
+            f"{steps[0].__class__.__name__} (all)",
+            n_steps=len(steps),
+            key=self.key,
+        ):
+            return self.step_pool.run_steps(steps, key=self.key)
+        pass
+
+    pass
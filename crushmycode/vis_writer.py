@@ -0,0 +1,379 @@
+"""
+Writes vis.js network pages directly, in the same shape as pyvis' default template.
+
+pyvis keeps node IDs in a list and scans every existing edge on each 'add_edge',
+so building large graphs with it is quadratic.
+"""
+
+from copy import deepcopy
+import json
+from typing import Any, Iterable, Iterator, TextIO
+
+import numpy as np
+
+
+DEFAULT_NODE_COLOR = "#97c2fc"
+DEFAULT_HEIGHT = "600px"
+DEFAULT_WIDTH = "100%"
+
+DEFAULT_OPTIONS: dict[str, Any] = {
+    "configure": {
+        "enabled": False,
+    },
+    "edges": {
+        "color": {
+            "inherit": True,
+        },
+        "smooth": {
+            "enabled": True,
+            "type": "dynamic",
+        },
+    },
+    "interaction": {
+        "dragNodes": True,
+        "hideEdgesOnDrag": False,
+        "hideNodesOnDrag": False,
+    },
+    "physics": {
+        "enabled": True,
+        "stabilization": {
+            "enabled": True,
+            "fit": True,
+            "iterations": 1000,
+            "onlyDynamicEdges": False,
+            "updateInterval": 50,
+        },
+    },
+}
+
+# characters that could end the inline '<script>' (or open a comment in it), escaped the way pyvis' 'tojson' did
+_SCRIPT_JSON_ESCAPES = str.maketrans({"<": "\\u003c", ">": "\\u003e", "&": "\\u0026"})
+
+
+def script_json(value: Any, **kwargs) -> str:
+    """
+    'json.dumps', safe to write into an inline script or a javascript file.
+    """
+    return json.dumps(value, **kwargs).translate(_SCRIPT_JSON_ESCAPES)
+
+
+_HTML_HEAD = """<html>
+    <head>
+        <meta charset="utf-8">
+        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css" integrity="sha512-WgxfT5LWjfszlPHXRmBWHkV2eceiWTOBvrKCNbdgDYTHrT2AeLCGbF4sZlZw3UMN3WtL0tGUoIAKsu8mllg/XA==" crossorigin="anonymous" referrerpolicy="no-referrer" />
+        <script src="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js" integrity="sha512-LnvoEWDFrqGHlHmDD2101OrLcbsfkrzoSpvtSQtxK3RMnRV0eOkhhBN2dXHKRrUU8p2DGRTk35n4O8nWSVe1mQ==" crossorigin="anonymous" referrerpolicy="no-referrer"></script>
+        <link
+          href="https://cdn.jsdelivr.net/npm/bootstrap@5.0.0-beta3/dist/css/bootstrap.min.css"
+          rel="stylesheet"
+          integrity="sha384-eOJMYsd53ii+scO/bJGFsiCZc+5NDVN2yr8+0RDqr0Ql0h+rP48ckxlpbzKgwra6"
+          crossorigin="anonymous"
+        />
+        <style type="text/css">
+             #mynetwork {
+                 width: %(width)s;
+                 height: %(height)s;
+                 background-color: #ffffff;
+                 border: 1px solid lightgray;
+                 position: relative;
+                 float: left;
+             }
+             #loadingBar {
+                 position:absolute;
+                 top:0px;
+                 left:0px;
+                 width: 100%%;
+                 height: %(height)s;
+                 background-color:rgba(200,200,200,0.8);
+                 transition: all 0.5s ease;
+                 opacity:1;
+             }
+             #bar {
+                 position:absolute;
+                 top:0px;
+                 left:0px;
+                 width:20px;
+                 height:20px;
+                 margin:auto auto auto auto;
+                 border-radius:11px;
+                 border:2px solid rgba(30,30,30,0.05);
+                 background: rgb(0, 173, 246);
+                 box-shadow: 2px 0px 4px rgba(0,0,0,0.4);
+             }
+             #border {
+                 position:absolute;
+                 top:10px;
+                 left:10px;
+                 width:500px;
+                 height:23px;
+                 margin:auto auto auto auto;
+                 box-shadow: 0px 0px 4px rgba(0,0,0,0.2);
+                 border-radius:10px;
+             }
+             #text {
+                 position:absolute;
+                 top:8px;
+                 left:530px;
+                 width:30px;
+                 height:50px;
+                 margin:auto auto auto auto;
+                 font-size:22px;
+                 color: #000000;
+             }
+             div.outerBorder {
+                 position:relative;
+                 top:400px;
+                 width:600px;
+                 height:44px;
+                 margin:auto auto auto auto;
+                 border:8px solid rgba(0,0,0,0.1);
+                 background: linear-gradient(to bottom,  rgba(252,252,252,1) 0%%,rgba(237,237,237,1) 100%%);
+                 border-radius:72px;
+                 box-shadow: 0px 0px 10px rgba(0,0,0,0.2);
+             }
+        </style>
+    </head>
+    <body>
+        <div class="card" style="width: 100%%">
+            <div id="mynetwork" class="card-body"></div>
+        </div>
+        <div id="loadingBar">
+          <div class="outerBorder">
+            <div id="text">0%%</div>
+            <div id="border">
+              <div id="bar"></div>
+            </div>
+          </div>
+        </div>
+        <script type="text/javascript">
+              var nodes;
+              var edges;
+              var network;
+
+              function drawGraph() {
+                  var container = document.getElementById('mynetwork');
+"""
+
+_HTML_TAIL = """
+                  var data = {nodes: nodes, edges: edges};
+                  var options = %(options)s;
+                  network = new vis.Network(container, data, options);
+                  if (!options.physics.enabled) {
+                      document.getElementById('loadingBar').style.display = 'none';
+                  }
+                  network.on("stabilizationProgress", function(params) {
+                      document.getElementById('loadingBar').removeAttribute("style");
+                      var maxWidth = 496;
+                      var minWidth = 20;
+                      var widthFactor = params.iterations/params.total;
+                      var width = Math.max(minWidth,maxWidth * widthFactor);
+                      document.getElementById('bar').style.width = width + 'px';
+                      document.getElementById('text').innerHTML = Math.round(widthFactor*100) + '%%';
+                  });
+                  network.once("stabilizationIterationsDone", function() {
+                      document.getElementById('text').innerHTML = '100%%';
+                      document.getElementById('bar').style.width = '496px';
+                      document.getElementById('loadingBar').style.opacity = 0;
+                      setTimeout(function () {document.getElementById('loadingBar').style.display = 'none';}, 500);
+                  });
+                  return network;
+              }
+              drawGraph();
+%(script)s
+        </script>
+    </body>
+</html>
+"""
+
+
+class VisNetworkWriter:
+    """
+    Collects nodes and edges with the same semantics as pyvis' 'Network' (undirected,
+    first definition of a node or edge wins), in O(1) per addition,
+    then writes them straight into a standalone vis.js HTML page.
+
+    Nodes may be given precomputed coordinates with 'set_positions',
+    in which case the page is written with physics disabled.
+    """
+
+    def __init__(
+        self,
+        *,
+        height: str = DEFAULT_HEIGHT,
+        width: str = DEFAULT_WIDTH,
+    ) -> None:
+        self.height = height
+        self.width = width
+        self.node_index: dict[str, int] = {}
+        self._edge_keys: set[tuple[str, str]] = set()
+        self._nodes: list[dict] = []
+        self._edges: list[dict] = []
+        self._positions: np.ndarray | None = None
+        return
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self._edges)
+
+    @property
+    def node_ids(self) -> list[str]:
+        return list(self.node_index)
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self.node_index
+
+    def get_edge_index_pairs(self) -> np.ndarray:
+        """
+        Edges as an (m, 2) array of (source, target) indexes in node insertion order.
+        """
+        return np.array(
+            [
+                (self.node_index[edge["from"]], self.node_index[edge["to"]])
+                for edge in self._edges
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+    def set_positions(self, positions: np.ndarray) -> None:
+        """
+        'positions' is an (n, 2) array of coordinates, in node insertion order.
+        """
+        assert positions.shape == (self.n_nodes, 2)
+        self._positions = positions
+        return
+
+    def add_node(
+        self,
+        node_id: str,
+        *,
+        label: str | None = None,
+        shape: str = "dot",
+        color: str = DEFAULT_NODE_COLOR,
+        **options,
+    ) -> None:
+        if node_id in self.node_index:
+            return
+        self.node_index[node_id] = len(self._nodes)
+        self._nodes.append(
+            make_node(node_id, label=label, shape=shape, color=color, **options)
+        )
+        return
+
+    def add_edge(self, source: str, to: str, **options) -> None:
+        if source not in self.node_index:
+            raise Exception(f"non existent node '{source}'")
+        if to not in self.node_index:
+            raise Exception(f"non existent node '{to}'")
+        key = (source, to) if source <= to else (to, source)
+        if key in self._edge_keys:
+            return
+        self._edge_keys.add(key)
+        self._edges.append(
+            {
+                **options,
+                "from": source,
+                "to": to,
+            }
+        )
+        return
+
+    def get_options(self) -> dict:
+        options = deepcopy(DEFAULT_OPTIONS)
+        if self._positions is not None:
+            options["physics"]["enabled"] = False
+            # 'dynamic' smoothing relies on the physics simulation
+            options["edges"]["smooth"] = {"enabled": False}
+            pass
+        return options
+
+    def iter_html(
+        self,
+        *,
+        options: dict | None = None,
+        script: str = "",
+    ) -> Iterator[str]:
+        """
+        'script' is extra javascript, run once the network has been drawn.
+        """
+        yield _HTML_HEAD % {"height": self.height, "width": self.width}
+        yield "                  nodes = new vis.DataSet(["
+        yield from _iter_joined(self._iter_node_json())
+        yield "]);\n"
+        yield "                  edges = new vis.DataSet(["
+        yield from _iter_joined(script_json(edge) for edge in self._edges)
+        yield "]);\n"
+        yield _HTML_TAIL % {
+            "options": script_json(options or self.get_options(), indent=4),
+            "script": script,
+        }
+        return
+
+    def iter_json(self) -> Iterator[str]:
+        """
+        The nodes (with any positions) and edges, as one JSON object.
+        """
+        yield '{"nodes": ['
+        yield from _iter_joined(self._iter_node_json())
+        yield '], "edges": ['
+        yield from _iter_joined(script_json(edge) for edge in self._edges)
+        yield "]}"
+        return
+
+    def _iter_node_json(self) -> Iterator[str]:
+        if self._positions is None:
+            for node in self._nodes:
+                yield script_json(node)
+                pass
+            return
+        for node, (x, y) in zip(self._nodes, self._positions.tolist()):
+            yield script_json({**node, "x": round(x, 1), "y": round(y, 1)})
+            pass
+        return
+
+    def render_html(self, *, options: dict | None = None, script: str = "") -> str:
+        return "".join(self.iter_html(options=options, script=script))
+
+    def write_html(
+        self,
+        f: TextIO,
+        *,
+        options: dict | None = None,
+        script: str = "",
+    ) -> None:
+        f.writelines(self.iter_html(options=options, script=script))
+        return
+
+    pass
+
+
+def make_node(
+    node_id: str,
+    *,
+    label: str | None = None,
+    shape: str = "dot",
+    color: str = DEFAULT_NODE_COLOR,
+    **options,
+) -> dict:
+    """
+    A vis.js node, as pyvis would define it.
+    """
+    return {
+        "color": color,
+        **options,
+        "id": node_id,
+        "label": label or node_id,
+        "shape": shape,
+    }
+
+
+def _iter_joined(items: Iterable[str]) -> Iterator[str]:
+    for i, item in enumerate(items):
+        if i:
+            yield ", "
+            pass
+        yield item
+        pass
+    return
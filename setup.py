@@ -19,11 +19,14 @@ setup(
         "numpy",
         "pandas",
         "pydantic",
-        "pyvis",
         "requests",
         "scikit-learn",
         "scipy",
     ],
+    extras_require={
+        # 'export --format parquet/arrow'
+        "arrow": ["pyarrow"],
+    },
     package_data={
         "": ["*.yaml"],
     },
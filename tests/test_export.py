@@ -0,0 +1,175 @@
+import json
+import os
+from pathlib import Path
+
+from minikg.build_output import BuildStepOutput_Package
+from minikg.models import Community, Group
+import networkx as nx
+import pytest
+
+from crushmycode.export import TABLE_COLUMNS, export_knowledge_graph
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.kgcache import get_package_path
+
+
+def _make_package() -> BuildStepOutput_Package:
+    G = nx.MultiGraph()
+    node_ids = [f"pkg/mod{i // 4}.py::fn_{i}" for i in range(12)]
+    for i, node_id in enumerate(node_ids):
+        G.add_node(
+            node_id,
+            entity_type="function",
+            description=f"Does thing {i} <&> ünïcode.",
+            defining_fragment=(
+                {
+                    "fragment_id": f"pkg/mod{i // 4}.py:{i}",
+                    "source_path": f"pkg/mod{i // 4}.py",
+                    "start_line_incl": i,
+                    "end_line_excl": i + 3,
+                }
+                if i % 5
+                else None
+            ),
+        )
+        pass
+    for i in range(len(node_ids) - 1):
+        G.add_edge(node_ids[i], node_ids[i + 1], description="calls")
+        pass
+    communities = {
+        "root": Community(id="root", child_community_ids=["a", "b"]),
+        "a": Community(id="a", child_community_ids=["a-1"], child_node_ids=node_ids[:2]),
+        "a-1": Community(id="a-1", child_node_ids=node_ids[2:6]),
+        "b": Community(id="b", child_node_ids=node_ids[6:10]),
+        # not reached from the roots
+        "orphan": Community(id="orphan", child_node_ids=node_ids[10:]),
+    }
+    summaries_by_id = {
+        community_id: {"name": f"Name {community_id}", "purpose": f"Purpose {community_id}"}
+        for community_id in ("root", "a", "b")
+    }
+    return BuildStepOutput_Package(
+        G=G,
+        communities=communities,
+        community_db_names=[],
+        community_hierarchy=[["root"], ["a", "b"], ["a-1"]],
+        summaries_by_id=summaries_by_id,
+        cluster_groups={
+            "root": Group(
+                group_id="root",
+                child_community_ids=["a", "b"],
+                child_group_ids=[],
+                summary=summaries_by_id["root"],
+            ),
+            "g-1-0": Group(
+                group_id="g-1-0",
+                child_community_ids=[],
+                child_group_ids=["root"],
+                summary={"name": "Everything"},
+            ),
+        },
+    )
+
+
+@pytest.fixture()
+def cache_dir(tmp_path: Path) -> Path:
+    cache_dir = tmp_path / "kgcache"
+    package_path = get_package_path(cache_dir)
+    os.makedirs(package_path.parent, exist_ok=True)
+    package_path.write_bytes(_make_package().to_bytes())
+    return cache_dir
+
+
+def _read_ndjson(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_export_ndjson_round_trip(cache_dir: Path, tmp_path: Path) -> None:
+    pkg = _make_package()
+    # small chunks, across more than one chunk per table
+    exported = export_knowledge_graph(
+        cache_dir=cache_dir, output_dir=tmp_path / "out", chunk_rows=3
+    )
+    assert [table.name for table in exported] == list(TABLE_COLUMNS)
+    manifest = json.loads((tmp_path / "out" / "export.json").read_text())
+
+    tables = {
+        table.name: _read_ndjson(tmp_path / "out" / table.path) for table in exported
+    }
+    for table in exported:
+        assert manifest["tables"][table.name]["rows"] == table.rows == len(tables[table.name])
+        pass
+
+    nodes = {row["id"]: row for row in tables["nodes"]}
+    assert list(nodes) == list(pkg.G.nodes)
+    for node_id, data in pkg.G.nodes(data=True):
+        fragment = data["defining_fragment"] or {}
+        assert nodes[node_id] == {
+            "id": node_id,
+            "entity_type": data["entity_type"],
+            "description": data["description"],
+            "fragment_id": fragment.get("fragment_id"),
+            "source_path": fragment.get("source_path"),
+            "start_line_incl": fragment.get("start_line_incl"),
+            "end_line_excl": fragment.get("end_line_excl"),
+        }
+        pass
+    assert [(row["source"], row["target"]) for row in tables["edges"]] == list(pkg.G.edges())
+
+    hierarchy = CommunityHierarchyIndex.build(pkg.communities, root_ids=["root"])
+    for row in tables["communities"]:
+        community = pkg.communities[row["id"]]
+        assert row["child_community_ids"] == community.child_community_ids
+        assert row["child_node_ids"] == community.child_node_ids
+        if row["id"] == "orphan":
+            assert row["parent_id"] is None and row["depth"] is None
+            continue
+        assert row["parent_id"] == hierarchy.get_parent_id(row["id"])
+        assert row["depth"] == hierarchy.get_depth(row["id"])
+        pass
+
+    assert tables["groups"] == [
+        {
+            "id": group.group_id,
+            "child_group_ids": group.child_group_ids,
+            "child_community_ids": group.child_community_ids,
+            "name": group.summary.get("name"),
+            "purpose": group.summary.get("purpose"),
+        }
+        for group in pkg.cluster_groups.values()
+    ]
+    assert tables["summaries"] == [
+        {"id": owner_id, **summary} for owner_id, summary in pkg.summaries_by_id.items()
+    ]
+
+    # the same rows whatever the chunk size, and from the snapshot written by the first export
+    export_knowledge_graph(cache_dir=cache_dir, output_dir=tmp_path / "out-1")
+    for table in exported:
+        assert _read_ndjson(tmp_path / "out-1" / table.path) == tables[table.name]
+        pass
+    return
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_export_pyarrow_round_trip(cache_dir: Path, tmp_path: Path, fmt: str) -> None:
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    export_knowledge_graph(cache_dir=cache_dir, output_dir=tmp_path / "ndjson")
+    exported = export_knowledge_graph(
+        cache_dir=cache_dir, output_dir=tmp_path / fmt, fmt=fmt, chunk_rows=3
+    )
+    for table in exported:
+        path = tmp_path / fmt / table.path
+        if fmt == "parquet":
+            read = pyarrow.parquet.read_table(path)
+            pass
+        else:
+            with pa.memory_map(str(path)) as source:
+                read = pyarrow.ipc.open_file(source).read_all()
+                pass
+            pass
+        assert read.column_names == [name for name, _ in TABLE_COLUMNS[table.name]]
+        assert read.to_pylist() == _read_ndjson(tmp_path / "ndjson" / f"{table.name}.ndjson")
+        pass
+    return
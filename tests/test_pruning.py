@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from minikg.models import Community, Group
+
+from crushmycode.hierarchy import CommunityHierarchyIndex
+from crushmycode.pruning import get_top_group_ids, select_graph
+
+
+N_ROOTS = 50
+LEAVES_PER_ROOT = 3
+NODES_PER_LEAF = 4
+
+
+def _make_communities() -> dict[str, Community]:
+    communities: dict[str, Community] = {}
+    for r in range(N_ROOTS):
+        leaf_ids = [f"leaf-{r}-{i}" for i in range(LEAVES_PER_ROOT)]
+        communities[f"root-{r}"] = Community(id=f"root-{r}", child_community_ids=leaf_ids)
+        for leaf_id in leaf_ids:
+            communities[leaf_id] = Community(
+                id=leaf_id,
+                child_node_ids=[f"{leaf_id}::node-{j}" for j in range(NODES_PER_LEAF)],
+            )
+            pass
+        pass
+    return communities
+
+
+def _make_round_0_groups(n_groups: int) -> dict[str, Group]:
+    """
+    Like minikg's first clustering round: groups of root communities.
+    """
+    return {
+        f"0-{g}": Group(
+            group_id=f"0-{g}",
+            child_community_ids=[f"root-{r}" for r in range(g, N_ROOTS, n_groups)],
+            child_group_ids=[],
+            summary={},
+        )
+        for g in range(n_groups)
+    }
+
+
+@pytest.mark.parametrize("n_groups", [0, 1, 5])
+@pytest.mark.parametrize("max_nodes", [5, 10, 40, 60, 200])
+def test_select_graph_many_roots_within_max_nodes(n_groups: int, max_nodes: int) -> None:
+    hierarchy = CommunityHierarchyIndex.build(_make_communities())
+    rng = np.random.default_rng(0)
+    selection = select_graph(
+        hierarchy,
+        community_scores=rng.random(len(hierarchy.community_ids)),
+        node_scores={node_id: 1.0 for node_id in hierarchy.node_ids},
+        include_nodes=True,
+        max_nodes=max_nodes,
+        top_group_ids=(
+            get_top_group_ids(hierarchy, _make_round_0_groups(n_groups)) if n_groups else None
+        ),
+    )
+    n_drawn = len(selection.community_ids) + len(selection.code_node_ids)
+    n_aggregates = len(selection.hidden_by_community) + len(selection.hidden_by_group)
+    assert n_drawn + n_aggregates <= max_nodes
+    # at most one '+N more' node per group for the roots left out
+    assert len(selection.hidden_by_group) <= max(n_groups, 1)
+    # the aggregates never crowd out every community, given room for one with its '+N more'
+    if max_nodes >= max(n_groups, 1) + 2:
+        assert len(selection.community_ids) >= 1
+        pass
+    hidden_roots = sum(selection.hidden_by_group.values())
+    drawn_roots = sum(len(ids) for ids in selection.top_community_ids_by_group.values())
+    assert hidden_roots + drawn_roots == N_ROOTS
+    return
+
+
+def test_get_top_group_ids_follows_ancestors() -> None:
+    hierarchy = CommunityHierarchyIndex.build(_make_communities())
+    top_group_ids = get_top_group_ids(hierarchy, _make_round_0_groups(5))
+    for i, community_id in enumerate(hierarchy.community_ids):
+        r = int(community_id.split("-")[1])
+        assert top_group_ids[i] == f"0-{r % 5}"
+        pass
+    return
@@ -0,0 +1,11 @@
+import json
+
+from crushmycode.vis_writer import script_json
+
+
+def test_script_json_cannot_close_the_script() -> None:
+    value = {"description": "</script><script>alert('&')</script>", "x": [1, "<!--"]}
+    encoded = script_json(value, indent=4)
+    assert not any(c in encoded for c in "<>&")
+    assert json.loads(encoded) == value
+    return